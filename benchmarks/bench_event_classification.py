@@ -0,0 +1,66 @@
+"""Measures the per-event cost of classifying C3 events (HA event type plus door/relay/aux state effects).
+
+Run with: python benchmarks/bench_event_classification.py [events]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from c3.consts import EventType as C3EventType, VerificationMode
+from core.event_processor import (
+    process_event,
+    map_zk_event_to_ha_type,
+    determine_door_state,
+    determine_lock_relay_state,
+    determine_aux_input_state,
+)
+from tests.mocks.c3 import MockC3
+
+def generate_events(count: int):
+    mock_c3 = MockC3("127.0.0.1", 4370)
+    event_types = [event_type for event_type in C3EventType if event_type != C3EventType.NA]
+    modes = list(VerificationMode)
+    return [
+        mock_c3.generate_event(
+            port_nr=(i % 4) + 1,
+            card_no=1000 + i,
+            event_type=event_types[i % len(event_types)],
+            verified=modes[i % len(modes)]
+        )
+        for i in range(count)
+    ]
+
+def best_of(runs: int, func) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    event_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    raw_events = generate_events(event_count)
+    processed_events = [process_event(raw_event) for raw_event in raw_events]
+
+    def classify():
+        for raw_event, processed_event in zip(raw_events, processed_events):
+            map_zk_event_to_ha_type(raw_event)
+            determine_door_state(processed_event)
+            determine_lock_relay_state(processed_event)
+            determine_aux_input_state(processed_event)
+
+    def process():
+        for raw_event in raw_events:
+            process_event(raw_event)
+
+    classify_time = best_of(5, classify)
+    process_time = best_of(5, process)
+    print(f"classification: {classify_time / event_count * 1e9:10.0f} ns/event")
+    print(f"process_event:  {process_time / event_count * 1e9:10.0f} ns/event")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measures the per-event cost of logging on the event pipeline at each log level.
+
+Runs the JobScheduler event path (processing, state update, publish) over a synthetic workload with
+the previous synchronous StreamHandler and with the queued pipeline from core.logging_setup, in text
+and JSON format, writing to os.devnull. The cost is reported relative to a run with logging disabled.
+Queued runs measure the cost left on the polling thread, formatting and I/O run on the listener thread.
+
+Run with: python benchmarks/bench_logging.py [--events N] [--batch-size N]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.workloads import FakeMQTTClient, generate_events, make_device_definition, split_batches
+from core.logging_setup import TEXT_FORMAT, configure_logging, stop_logging
+from core.state_manager import StateManager
+from mqtt.publisher import MQTTPublisher
+from scheduler.jobs import JobScheduler
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+def run(job_scheduler: JobScheduler, batches, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for batch in batches:
+            job_scheduler._process_events(batch)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    batches = split_batches(generate_events(args.events), args.batch_size)
+    devnull = open(os.devnull, "w")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        state_manager = StateManager(os.path.join(temp_dir, "state.json"), flush_interval=60, background_flush=False)
+        job_scheduler = JobScheduler(MQTTPublisher(FakeMQTTClient(), "BENCH0001"), state_manager)
+        job_scheduler.initialize_states(make_device_definition())
+
+        logging.disable(logging.CRITICAL)
+        run(job_scheduler, batches, 1)
+        disabled = run(job_scheduler, batches, args.rounds)
+        logging.disable(logging.NOTSET)
+        print(f"logging disabled: {disabled / args.events * 1e6:.2f} us/event")
+        print(f"{'level':<10}{'sync text':>14}{'queued text':>14}{'queued json':>14}   (us/event added by logging)")
+
+        for level in LEVELS:
+            reset_root()
+            handler = logging.StreamHandler(devnull)
+            handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+            logging.getLogger().addHandler(handler)
+            logging.getLogger().setLevel(level)
+            synchronous = run(job_scheduler, batches, args.rounds)
+
+            queued = {}
+            for log_format in ("text", "json"):
+                reset_root()
+                listener = configure_logging(level, log_format, stream=devnull, queue_size=0)
+                queued[log_format] = run(job_scheduler, batches, args.rounds)
+                stop_logging(listener, logging.getLogger().handlers[0])
+
+            print(f"{level:<10}"
+                  f"{(synchronous - disabled) / args.events * 1e6:>14.2f}"
+                  f"{(queued['text'] - disabled) / args.events * 1e6:>14.2f}"
+                  f"{(queued['json'] - disabled) / args.events * 1e6:>14.2f}")
+        reset_root()
+
+if __name__ == "__main__":
+    main()
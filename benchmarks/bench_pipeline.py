@@ -0,0 +1,200 @@
+"""Measures throughput, latency percentiles and allocations of the event pipeline, per stage and end to end.
+
+Stages: DedupIndex -> process_event -> get_related_entity_states -> process_events (batch) -> StateManager
+-> MQTTPublisher -> EventArchive, plus the whole JobScheduler path. Runs offline against synthetic events and a fake MQTT client.
+
+Run with: python benchmarks/bench_pipeline.py [--events N] [--mix realistic|burst|denied] [--doors N]
+          [--batch-size N] [--baseline PATH] [--save-baseline] [--threshold 0.2]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.workloads import MIXES, FakeMQTTClient, generate_events, make_device_definition, split_batches
+from core.dedup import DedupIndex, event_key, event_seconds
+from core.event_archive import EventArchive
+from core.event_processor import get_related_entity_states, process_event, process_events
+from core.models import EntityState
+from core.state_manager import StateManager
+from core.transaction_cursor import OccurrenceCounter
+from mqtt.publisher import MQTTPublisher
+from scheduler.jobs import JobScheduler
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def measure(units: List, run_unit: Callable, events_per_unit: List[int], rounds: int) -> dict:
+    """Times every unit of work (one event or one poll batch) over several rounds and traces one extra round."""
+    round_times = []
+    latencies = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for unit in units:
+            unit_started = time.perf_counter()
+            run_unit(unit)
+            latencies.append(time.perf_counter() - unit_started)
+        round_times.append(time.perf_counter() - started)
+
+    event_count = sum(events_per_unit)
+    transient_bytes = 0
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for unit in units:
+        # Peak above the memory in use before the unit: what one event or batch allocates at once
+        unit_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run_unit(unit)
+        transient_bytes += tracemalloc.get_traced_memory()[1] - unit_before
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "events_per_second": event_count / statistics.median(round_times),
+        "p50_us": percentile(latencies, 0.50) * 1e6,
+        "p95_us": percentile(latencies, 0.95) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "peak_bytes_per_unit": transient_bytes / max(1, len(units)),
+        "retained_bytes_per_event": (after - before) / max(1, event_count),
+    }
+
+def run_benchmarks(event_count: int, mix: str, doors: int, batch_size: int, rounds: int) -> Dict[str, dict]:
+    raw_events = generate_events(event_count, MIXES[mix], doors=doors, aux_inputs=doors)
+    raw_batches = split_batches(raw_events, batch_size)
+    processed_events = [process_event(raw_event) for raw_event in raw_events]
+    event_batches = [process_events(raw_batch) for raw_batch in raw_batches]
+    batch_sizes = [len(raw_batch) for raw_batch in raw_batches]
+
+    results = {}
+    # Every round after the first looks up keys that are already indexed, like replayed events
+    dedup_index = DedupIndex(3600)
+    positions = OccurrenceCounter()
+
+    def deduplicate(raw_batch):
+        for raw_event in raw_batch:
+            position = positions.position(raw_event)
+            if position is not None:
+                dedup_index.add("BENCH0001", event_key("BENCH0001", position), event_seconds(raw_event))
+
+    results["dedup"] = measure(raw_batches, deduplicate, batch_sizes, rounds)
+    results["process_event"] = measure(raw_events, process_event, [1] * len(raw_events), rounds)
+    results["entity_states"] = measure(processed_events, get_related_entity_states, [1] * len(processed_events), rounds)
+    results["process_events"] = measure(raw_batches, process_events, batch_sizes, rounds)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Write-behind without a flusher thread: measures the in-memory update, not disk latency
+        state_manager = StateManager(os.path.join(temp_dir, "state.json"), flush_interval=60, background_flush=False)
+        results["state_update"] = measure(
+            event_batches, lambda batch: state_manager.update_states(batch.entity_states), batch_sizes, rounds
+        )
+
+        publisher = MQTTPublisher(FakeMQTTClient(), "BENCH0001")
+
+        def publish(batch):
+            changed_states = [EntityState(entity_id=entity_id, state=state) for entity_id, state in batch.entity_states.items()]
+            publisher.publish_batch(changed_states, batch)
+
+        results["publish"] = measure(event_batches, publish, batch_sizes, rounds)
+
+        # One transaction per poll batch, on disk like in production
+        event_archive = EventArchive(os.path.join(temp_dir, "events.sqlite3"))
+        results["archive"] = measure(
+            event_batches, lambda batch: event_archive.add_events("BENCH0001", batch.processed_events), batch_sizes, rounds
+        )
+        event_archive.close()
+
+        fake_client = FakeMQTTClient()
+        job_state_manager = StateManager(os.path.join(temp_dir, "state_e2e.json"), flush_interval=60, background_flush=False)
+        job_scheduler = JobScheduler(MQTTPublisher(fake_client, "BENCH0001"), job_state_manager)
+        job_scheduler.initialize_states(make_device_definition(doors, doors))
+        fake_client.messages = fake_client.payload_bytes = 0
+
+        results["end_to_end"] = measure(raw_batches, job_scheduler._process_events, batch_sizes, rounds)
+        results["end_to_end"]["messages_per_event"] = fake_client.messages / (event_count * (rounds + 1))
+        results["end_to_end"]["payload_bytes_per_event"] = fake_client.payload_bytes / (event_count * (rounds + 1))
+    return results
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Returns a description of every stage whose throughput dropped more than threshold below the baseline."""
+    regressions = []
+    for stage, result in results.items():
+        expected = baseline.get(stage, {}).get("events_per_second")
+        if not expected:
+            continue
+        if result["events_per_second"] < expected * (1 - threshold):
+            regressions.append(
+                f"{stage}: {result['events_per_second']:,.0f} events/s is "
+                f"{1 - result['events_per_second'] / expected:.0%} below the baseline of {expected:,.0f}"
+            )
+    return regressions
+
+def print_results(results: Dict[str, dict], unit_names: Dict[str, str]):
+    print(f"{'stage':<16}{'events/s':>14}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}{'peak B/unit':>14}{'kept B/ev':>11}  unit")
+    for stage, result in results.items():
+        print(f"{stage:<16}{result['events_per_second']:>14,.0f}{result['p50_us']:>10.1f}{result['p95_us']:>10.1f}"
+              f"{result['p99_us']:>10.1f}{result['peak_bytes_per_unit']:>14,.0f}{result['retained_bytes_per_event']:>11.1f}"
+              f"  {unit_names[stage]}")
+    end_to_end = results["end_to_end"]
+    print(f"end_to_end publishes {end_to_end['messages_per_event']:.2f} message(s) "
+          f"and {end_to_end['payload_bytes_per_event']:.0f} payload bytes per event")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="realistic")
+    parser.add_argument("--doors", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=20, help="events per realtime log read")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed throughput drop before failing")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.events, args.mix, args.doors, args.batch_size, args.rounds)
+    unit_names = {stage: "event" for stage in ("process_event", "entity_states")}
+    unit_names.update({stage: f"batch of {args.batch_size}" for stage in results if stage not in unit_names})
+    print(f"{args.events} events, {args.mix} mix, {args.doors} door panel, median of {args.rounds} rounds")
+    print_results(results, unit_names)
+
+    # Results depend on the workload, so baselines are stored per workload profile
+    profile = f"{args.mix}/{args.doors}-doors/batch-{args.batch_size}"
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[profile] = results
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline for {profile} to {args.baseline}")
+        return
+
+    if profile not in baselines:
+        print(f"No baseline for {profile} in {args.baseline}, run with --save-baseline to create one")
+        return
+
+    regressions = compare(results, baselines[profile], args.threshold)
+    if regressions:
+        print(f"Throughput regressions against the {profile} baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No stage is more than {args.threshold:.0%} below the baseline")
+
+if __name__ == "__main__":
+    main()
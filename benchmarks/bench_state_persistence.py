@@ -0,0 +1,70 @@
+"""Counts state file writes/fsyncs per event for write-through vs write-behind persistence.
+
+Run with: python benchmarks/bench_state_persistence.py [events]
+"""
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from c3.consts import EventType as C3EventType
+from core.event_processor import process_event, get_related_entity_states
+from core.state_manager import StateManager
+from tests.mocks.c3 import MockC3
+
+EVENT_TYPES = [
+    C3EventType.NORMAL_PUNCH_OPEN,
+    C3EventType.DOOR_OPENED_CORRECT,
+    C3EventType.DOOR_CLOSED_CORRECT,
+    C3EventType.AUX_INPUT_SHORT,
+    C3EventType.AUX_INPUT_DISCONNECT,
+]
+
+def generate_events(count: int):
+    mock_c3 = MockC3("127.0.0.1", 4370)
+    return [
+        mock_c3.generate_event(port_nr=(i % 4) + 1, card_no=1000 + i, event_type=EVENT_TYPES[i % len(EVENT_TYPES)])
+        for i in range(count)
+    ]
+
+def run(flush_interval: float, raw_events) -> dict:
+    fsync_calls = 0
+    real_fsync = os.fsync
+
+    def counting_fsync(fd):
+        nonlocal fsync_calls
+        fsync_calls += 1
+        real_fsync(fd)
+
+    with tempfile.TemporaryDirectory() as directory, patch('os.fsync', counting_fsync):
+        state_manager = StateManager(os.path.join(directory, "state.json"), flush_interval)
+        started = time.perf_counter()
+        for raw_event in raw_events:
+            processed_event = process_event(raw_event)
+            state_manager.update_last_event(processed_event)
+            for state in get_related_entity_states(processed_event):
+                state_manager.update_state(state.entity_id, state.state)
+        elapsed = time.perf_counter() - started
+        state_manager.close()
+
+    return {
+        "fsyncs": fsync_calls,
+        "fsyncs_per_event": fsync_calls / len(raw_events),
+        "us_per_event": elapsed / len(raw_events) * 1e6,
+    }
+
+def main():
+    event_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    raw_events = generate_events(event_count)
+
+    print(f"{'mode':<24}{'fsyncs':>10}{'fsyncs/event':>16}{'us/event':>12}")
+    for name, flush_interval in [("write-through", 0), ("write-behind (5s)", 5)]:
+        result = run(flush_interval, raw_events)
+        print(f"{name:<24}{result['fsyncs']:>10}{result['fsyncs_per_event']:>16.3f}{result['us_per_event']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Measures the per-event cost of converting panel timestamps to the configured time zone.
+
+Compares the previous strptime + pytz.timezone() per event approach with core.timestamps.
+Run with: python benchmarks/bench_timestamps.py [events] [zone]
+"""
+import datetime
+import os
+import sys
+import time
+
+import pytz
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from core.timestamps import to_local_timestamp
+
+def legacy_to_local(value, zone_name: str) -> datetime.datetime:
+    timestamp_dt = datetime.datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.UTC)
+    return timestamp_dt.astimezone(pytz.timezone(zone_name))
+
+def best_of(runs: int, func) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    event_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    zone_name = sys.argv[2] if len(sys.argv) > 2 else "Europe/Vilnius"
+    start = datetime.datetime(2024, 10, 27, 0, 0, 0)
+    # A burst: ~10 events share each second
+    burst = [(start + datetime.timedelta(seconds=i // 10)).strftime("%Y-%m-%d %H:%M:%S") for i in range(event_count)]
+    # A backlog: every event has its own second
+    unique = [(start + datetime.timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S") for i in range(event_count)]
+
+    print(f"{'workload':<10}{'legacy ns/event':>18}{'fast ns/event':>16}")
+    for name, values in [("burst", burst), ("unique", unique)]:
+        legacy = best_of(5, lambda: [legacy_to_local(value, zone_name) for value in values])
+        fast = best_of(5, lambda: [to_local_timestamp(value, zone_name) for value in values])
+        print(f"{name:<10}{legacy / event_count * 1e9:>18.0f}{fast / event_count * 1e9:>16.0f}")
+
+if __name__ == "__main__":
+    main()
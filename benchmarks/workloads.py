@@ -0,0 +1,110 @@
+"""Synthetic C3 event workloads and a fake MQTT client for the offline benchmarks."""
+import datetime
+import os
+import random
+import sys
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import paho.mqtt.client as mqtt
+from c3.consts import EventType as C3EventType, VerificationMode, InOutDirection
+
+from core.models import DeviceDefinition
+from tests.mocks.c3 import MockEventRecord
+
+# (event type, verification mode, port kind) -> relative weight
+EventMix = Dict[Tuple[C3EventType, VerificationMode, str], float]
+
+REALISTIC_MIX: EventMix = {
+    (C3EventType.NORMAL_PUNCH_OPEN, VerificationMode.CARD, "door"): 40,
+    (C3EventType.DOOR_OPENED_CORRECT, VerificationMode.OTHER, "door"): 15,
+    (C3EventType.DOOR_CLOSED_CORRECT, VerificationMode.OTHER, "door"): 15,
+    (C3EventType.EXIT_BUTTON_OPEN, VerificationMode.OTHER, "door"): 5,
+    (C3EventType.PRESS_FINGER_OPEN, VerificationMode.FINGER, "door"): 4,
+    (C3EventType.ACCESS_DENIED, VerificationMode.CARD, "door"): 4,
+    (C3EventType.UNREGISTERED_CARD, VerificationMode.CARD, "door"): 4,
+    (C3EventType.PASSWORD_ERROR, VerificationMode.PASSWORD, "door"): 3,
+    (C3EventType.AUX_INPUT_SHORT, VerificationMode.OTHER, "aux"): 3,
+    (C3EventType.AUX_INPUT_DISCONNECT, VerificationMode.OTHER, "aux"): 3,
+    (C3EventType.REMOTE_OPENING, VerificationMode.OTHER, "door"): 2,
+    (C3EventType.LINKAGE_EVENT_TRIGGER, VerificationMode.OTHER, "door"): 2,
+}
+
+# Shift change: almost only granted scans followed by the door opening and closing
+BURST_MIX: EventMix = {
+    (C3EventType.NORMAL_PUNCH_OPEN, VerificationMode.CARD, "door"): 50,
+    (C3EventType.DOOR_OPENED_CORRECT, VerificationMode.OTHER, "door"): 25,
+    (C3EventType.DOOR_CLOSED_CORRECT, VerificationMode.OTHER, "door"): 25,
+}
+
+# Misconfigured reader or brute force attempts
+DENIED_MIX: EventMix = {
+    (C3EventType.ACCESS_DENIED, VerificationMode.CARD, "door"): 40,
+    (C3EventType.UNREGISTERED_CARD, VerificationMode.CARD, "door"): 30,
+    (C3EventType.PASSWORD_ERROR, VerificationMode.PASSWORD, "door"): 20,
+    (C3EventType.FP_EXPIRED, VerificationMode.FINGER, "door"): 10,
+}
+
+MIXES = {"realistic": REALISTIC_MIX, "burst": BURST_MIX, "denied": DENIED_MIX}
+
+def generate_events(
+    count: int,
+    mix: Optional[EventMix] = None,
+    doors: int = 4,
+    aux_inputs: int = 4,
+    cards: int = 500,
+    events_per_second: float = 5.0,
+    seed: int = 0
+) -> List[MockEventRecord]:
+    """Generates a reproducible event stream with timestamps advancing like a busy panel."""
+    rng = random.Random(seed)
+    mix = mix or REALISTIC_MIX
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    timestamp = datetime.datetime(2024, 3, 1, 8, 0, 0)
+
+    events = []
+    for event_type, verified, port_kind in rng.choices(kinds, weights=weights, k=count):
+        event = MockEventRecord(
+            port_nr=rng.randint(1, aux_inputs if port_kind == "aux" else doors),
+            card_no=1000 + rng.randrange(cards) if verified == VerificationMode.CARD else 0,
+            event_type=event_type,
+            verified=verified,
+            in_out_state=rng.choice((InOutDirection.ENTRY, InOutDirection.EXIT))
+        )
+        timestamp += datetime.timedelta(seconds=rng.expovariate(events_per_second))
+        event.time_second = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        events.append(event)
+    return events
+
+def split_batches(events: List[MockEventRecord], batch_size: int) -> List[List[MockEventRecord]]:
+    return [events[i:i + batch_size] for i in range(0, len(events), batch_size)]
+
+def make_device_definition(doors: int = 4, aux_inputs: int = 4, serial_number: str = "BENCH0001") -> DeviceDefinition:
+    return DeviceDefinition(
+        parameters={"serial_number": serial_number},
+        doors=[{"number": n} for n in range(1, doors + 1)],
+        readers=[{"number": n} for n in range(1, doors + 1)],
+        relays=[{"number": n} for n in range(1, doors + 1)],
+        aux_inputs=[{"number": n} for n in range(1, aux_inputs + 1)]
+    )
+
+class FakeMQTTClient:
+    """Accepts every publish without network I/O and counts messages and payload bytes."""
+
+    def __init__(self):
+        self.messages = 0
+        self.payload_bytes = 0
+        self._result = mqtt.MQTTMessageInfo(0)
+        self._result.rc = mqtt.MQTT_ERR_SUCCESS
+
+    def is_connected(self) -> bool:
+        return True
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.messages += 1
+        if payload is not None:
+            self.payload_bytes += len(payload)
+        return self._result
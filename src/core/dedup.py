@@ -0,0 +1,159 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Deque, Dict, Optional
+
+from core.timestamps import parse_timestamp
+from core.transaction_cursor import EventPosition
+from core.utils import write_json_atomic
+
+log = logging.getLogger(__name__)
+
+BUCKET_COUNT = 60
+
+def event_key(serial_number: str, position: EventPosition) -> int:
+    """Stable 64 bit key of a panel event: device and its position, including the occurrence within its second."""
+    text = f"{serial_number}|{position.time}|{position.fingerprint}|{position.occurrence}"
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+@lru_cache(maxsize=256)
+def _seconds(value: str) -> Optional[float]:
+    parsed = parse_timestamp(value)
+    # Panel time is naive, it is read as UTC only to place the event in a bucket
+    return parsed.replace(tzinfo=datetime.timezone.utc).timestamp() if parsed is not None else None
+
+def event_seconds(event) -> Optional[float]:
+    value = getattr(event, "time_second", None)
+    if not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+    return _seconds(str(value))
+
+class DedupIndex:
+    """Keys of the events processed within the horizon, in time buckets that expire as a whole.
+
+    A lookup is a single dict lookup, the buckets only decide what expires. Each panel has its own
+    buckets: the ones older than the horizon, counted back from the newest event of that panel, are
+    dropped as a whole, so a panel with a clock ahead does not expire the keys of the others. Beyond
+    max_events keys the oldest keys are evicted one by one, so memory stays bounded under any load.
+    """
+
+    def __init__(self, horizon_seconds: float, max_events: int = 100000, path: Optional[str] = None):
+        self.horizon_seconds = horizon_seconds
+        self.bucket_seconds = max(1.0, horizon_seconds / BUCKET_COUNT)
+        self.max_events = max(1, max_events)
+        self.path = path
+        self.duplicates = 0
+        self._keys: Dict[int, int] = {}
+        # Per serial number, oldest bucket first
+        self._buckets: Dict[str, "OrderedDict[int, Deque[int]]"] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, serial_number: str, key: int, seconds: float) -> bool:
+        """Records the key of a panel's event, returns False if it is already in the index."""
+        bucket = int(seconds // self.bucket_seconds)
+        with self._lock:
+            buckets = self._buckets.get(serial_number)
+            if buckets is None:
+                buckets = self._buckets[serial_number] = OrderedDict()
+            newest_bucket = next(reversed(buckets)) if buckets else None
+            if newest_bucket is not None and bucket <= newest_bucket - BUCKET_COUNT:
+                # Older than the horizon, nothing left to compare it with
+                return True
+            if key in self._keys:
+                self.duplicates += 1
+                return False
+
+            keys = buckets.get(bucket)
+            if keys is None:
+                keys = buckets[bucket] = deque()
+                if newest_bucket is None or bucket > newest_bucket:
+                    self._expire(buckets)
+                else:
+                    # A late bucket, keep them ordered oldest first
+                    buckets = self._buckets[serial_number] = OrderedDict(sorted(buckets.items()))
+            keys.append(key)
+            self._keys[key] = bucket
+            self._dirty = True
+            while len(self._keys) > self.max_events:
+                self._evict_oldest_key()
+            return True
+
+    def _expire(self, buckets: "OrderedDict[int, Deque[int]]"):
+        oldest_kept = next(reversed(buckets)) - BUCKET_COUNT + 1
+        while buckets and next(iter(buckets)) < oldest_kept:
+            bucket, keys = buckets.popitem(last=False)
+            for key in keys:
+                if self._keys.get(key) == bucket:
+                    del self._keys[key]
+
+    def _evict_oldest_key(self):
+        serial_number, buckets = min(
+            ((serial_number, buckets) for serial_number, buckets in self._buckets.items() if buckets),
+            key=lambda item: next(iter(item[1]))
+        )
+        bucket, keys = next(iter(buckets.items()))
+        key = keys.popleft()
+        if self._keys.get(key) == bucket:
+            del self._keys[key]
+        if not keys:
+            del buckets[bucket]
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("bucket_seconds") != self.bucket_seconds:
+                log.info("Deduplication horizon changed, starting with an empty index")
+                return
+            devices = {
+                str(serial_number): OrderedDict(sorted(
+                    (int(bucket), deque(int(key) for key in keys)) for bucket, keys in buckets.items()
+                ))
+                for serial_number, buckets in data.get("devices", {}).items()
+            }
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            log.error(f"Error loading deduplication index from {self.path}, starting empty: {e}")
+            return
+        with self._lock:
+            self._buckets = {serial_number: buckets for serial_number, buckets in devices.items() if buckets}
+            self._keys = {
+                key: bucket for buckets in self._buckets.values() for bucket, keys in buckets.items() for key in keys
+            }
+            for buckets in self._buckets.values():
+                self._expire(buckets)
+            while len(self._keys) > self.max_events:
+                self._evict_oldest_key()
+        log.info(f"Loaded {len(self._keys)} deduplication key(s) from {self.path}")
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            data = {
+                "bucket_seconds": self.bucket_seconds,
+                "devices": {
+                    serial_number: {str(bucket): list(keys) for bucket, keys in buckets.items()}
+                    for serial_number, buckets in self._buckets.items()
+                }
+            }
+            self._dirty = False
+        try:
+            write_json_atomic(self.path, data, prefix=".dedup-")
+        except OSError as e:
+            self._dirty = True
+            log.error(f"Error saving deduplication index to {self.path}: {e}")
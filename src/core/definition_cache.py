@@ -0,0 +1,55 @@
+import json
+import logging
+import threading
+from typing import Dict, Optional
+
+from core.models import DeviceDefinition
+from core.utils import write_json_atomic
+
+log = logging.getLogger(__name__)
+
+class DefinitionCache:
+    """Keeps the last device definition each panel reported, by address, so the bridge can start without it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._definitions: Dict[str, dict] = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self._definitions = {address: dict(definition) for address, definition in data.get("devices", {}).items()}
+            log.info(f"Loaded cached definitions of {len(self._definitions)} device(s) from {self.path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            log.error(f"Error loading device definition cache, devices will be queried on startup: {e}")
+            self._definitions = {}
+
+    def get(self, address: str) -> Optional[DeviceDefinition]:
+        with self._lock:
+            data = self._definitions.get(address)
+        if data is None:
+            return None
+        try:
+            return DeviceDefinition.from_dict(data)
+        except (KeyError, TypeError, AttributeError) as e:
+            log.error(f"Ignoring invalid cached definition of {address}: {e}")
+            return None
+
+    def put(self, address: str, definition: DeviceDefinition) -> bool:
+        """Stores the definition, returns True if it differs from the cached one."""
+        data = definition.to_dict()
+        with self._lock:
+            if self._definitions.get(address) == data:
+                return False
+            self._definitions[address] = data
+            snapshot = {"devices": dict(self._definitions)}
+        try:
+            write_json_atomic(self.path, snapshot, prefix=".definitions-", indent=2)
+        except OSError as e:
+            log.error(f"Error saving device definition cache to {self.path}: {e}")
+        return True
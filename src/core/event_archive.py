@@ -0,0 +1,164 @@
+import csv
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import IO, Iterator, List, Optional, Sequence
+
+from core.models import ProcessedEvent
+
+log = logging.getLogger(__name__)
+
+COLUMNS = (
+    "device", "timestamp", "door", "reader", "event_type", "card", "pin",
+    "event_code", "event_desc", "verify_mode", "entry_exit"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    ts REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    door INTEGER,
+    reader INTEGER,
+    event_type TEXT,
+    card TEXT,
+    pin TEXT,
+    event_code INTEGER,
+    event_desc TEXT,
+    verify_mode TEXT,
+    entry_exit TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_door_ts ON events (door, ts);
+CREATE INDEX IF NOT EXISTS events_card_ts ON events (card, ts);
+"""
+
+INSERT = f"INSERT INTO events (ts, {', '.join(COLUMNS)}) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})"
+
+EXPORT_FETCH_SIZE = 1000
+
+class EventArchive:
+    """Keeps every processed event in an SQLite database in WAL mode, for audits and exports.
+
+    Each poll's events are inserted in one transaction. Exports open their own read-only connection
+    and stream rows, so they neither block polling nor load a time range into memory.
+    """
+
+    def __init__(self, path: str, retention_days: float = 0):
+        self.path = path
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Must be set before the first table exists, lets prune hand freed pages back to the file system
+        self._connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        # With WAL, NORMAL only risks the last transactions on power loss, never corruption
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def add_events(self, device: str, events: Sequence[ProcessedEvent]) -> int:
+        rows = [
+            (
+                event.timestamp.timestamp(), device, event.timestamp.isoformat(), event.door_id, event.reader_id,
+                event.event_type.value, event.card_id, event.pin, event.zk_event_code, event.zk_event_desc,
+                event.verify_mode, event.entry_exit
+            )
+            for event in events
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            try:
+                self._connection.execute("BEGIN")
+                self._connection.executemany(INSERT, rows)
+                self._connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._connection.in_transaction:
+                    self._connection.execute("ROLLBACK")
+                log.error(f"Error archiving {len(rows)} event(s): {e}")
+                return 0
+        return len(rows)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Deletes events older than the retention period and compacts the database file."""
+        if self.retention_days <= 0:
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.retention_days * 86400
+        with self._lock:
+            try:
+                deleted = self._connection.execute("DELETE FROM events WHERE ts < ?", (cutoff,)).rowcount
+                if deleted:
+                    self._connection.execute("PRAGMA incremental_vacuum")
+                    self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                log.error(f"Error pruning the event archive: {e}")
+                return 0
+        if deleted:
+            log.info(f"Pruned {deleted} archived event(s) older than {self.retention_days:g} days")
+        return deleted
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            try:
+                self._connection.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            self._connection.close()
+
+def iter_events(
+    path: str,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    device: Optional[str] = None,
+    door: Optional[int] = None,
+    card: Optional[str] = None
+) -> Iterator[tuple]:
+    """Yields archived events in time order as tuples of COLUMNS, fetching them in chunks."""
+    conditions: List[str] = []
+    parameters: list = []
+    if start is not None:
+        conditions.append("ts >= ?")
+        parameters.append(start.timestamp())
+    if end is not None:
+        conditions.append("ts < ?")
+        parameters.append(end.timestamp())
+    for column, value in (("device", device), ("door", door), ("card", card)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cursor = connection.execute(f"SELECT {', '.join(COLUMNS)} FROM events{where} ORDER BY ts, id", parameters)
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        connection.close()
+
+def export_events(rows: Iterator[tuple], output: IO[str], export_format: str = "ndjson") -> int:
+    count = 0
+    if export_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+
+    for row in rows:
+        output.write(json.dumps({key: value for key, value in zip(COLUMNS, row) if value is not None}))
+        output.write("\n")
+        count += 1
+    return count
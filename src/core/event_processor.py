@@ -1,7 +1,5 @@
 import logging
-import datetime
-import pytz
-from typing import Optional, List
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import json
 from c3.consts import EventType as C3EventType, VerificationMode
 
@@ -9,90 +7,191 @@ class RelayGroup:
     lock = "lock"
     aux = "aux"
 
-import settings
-from core.models import ProcessedEvent, EventType, EntityState
+from core.timestamps import to_local_timestamp
+from core.models import ProcessedEvent, EventType, EntityState, EventBatch
 
 log = logging.getLogger(__name__)
 
-def map_zk_event_to_ha_type(event) -> EventType:
-    event_type = event.event_type
-    verification = event.verified
-    
-    # Log the enum values for debugging
-    log.debug(f"Event mapping: type={event_type.name}, code={event_type.value}, desc={event_type.description}, verification={verification}")
-    
-    # Check for invalid event type
+# Event classification rules. They are compiled once at import into EVENT_CLASSIFICATIONS,
+# so classifying an event at runtime is a single dict lookup.
+DOOR_OPEN_EVENTS = frozenset([
+    C3EventType.NORMAL_PUNCH_OPEN,
+    C3EventType.OPEN_NORMAL_OPEN_TZ,
+    C3EventType.OPENING_TIMEOUT,
+    C3EventType.DOOR_OPENED_CORRECT,
+    C3EventType.EXIT_BUTTON_OPEN,
+    C3EventType.REMOTE_NORMAL_OPEN,
+    C3EventType.MULTI_CARD_AUTH,
+    C3EventType.FAILED_CLOSE_NORMAL_OPEN_TZ
+])
+
+DOOR_CLOSE_EVENTS = frozenset([
+    C3EventType.DOOR_CLOSED_CORRECT
+])
+
+CARD_DENIED_EVENTS = frozenset([
+    C3EventType.TOO_SHORT_PUNCH_INTERVAL,
+    C3EventType.DOOR_INACTIVE_TZ,
+    C3EventType.ILLEGAL_TZ,
+    C3EventType.ACCESS_DENIED,
+    C3EventType.ANTI_PASSBACK,
+    C3EventType.INTERLOCK,
+    C3EventType.CARD_EXPIRED
+])
+
+PIN_DENIED_EVENTS = frozenset([C3EventType.PASSWORD_ERROR, C3EventType.DURESS_PASSWORD_OPEN])
+
+FINGERPRINT_DENIED_EVENTS = frozenset([C3EventType.FP_EXPIRED, C3EventType.DURESS_FP_OPEN])
+
+LOCK_RELAY_ON_EVENTS = frozenset([
+    C3EventType.NORMAL_PUNCH_OPEN,
+    C3EventType.PUNCH_NORMAL_OPEN_TZ,
+    C3EventType.FIRST_CARD_NORMAL_OPEN,
+    C3EventType.MULTI_CARD_OPEN,
+    C3EventType.EMERGENCY_PASS_OPEN,
+    C3EventType.OPEN_NORMAL_OPEN_TZ,
+    C3EventType.REMOTE_OPENING,
+    C3EventType.PRESS_FINGER_OPEN,
+    C3EventType.MULTI_CARD_OPEN_FP,
+    C3EventType.FP_NORMAL_OPEN_TZ,
+    C3EventType.CARD_FP_OPEN,
+    C3EventType.FIRST_CARD_NORMAL_OPEN_FP,
+    C3EventType.FIRST_CARD_NORMAL_OPEN_CARD_FP,
+    C3EventType.DURESS_PASSWORD_OPEN,
+    C3EventType.DURESS_FP_OPEN,
+    C3EventType.DOOR_OPENED_CORRECT,
+    C3EventType.EXIT_BUTTON_OPEN,
+    C3EventType.MULTI_CARD_OPEN_CARD_FP,
+    C3EventType.REMOTE_NORMAL_OPEN
+])
+
+LOCK_RELAY_OFF_EVENTS = frozenset([
+    C3EventType.REMOTE_CLOSING,
+    C3EventType.DOOR_CLOSED_CORRECT,
+    C3EventType.NORMAL_OPEN_TZ_OVER
+])
+
+OTHER_SUCCESS_VERIFICATIONS = frozenset([
+    VerificationMode.CARD_OR_FINGER,
+    VerificationMode.CARD_WITH_FINGER,
+    VerificationMode.CARD_WITH_PASSWORD
+])
+
+class EventClassification(NamedTuple):
+    ha_event_type: EventType
+    door_state: Optional[str]
+    lock_relay_state: Optional[str]
+    aux_input_state: Optional[str]
+    zk_event_desc: str
+    verify_mode: str
+
+def _classify_ha_type(event_type, verification) -> EventType:
     if event_type == C3EventType.NA:
-        log.warning(f"Event has NA event type: {event}")
         return EventType.OTHER
 
     # Door opening events
-    if event_type in [
-        C3EventType.NORMAL_PUNCH_OPEN, 
-        C3EventType.OPEN_NORMAL_OPEN_TZ, 
-        C3EventType.OPENING_TIMEOUT, 
-        C3EventType.DOOR_OPENED_CORRECT, 
-        C3EventType.EXIT_BUTTON_OPEN, 
-        C3EventType.REMOTE_NORMAL_OPEN, 
-        C3EventType.MULTI_CARD_AUTH, 
-        C3EventType.FAILED_CLOSE_NORMAL_OPEN_TZ
-    ]:
+    if event_type in DOOR_OPEN_EVENTS:
         return EventType.DOOR_OPEN
-    
-    elif event_type == C3EventType.DOOR_CLOSED_CORRECT:
+    elif event_type in DOOR_CLOSE_EVENTS:
         return EventType.DOOR_CLOSE
-    
-    elif event_type == C3EventType.EXIT_BUTTON_OPEN:
-        return EventType.DOOR_BUTTON
-    
+
     elif event_type == C3EventType.AUX_INPUT_DISCONNECT:
         return EventType.AUX_INPUT_DISCONNECTED
     elif event_type == C3EventType.AUX_INPUT_SHORT:
         return EventType.AUX_INPUT_CONNECTED
-    
-    elif event_type in [C3EventType.NORMAL_PUNCH_OPEN, C3EventType.PUNCH_NORMAL_OPEN_TZ] and verification == VerificationMode.CARD:
+
+    elif event_type == C3EventType.PUNCH_NORMAL_OPEN_TZ and verification == VerificationMode.CARD:
         return EventType.CARD_SCAN_SUCCESS
-    elif event_type in [
-        C3EventType.TOO_SHORT_PUNCH_INTERVAL, 
-        C3EventType.DOOR_INACTIVE_TZ, 
-        C3EventType.ILLEGAL_TZ, 
-        C3EventType.ACCESS_DENIED, 
-        C3EventType.ANTI_PASSBACK, 
-        C3EventType.INTERLOCK, 
-        C3EventType.CARD_EXPIRED
-    ]:
+    elif event_type in CARD_DENIED_EVENTS:
         return EventType.CARD_SCAN_DENIED
     elif event_type == C3EventType.UNREGISTERED_CARD:
         return EventType.CARD_SCAN_INVALID
-    
-    elif event_type in [C3EventType.PASSWORD_ERROR, C3EventType.DURESS_PASSWORD_OPEN]:
+
+    elif event_type in PIN_DENIED_EVENTS:
         return EventType.PIN_DENIED
-    
-    elif event_type in [C3EventType.FP_EXPIRED, C3EventType.DURESS_FP_OPEN]:
+
+    elif event_type in FINGERPRINT_DENIED_EVENTS:
         return EventType.FINGERPRINT_DENIED
     elif event_type == C3EventType.UNREGISTERED_FP:
         return EventType.FINGERPRINT_INVALID
-    
+
     elif verification == VerificationMode.CARD:
         return EventType.CARD_SCAN_SUCCESS
     elif verification == VerificationMode.PASSWORD:
         return EventType.PIN_SUCCESS
     elif verification == VerificationMode.FINGER:
         return EventType.FINGERPRINT_SUCCESS
-    elif verification in [VerificationMode.CARD_OR_FINGER, VerificationMode.CARD_WITH_FINGER, VerificationMode.CARD_WITH_PASSWORD]:
+    elif verification in OTHER_SUCCESS_VERIFICATIONS:
         return EventType.OTHER_SUCCESS
 
     return EventType.OTHER
 
+def _state_effects(event_code) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    door_state = "ON" if event_code in DOOR_OPEN_EVENTS else "OFF" if event_code in DOOR_CLOSE_EVENTS else None
+
+    if event_code in LOCK_RELAY_ON_EVENTS:
+        lock_relay_state = "ON"
+    elif event_code in LOCK_RELAY_OFF_EVENTS:
+        lock_relay_state = "OFF"
+    else:
+        lock_relay_state = None
+
+    if event_code == C3EventType.AUX_INPUT_SHORT:
+        aux_input_state = "ON"
+    elif event_code == C3EventType.AUX_INPUT_DISCONNECT:
+        aux_input_state = "OFF"
+    else:
+        aux_input_state = None
+
+    return door_state, lock_relay_state, aux_input_state
+
+def _build_classification(event_type, verification) -> EventClassification:
+    return EventClassification(
+        _classify_ha_type(event_type, verification),
+        *_state_effects(event_type),
+        event_type.description,
+        str(verification)
+    )
+
+# Keyed by plain ints: C3 event types and verification modes are IntEnums, so a lookup
+# with the enum members of a raw event hits the same entries.
+EVENT_CLASSIFICATIONS: Dict[Tuple[int, int], EventClassification] = {
+    (event_type.value, verification.value): _build_classification(event_type, verification)
+    for event_type in C3EventType
+    for verification in VerificationMode
+}
+
+EVENT_STATE_EFFECTS: Dict[int, Tuple[Optional[str], Optional[str], Optional[str]]] = {
+    event_type.value: _state_effects(event_type) for event_type in C3EventType
+}
+
+NO_STATE_EFFECTS: Tuple[Optional[str], Optional[str], Optional[str]] = (None, None, None)
+
+def classify_event(event_type, verification) -> EventClassification:
+    classification = EVENT_CLASSIFICATIONS.get((event_type, verification))
+    if classification is None:
+        classification = _build_classification(event_type, verification)
+    return classification
+
+def map_zk_event_to_ha_type(event) -> EventType:
+    event_type = event.event_type
+
+    if event_type == C3EventType.NA:
+        log.warning(f"Event has NA event type: {event}")
+        return EventType.OTHER
+
+    classification = classify_event(event_type, event.verified)
+    log.debug("Event mapping: code=%s, verification=%s -> %s", event_type.value, event.verified, classification.ha_event_type)
+    return classification.ha_event_type
+
 def process_event(event) -> Optional[ProcessedEvent]:
-    log.debug(f"Processing event: {event}")
+    log.debug("Processing event: %s", event)
 
     if not hasattr(event, 'port_nr'):
         log.warning(f"Event missing required attribute 'port_nr': {event}")
         return None
     
     door_id_val = event.port_nr
-    log.debug(f"Door port number: {door_id_val}")
     
     try: 
         entity_num_id = int(door_id_val)
@@ -100,33 +199,21 @@ def process_event(event) -> Optional[ProcessedEvent]:
         log.warning(f"Could not parse door ID '{door_id_val}' from event: {event}")
         return None
 
-    timestamp_str = str(event.time_second)
-    try:
-        timestamp_dt = datetime.datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-        log.debug(f"Parsed timestamp: {timestamp_dt}")
-    except Exception as e:
-        log.warning(f"Failed to parse time_second '{timestamp_str}': {e}")
-        timestamp_dt = datetime.datetime.now()
-    
-    if timestamp_dt.tzinfo is None:
-        timestamp_dt = timestamp_dt.replace(tzinfo=pytz.UTC)
-    try:
-        local_tz = pytz.timezone(settings.TIME_ZONE)
-        local_dt = timestamp_dt.astimezone(local_tz)
-    except Exception as e:
-        log.warning(f"Failed to convert timestamp to timezone {settings.TIME_ZONE}: {e}")
-        local_dt = timestamp_dt
+    local_dt = to_local_timestamp(event.time_second)
 
     card_id = event.card_no
     pin = event.pin
-    verify_mode_name = str(event.verified)
     entry_exit_name = str(event.in_out_state)
     zk_event_code = event.event_type.value
-    zk_event_desc = event.event_type.description
-    
-    log.debug(f"Extracted event data: card={card_id}, verify={verify_mode_name}, entry/exit={entry_exit_name}, code={zk_event_code}")
 
-    event_type = map_zk_event_to_ha_type(event)
+    if event.event_type == C3EventType.NA:
+        log.warning(f"Event has NA event type: {event}")
+    classification = classify_event(event.event_type, event.verified)
+    event_type = classification.ha_event_type
+    verify_mode_name = classification.verify_mode
+    zk_event_desc = classification.zk_event_desc
+
+    log.debug("Extracted event data: card=%s, verify=%s, entry/exit=%s, code=%s", card_id, verify_mode_name, entry_exit_name, zk_event_code)
     
     normalized_card_id = None if card_id is None or str(card_id) == '0' else str(card_id)
     normalized_pin = None if pin is None or str(pin) == '0' else str(pin)
@@ -146,83 +233,30 @@ def process_event(event) -> Optional[ProcessedEvent]:
     )
 
 def determine_door_state(event: ProcessedEvent) -> Optional[str]:
-    door_open_events = [
-        C3EventType.NORMAL_PUNCH_OPEN.value, 
-        C3EventType.OPEN_NORMAL_OPEN_TZ.value, 
-        C3EventType.OPENING_TIMEOUT.value, 
-        C3EventType.DOOR_OPENED_CORRECT.value, 
-        C3EventType.EXIT_BUTTON_OPEN.value, 
-        C3EventType.REMOTE_NORMAL_OPEN.value, 
-        C3EventType.MULTI_CARD_AUTH.value, 
-        C3EventType.FAILED_CLOSE_NORMAL_OPEN_TZ.value
-    ]
-    
-    if event.zk_event_code in door_open_events:
-        return "ON"
-    elif event.zk_event_code == C3EventType.DOOR_CLOSED_CORRECT.value:
-        return "OFF"
-    return None
+    return EVENT_STATE_EFFECTS.get(event.zk_event_code, NO_STATE_EFFECTS)[0]
 
 def determine_lock_relay_state(event: ProcessedEvent) -> Optional[str]:
-    lock_relay_on_events = [
-        C3EventType.NORMAL_PUNCH_OPEN.value,
-        C3EventType.PUNCH_NORMAL_OPEN_TZ.value,
-        C3EventType.FIRST_CARD_NORMAL_OPEN.value,
-        C3EventType.MULTI_CARD_OPEN.value,
-        C3EventType.EMERGENCY_PASS_OPEN.value,
-        C3EventType.OPEN_NORMAL_OPEN_TZ.value,
-        C3EventType.REMOTE_OPENING.value,
-        C3EventType.PRESS_FINGER_OPEN.value,
-        C3EventType.MULTI_CARD_OPEN_FP.value,
-        C3EventType.FP_NORMAL_OPEN_TZ.value,
-        C3EventType.CARD_FP_OPEN.value,
-        C3EventType.FIRST_CARD_NORMAL_OPEN_FP.value,
-        C3EventType.FIRST_CARD_NORMAL_OPEN_CARD_FP.value,
-        C3EventType.DURESS_PASSWORD_OPEN.value,
-        C3EventType.DURESS_FP_OPEN.value,
-        C3EventType.DOOR_OPENED_CORRECT.value,
-        C3EventType.EXIT_BUTTON_OPEN.value,
-        C3EventType.MULTI_CARD_OPEN_CARD_FP.value,
-        C3EventType.REMOTE_NORMAL_OPEN.value
-    ]
-    
-    lock_relay_off_events = [
-        C3EventType.REMOTE_CLOSING.value,
-        C3EventType.DOOR_CLOSED_CORRECT.value,
-        C3EventType.NORMAL_OPEN_TZ_OVER.value
-    ]
-    
-    if event.zk_event_code in lock_relay_on_events:
-        return "ON"
-    elif event.zk_event_code in lock_relay_off_events:
-        return "OFF"
-    return None
+    return EVENT_STATE_EFFECTS.get(event.zk_event_code, NO_STATE_EFFECTS)[1]
 
 def determine_aux_input_state(event: ProcessedEvent) -> Optional[str]:
-    if event.zk_event_code == C3EventType.AUX_INPUT_SHORT.value:
-        return "ON"
-    elif event.zk_event_code == C3EventType.AUX_INPUT_DISCONNECT.value:
-        return "OFF"
-    return None
+    return EVENT_STATE_EFFECTS.get(event.zk_event_code, NO_STATE_EFFECTS)[2]
 
 def get_related_entity_states(event: ProcessedEvent) -> List[EntityState]:
     states = []
     
-    door_state = determine_door_state(event)
+    door_state, lock_relay_state, aux_input_state = EVENT_STATE_EFFECTS.get(event.zk_event_code, NO_STATE_EFFECTS)
     if door_state is not None:
         states.append(EntityState(
             entity_id=f"door_{event.door_id}",
             state=door_state
         ))
     
-    lock_relay_state = determine_lock_relay_state(event)
     if lock_relay_state is not None:
         states.append(EntityState(
             entity_id=f"relay_{RelayGroup.lock}_{event.door_id}",
             state=lock_relay_state
         ))
     
-    aux_input_state = determine_aux_input_state(event)
     if aux_input_state is not None:
         states.append(EntityState(
             entity_id=f"aux_input_{event.door_id}",
@@ -260,7 +294,31 @@ def get_related_entity_states(event: ProcessedEvent) -> List[EntityState]:
         
         states.append(EntityState(
             entity_id=f"reader_{event.reader_id}_scan",
-            state=payload_json
+            state=payload_json,
+            is_event=True
         ))
     
     return states
+
+def process_events(raw_events) -> EventBatch:
+    batch = EventBatch()
+
+    for raw_event in raw_events:
+        try:
+            processed_event = process_event(raw_event)
+            if not processed_event:
+                log.warning(f"Failed to process event: {raw_event}")
+                continue
+
+            batch.processed_events.append(processed_event)
+            for state in get_related_entity_states(processed_event):
+                if state.is_event:
+                    batch.event_states.append(state)
+                else:
+                    # Re-insert so the collapsed states keep the order of their last change
+                    batch.entity_states.pop(state.entity_id, None)
+                    batch.entity_states[state.entity_id] = state.state
+        except Exception as e:
+            log.exception(f"Error processing event: {e}")
+
+    return batch
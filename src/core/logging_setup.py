@@ -0,0 +1,114 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+log = logging.getLogger(__name__)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecord attributes, anything else on a record was passed through `extra` and goes into the JSON line
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+def parse_module_levels(value: str) -> Dict[str, int]:
+    """Parses comma separated logger=LEVEL pairs, e.g. "mqtt=DEBUG,zkt.handler=WARNING"."""
+    levels = {}
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, level_name = entry.partition("=")
+        level = logging.getLevelName(level_name.strip().upper())
+        if not name.strip() or not isinstance(level, int):
+            log.error(f"Ignoring invalid log level '{entry}', expected logger=LEVEL")
+            continue
+        levels[name.strip()] = level
+    return levels
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, with `extra` fields as top level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = record.stack_info
+        return json.dumps(data, default=str)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread, dropping them instead of blocking when the queue is full.
+
+    Only the message is merged on the calling thread, so mutable arguments are captured as they are now.
+    Timestamps, JSON and stream I/O are left to the listener.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The root logger only has this handler, so the record is updated in place instead of copied
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks reference frames that keep changing, render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def configure_logging(
+    level: str = "INFO",
+    log_format: str = "text",
+    module_levels: Optional[Dict[str, int]] = None,
+    queue_size: int = 10000,
+    stream=None
+) -> QueueListener:
+    """Routes all logging through a queue to a listener thread writing to the stream (stderr by default)."""
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(max(0, queue_size))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level, logging.INFO))
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    # Flushes what is still queued on every exit path, including sys.exit from the main loop
+    atexit.register(stop_logging, listener, queue_handler)
+    return listener
+
+def stop_logging(listener: QueueListener, queue_handler: NonBlockingQueueHandler):
+    if listener._thread is None:
+        return
+    listener.stop()
+    if queue_handler.dropped:
+        sys.stderr.write(f"{queue_handler.dropped} log record(s) were dropped because the log queue was full\n")
@@ -28,6 +28,19 @@ class DeviceDefinition:
     def serial_number(self) -> str:
         return self.parameters.get('serial_number', "unknown")
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "parameters": self.parameters,
+            "doors": self.doors,
+            "readers": self.readers,
+            "relays": self.relays,
+            "aux_inputs": self.aux_inputs,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DeviceDefinition":
+        return cls(data["parameters"], data.get("doors"), data.get("readers"), data.get("relays"), data.get("aux_inputs"))
+
 class EventType(Enum):
     CARD_SCAN_SUCCESS = "card_scan_success"
     CARD_SCAN_DENIED = "card_scan_denied"
@@ -65,3 +78,13 @@ class EntityState:
     entity_id: str
     state: str
     attributes: Optional[Dict[str, Any]] = None
+    # Event entities (reader scans) are published on every occurrence, even if the payload is unchanged.
+    is_event: bool = False
+
+@dataclass
+class EventBatch:
+    processed_events: List[ProcessedEvent] = field(default_factory=list)
+    # Final state per entity after the whole batch, intermediate values collapsed (last writer wins)
+    entity_states: Dict[str, str] = field(default_factory=dict)
+    # Event entities (reader scans) in the order they happened, these are never collapsed
+    event_states: List[EntityState] = field(default_factory=list)
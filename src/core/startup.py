@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from core.definition_cache import DefinitionCache
+from core.models import DeviceDefinition
+
+log = logging.getLogger(__name__)
+
+class StartupTimer:
+    """Times the startup stages, which run concurrently, against a common start."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, began)
+
+    def record(self, name: str, began: float):
+        """Records a stage that started at the given perf_counter time and ends now."""
+        now = time.perf_counter()
+        with self._lock:
+            self.stages[name] = now - began
+        log.info(f"Startup: {name} took {now - began:.3f}s, done {now - self.started:.3f}s after start")
+
+    def log_summary(self):
+        with self._lock:
+            stages = ", ".join(f"{name} {duration:.3f}s" for name, duration in self.stages.items())
+        log.info(f"Startup complete in {self.elapsed():.3f}s ({stages})")
+
+class DefinitionResolver:
+    """Definitions of the panels at startup: cached ones right away, the others are queried on the
+    executor and retried with backoff until the panel answers, so an unreachable panel is never dropped.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        cache: Optional[DefinitionCache] = None,
+        timer: Optional[StartupTimer] = None,
+        stop: Optional[threading.Event] = None,
+        retry_seconds: float = 5.0,
+        max_retry_seconds: float = 300.0
+    ):
+        self.executor = executor
+        self.cache = cache
+        self.timer = timer or StartupTimer()
+        self.stop = stop or threading.Event()
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        # Started from their cached definition, still to be confirmed by the panel
+        self.cached_addresses: Set[str] = set()
+
+    def resolve(self, connections) -> List[Tuple[object, "Future[DeviceDefinition]"]]:
+        devices = []
+        for connection in connections:
+            cached = self.cache.get(connection.address) if self.cache is not None else None
+            if cached is not None:
+                self.cached_addresses.add(connection.address)
+                log.info(f"Starting {connection.address} from its cached definition ({cached.serial_number})")
+                future: Future = Future()
+                future.set_result(cached)
+            else:
+                future = self.executor.submit(self.fetch, connection)
+            devices.append((connection, future))
+        return devices
+
+    def fetch(self, connection) -> DeviceDefinition:
+        """Queries the panel until it answers, raises once stop is set."""
+        began = time.perf_counter()
+        delay = self.retry_seconds
+        while True:
+            try:
+                definition = connection.get_device_definition()
+                break
+            except Exception as e:
+                log.warning(f"Device {connection.address} did not return its definition, retrying in {delay:g}s: {e}")
+            if self.stop.wait(delay):
+                raise RuntimeError(f"Startup of {connection.address} cancelled")
+            delay = min(self.max_retry_seconds, delay * 2)
+        self.timer.record(f"device definition of {connection.address}", began)
+        if self.cache is not None:
+            self.cache.put(connection.address, definition)
+        return definition
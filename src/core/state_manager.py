@@ -1,30 +1,70 @@
 import json
 import logging
 import os
+import threading
+import time
 from typing import Dict, List, Optional
 
 from core.models import DeviceDefinition, EntityState, ProcessedEvent
+from core.utils import write_json_atomic
+from metrics import bridge as metrics
 
 log = logging.getLogger(__name__)
 
 class StateManager:
-    def __init__(self, state_file_path: str = 'state.json'):
+    def __init__(self, state_file_path: str = 'state.json', flush_interval: float = 0, background_flush: bool = True):
         self.state_file_path = state_file_path
+        self.flush_interval = flush_interval
+        self.write_through = flush_interval <= 0
         self.entity_states: Dict[str, str] = {}
         self.last_event: Optional[ProcessedEvent] = None
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop_flusher = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
         
         self.load_state()
+
+        # With a flush interval changes only mark the store dirty and are written
+        # write-behind by a background thread, otherwise every change is written through.
+        # Without background_flush the owner is responsible for calling flush() periodically.
+        if not self.write_through and background_flush:
+            self._flusher = threading.Thread(target=self._flush_loop, name="state_flusher", daemon=True)
+            self._flusher.start()
     
-    def update_state(self, entity_id: str, state: str):
-        self.entity_states[entity_id] = state
-        log.debug(f"Updated state: {entity_id} -> {state}")
+    def update_state(self, entity_id: str, state: str) -> bool:
+        with self._lock:
+            if self.entity_states.get(entity_id) == state:
+                return False
+
+            self.entity_states[entity_id] = state
+            self._dirty = True
+        log.debug("Updated state: %s -> %s", entity_id, state)
+
+        if self.write_through:
+            self.save_state()
+        return True
 
-        self.save_state()
+    def update_states(self, states: Dict[str, str]) -> List[str]:
+        changed_entity_ids = []
+        with self._lock:
+            for entity_id, state in states.items():
+                if self.entity_states.get(entity_id) != state:
+                    self.entity_states[entity_id] = state
+                    changed_entity_ids.append(entity_id)
+            if changed_entity_ids:
+                self._dirty = True
+
+        if changed_entity_ids:
+            log.debug("Updated states: %s", changed_entity_ids)
+            if self.write_through:
+                self.save_state()
+        return changed_entity_ids
 
     def update_last_event(self, event: ProcessedEvent):
+        # The last event is kept in memory only, it is not part of the persisted state.
         self.last_event = event
-
-        self.save_state()
     
     def get_state(self, entity_id: str) -> Optional[str]:
         return self.entity_states.get(entity_id)
@@ -32,6 +72,9 @@ class StateManager:
     def get_states(self) -> Dict[str, str]:
         return self.entity_states
 
+    def get_entity_states(self) -> List[EntityState]:
+        return [EntityState(entity_id=entity_id, state=state) for entity_id, state in list(self.entity_states.items())]
+
     def get_last_event(self) -> Optional[ProcessedEvent]:
         return self.last_event
     
@@ -46,15 +89,40 @@ class StateManager:
             log.error(f"Error loading state from file: {e}")
     
     def save_state(self):
-        try:
+        with self._lock:
             data = {
-                'entity_states': self.entity_states
+                'entity_states': dict(self.entity_states)
             }
-            with open(self.state_file_path, 'w') as f:
-                json.dump(data, f, indent=4)
-            log.debug(f"Saved state to {self.state_file_path}")
+            self._dirty = False
+
+        started = time.perf_counter()
+        try:
+            self._write_atomic(data)
+            metrics.STATE_SAVE_DURATION.observe(time.perf_counter() - started)
+            log.debug("Saved state to %s", self.state_file_path)
         except Exception as e:
+            with self._lock:
+                self._dirty = True
+            metrics.STATE_SAVE_FAILURES.inc()
             log.error(f"Error saving state to file: {e}")
+
+    def flush(self):
+        if self._dirty:
+            self.save_state()
+
+    def close(self):
+        self._stop_flusher.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop_flusher.wait(self.flush_interval):
+            self.flush()
+
+    def _write_atomic(self, data: dict):
+        write_json_atomic(self.state_file_path, data, prefix=".state-", indent=4)
     
     def initialize_from_device(self, device_definition: DeviceDefinition) -> List[EntityState]:
         states = []
@@ -0,0 +1,72 @@
+import datetime
+import logging
+from functools import lru_cache
+from typing import Any, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import pytz
+
+import settings
+
+log = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+@lru_cache(maxsize=16)
+def get_zone(name: str) -> datetime.tzinfo:
+    try:
+        return ZoneInfo(name)
+    except ZoneInfoNotFoundError:
+        # No system tzdata available, pytz ships its own database
+        return pytz.timezone(name)
+
+def parse_timestamp(value: str) -> Optional[datetime.datetime]:
+    # Fast path for the fixed "YYYY-MM-DD HH:MM:SS" format the panel sends
+    if (len(value) == 19 and value[4] == '-' and value[7] == '-' and value[10] == ' '
+            and value[13] == ':' and value[16] == ':'):
+        try:
+            return datetime.datetime(
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19])
+            )
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+@lru_cache(maxsize=256)
+def _to_local(value: str, zone_name: str) -> Optional[datetime.datetime]:
+    # Events of a burst share the same few seconds, so conversions are cached per (timestamp, zone)
+    timestamp_dt = parse_timestamp(value)
+    if timestamp_dt is None:
+        return None
+    return timestamp_dt.replace(tzinfo=datetime.timezone.utc).astimezone(get_zone(zone_name))
+
+def _localize(timestamp_dt: datetime.datetime, zone_name: str) -> datetime.datetime:
+    utc_dt = timestamp_dt.replace(tzinfo=datetime.timezone.utc)
+    try:
+        return utc_dt.astimezone(get_zone(zone_name))
+    except Exception as e:
+        log.warning("Failed to convert timestamp to timezone %s: %s", zone_name, e)
+        return utc_dt
+
+def to_local_timestamp(time_second: Any, zone_name: Optional[str] = None) -> datetime.datetime:
+    """Converts a panel time_second (wall time treated as UTC) to an aware datetime in the configured zone."""
+    zone_name = zone_name or settings.TIME_ZONE
+    value = str(time_second)
+
+    try:
+        local_dt = _to_local(value, zone_name)
+    except Exception:
+        # Unknown zone, _localize below logs it and keeps UTC
+        local_dt = None
+    if local_dt is not None:
+        return local_dt
+
+    timestamp_dt = parse_timestamp(value)
+    if timestamp_dt is None:
+        log.warning("Failed to parse time_second '%s'", value)
+        timestamp_dt = datetime.datetime.now()
+    return _localize(timestamp_dt, zone_name)
@@ -0,0 +1,111 @@
+import datetime
+import json
+import logging
+import os
+from typing import Dict, NamedTuple, Optional
+
+from core.timestamps import TIMESTAMP_FORMAT
+from core.utils import write_json_atomic
+
+log = logging.getLogger(__name__)
+
+class EventPosition(NamedTuple):
+    """Where an event sits in the panel's log: its second, what it was and how often it occurred in that second."""
+    time: str
+    fingerprint: str
+    occurrence: int
+
+def event_time(event) -> Optional[str]:
+    value = getattr(event, "time_second", None)
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return str(value) if value else None
+
+def _field(event, name: str) -> str:
+    value = getattr(event, name, None) or 0
+    # C3 enums are IntEnums, their number is what both the realtime log and the table carry
+    return str(int(value)) if isinstance(value, int) else str(value)
+
+def event_fingerprint(event) -> str:
+    return "|".join(_field(event, name) for name in (
+        "port_nr", "card_no", "pin", "event_type", "verified", "in_out_state"
+    ))
+
+class OccurrenceCounter:
+    """Numbers events that are identical within one second, in the order a source delivers them.
+
+    The realtime log and the transaction table deliver the same events in the same order, so the
+    n-th identical event of a second is the same event in both.
+    """
+
+    def __init__(self):
+        self._time: Optional[str] = None
+        self._counts: Dict[str, int] = {}
+
+    def position(self, event) -> Optional[EventPosition]:
+        time = event_time(event)
+        if time is None or not hasattr(event, "port_nr"):
+            # Door/alarm status records are not stored in the transaction table
+            return None
+        if time != self._time:
+            self._time = time
+            self._counts = {}
+        fingerprint = event_fingerprint(event)
+        occurrence = self._counts.get(fingerprint, 0) + 1
+        self._counts[fingerprint] = occurrence
+        return EventPosition(time, fingerprint, occurrence)
+
+class TransactionCursor:
+    """Position of the newest event taken from a panel, persisted so backfills resume where the bridge stopped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.time: Optional[str] = None
+        self.seen: Dict[str, int] = {}
+        self._dirty = False
+        self.load()
+
+    @property
+    def initialized(self) -> bool:
+        return self.time is not None
+
+    def covers(self, position: EventPosition) -> bool:
+        """True if the event was already taken, by a backfill or by realtime polling."""
+        if self.time is None or position.time > self.time:
+            return False
+        if position.time < self.time:
+            return True
+        return position.occurrence <= self.seen.get(position.fingerprint, 0)
+
+    def advance(self, position: EventPosition):
+        if self.time is not None and position.time < self.time:
+            # The panel clock went back, keep the newest position
+            return
+        if position.time != self.time:
+            self.time = position.time
+            self.seen = {}
+        if position.occurrence > self.seen.get(position.fingerprint, 0):
+            self.seen[position.fingerprint] = position.occurrence
+            self._dirty = True
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.time = data.get("time")
+            self.seen = {str(key): int(value) for key, value in data.get("seen", {}).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            log.error(f"Error loading transaction cursor from {self.path}, starting without one: {e}")
+            self.time = None
+            self.seen = {}
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            write_json_atomic(self.path, {"time": self.time, "seen": self.seen}, prefix=".cursor-")
+            self._dirty = False
+        except OSError as e:
+            log.error(f"Error saving transaction cursor to {self.path}: {e}")
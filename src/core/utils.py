@@ -1,5 +1,8 @@
+import json
 import logging
-from typing import Any
+import os
+import tempfile
+from typing import Any, Optional
 
 log = logging.getLogger(__name__)
 
@@ -15,3 +18,19 @@ def safe_get_nested_attr(obj: Any, *attrs: str, default: Any = None) -> Any:
         else:
             return default
     return obj if obj is not None else default
+
+def write_json_atomic(path: str, data: Any, prefix: str = ".tmp-", indent: Optional[int] = None):
+    # Write to a temp file in the same directory and rename it over the old file,
+    # so a crash mid-write never leaves a truncated file behind.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
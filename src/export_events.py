@@ -0,0 +1,53 @@
+"""Streams archived events of a time range as NDJSON or CSV.
+
+Run with: python src/export_events.py [--from 2024-03-01] [--to 2024-03-02T12:00] [--format ndjson|csv]
+          [--device SERIAL] [--door N] [--card CARD] [--output FILE] [--archive PATH]
+Times without an offset are read in TIME_ZONE. The archive is opened read-only and can be
+exported while the bridge is running.
+"""
+import argparse
+import datetime
+import os
+import sys
+
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+import settings
+from core.event_archive import export_events, iter_events
+from core.timestamps import get_zone
+
+def parse_time(value: str) -> datetime.datetime:
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=get_zone(settings.TIME_ZONE))
+    return parsed
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from", dest="start", type=parse_time, help="first event time, inclusive")
+    parser.add_argument("--to", dest="end", type=parse_time, help="last event time, exclusive")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--device", help="panel serial number")
+    parser.add_argument("--door", type=int)
+    parser.add_argument("--card")
+    parser.add_argument("--output", help="file to write, defaults to stdout")
+    parser.add_argument("--archive", default=settings.EVENT_ARCHIVE_PATH)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.archive):
+        print(f"No event archive at {args.archive}", file=sys.stderr)
+        return 1
+
+    rows = iter_events(args.archive, args.start, args.end, args.device, args.door, args.card)
+    if args.output:
+        with open(args.output, "w", newline="") as output:
+            count = export_events(rows, output, args.format)
+    else:
+        count = export_events(rows, sys.stdout, args.format)
+    print(f"Exported {count} event(s)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,56 @@
 import json
 import logging
-from typing import Any
+from typing import Any, Dict, List, Optional, Tuple
 
 import settings
 from mqtt import handler as mqtt_handler
+from mqtt.topics import TopicRegistry, build_base_topic, build_state_topic
 from core.models import DeviceDefinition
+from ha_integration.discovery_cache import DiscoveryCache
 
 log = logging.getLogger(__name__)
 expire_time = 3 * 24 * 60 * 60 # expire after 3 days.
 
+EntityConfig = Tuple[str, str, str, Dict[str, Any]]
+
+# Abbreviations Home Assistant accepts for the config keys used here
+ABBREVIATIONS = {
+    "automation_type": "atype",
+    "availability_topic": "avty_t",
+    "command_topic": "cmd_t",
+    "connections": "cns",
+    "device_class": "dev_cla",
+    "event_types": "evt_typ",
+    "expire_after": "exp_aft",
+    "icon": "ic",
+    "identifiers": "ids",
+    "json_attributes_topic": "json_attr_t",
+    "manufacturer": "mf",
+    "model": "mdl",
+    "payload_lock": "pl_lock",
+    "payload_off": "pl_off",
+    "payload_on": "pl_on",
+    "payload_press": "pl_prs",
+    "payload_unlock": "pl_unlk",
+    "state_locked": "stat_locked",
+    "state_topic": "stat_t",
+    "state_unlocked": "stat_unlocked",
+    "sw_version": "sw",
+    "unique_id": "uniq_id",
+    "value_template": "val_tpl",
+}
+
 def safe_get_attr(obj: Any, attr_name: str, default: Any = None) -> Any:
     return getattr(obj, attr_name, default) if obj else default
 
 def get_device_info(device_definition: DeviceDefinition) -> dict:
+    device_name = settings.HA_DEVICE_NAME
+    if settings.MULTI_DEVICE_MODE:
+        device_name = f"{device_name} {device_definition.serial_number}"
+
     info = {
         "identifiers": [device_definition.serial_number],
-        "name": settings.HA_DEVICE_NAME,
+        "name": device_name,
         "manufacturer": settings.HA_DEVICE_MANUFACTURER,
         "model": settings.ZKT_DEVICE_MODEL,
         "sw_version": settings.HA_DEVICE_SW_VERSION,
@@ -28,15 +63,82 @@ def get_device_info(device_definition: DeviceDefinition) -> dict:
 
     return info
 
-def build_state_topic(object_id: str, serial_number: str) -> str:
-    return f"zkt_eco/{settings.ZKT_DEVICE_MODEL}/{serial_number}/{object_id}/state"
-
 def publish_discovery_messages(
     mqtt_client: mqtt_handler.mqtt.Client,
     device_definition: DeviceDefinition,
-    ha_identifier: str
+    ha_identifier: str,
+    discovery_cache: Optional[DiscoveryCache] = None,
+    force: bool = False,
+    topics: Optional[TopicRegistry] = None
 ):
+    messages = build_discovery_messages(device_definition, ha_identifier, topics=topics)
+    if discovery_cache is None:
+        for config_topic, payload_json in messages.items():
+            mqtt_handler.publish_message(mqtt_client, config_topic, payload_json, qos=1, retain=True)
+        return
+
+    device_id = device_definition.serial_number
+    changed, removed = discovery_cache.get_changes(device_id, messages, force)
+
+    # Clear removed configs first, so switching discovery modes never has two configs with the same unique_id
+    for config_topic in removed:
+        # An empty retained payload removes the entity from Home Assistant and the retained config from the broker
+        if mqtt_handler.publish_message(mqtt_client, config_topic, "", qos=1, retain=True):
+            discovery_cache.mark_published(device_id, config_topic, None)
+    for config_topic, payload_json in changed.items():
+        if mqtt_handler.publish_message(mqtt_client, config_topic, payload_json, qos=1, retain=True):
+            discovery_cache.mark_published(device_id, config_topic, payload_json)
+    discovery_cache.save()
+
+    log.info(f"Discovery for {device_id}: {len(changed)} config(s) published, {len(removed)} removed, "
+             f"{len(messages) - len(changed)} unchanged")
+
+def build_discovery_messages(
+    device_definition: DeviceDefinition,
+    ha_identifier: str,
+    mode: Optional[str] = None,
+    topics: Optional[TopicRegistry] = None
+) -> Dict[str, str]:
+    """Returns the retained discovery config payloads, keyed by config topic."""
+    entity_configs = build_entity_configs(device_definition, ha_identifier, topics)
+    if (mode or settings.HA_DISCOVERY_MODE) == "device":
+        return build_device_discovery_message(device_definition, entity_configs)
+    return {config_topic: json.dumps(config_payload) for _, _, config_topic, config_payload in entity_configs}
+
+def abbreviate(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {ABBREVIATIONS.get(key, key): value for key, value in config.items()}
+
+def build_device_discovery_message(device_definition: DeviceDefinition, entity_configs: List[EntityConfig]) -> Dict[str, str]:
+    # One message per panel: the device, origin and qos are sent once instead of in every entity config
+    components = {}
+    base_topic = build_base_topic(device_definition.serial_number)
+    for component, object_id, _, config_payload in entity_configs:
+        config = abbreviate({key: value for key, value in config_payload.items() if key not in ("device", "qos")})
+        # Shared options at the root are merged into every component, HA expands "~" in topics afterwards
+        for key, value in config.items():
+            if key.endswith("_t") and value.startswith(base_topic + "/"):
+                config[key] = "~" + value[len(base_topic):]
+        components[object_id] = {"p": component, **config}
+
+    payload = {
+        "~": base_topic,
+        "dev": abbreviate(get_device_info(device_definition)),
+        "o": {"name": "zkt_mqtt_bridge", "sw": settings.HA_DEVICE_SW_VERSION},
+        "cmps": components,
+        "qos": 1
+    }
+    config_topic = f"{settings.HA_DISCOVERY_PREFIX}/device/{device_definition.serial_number}/config"
+    return {config_topic: json.dumps(payload, separators=(",", ":"))}
+
+def build_entity_configs(
+    device_definition: DeviceDefinition,
+    ha_identifier: str,
+    topics: Optional[TopicRegistry] = None
+) -> List[EntityConfig]:
+    """Returns (component, object_id, config_topic, config_payload) for every entity of the panel."""
+    entity_configs: List[EntityConfig] = []
     serial_number = device_definition.serial_number
+    topics = topics or TopicRegistry.from_device_definition(device_definition)
 
     discovery_prefix = settings.HA_DISCOVERY_PREFIX
     device_info = get_device_info(device_definition)
@@ -55,8 +157,8 @@ def publish_discovery_messages(
                 "name": door_name, 
                 "unique_id": unique_id, 
                 "device_class": "door",
-                "state_topic": build_state_topic(object_id, serial_number),
-                "json_attributes_topic": build_state_topic(object_id, serial_number).replace('/state', '/attributes'),
+                "state_topic": topics.state_topic(object_id),
+                "json_attributes_topic": topics.attributes_topic(object_id),
                 "payload_on": "ON", 
                 "payload_off": "OFF",
                 "device": device_info, 
@@ -64,9 +166,25 @@ def publish_discovery_messages(
                 "expire_after": expire_time
             }
             config_topic = autoconfig_component_topic.format(component='binary_sensor') + f"/{object_id}/config"
-            payload_json = json.dumps(config_payload)
+            entity_configs.append(("binary_sensor", object_id, config_topic, config_payload))
 
-            mqtt_handler.publish_message(mqtt_client, config_topic, payload_json, qos=1, retain=True)
+            if settings.COMMANDS_ENABLED:
+                object_id = f"lock_{door_id}"
+                # The lock shows the door's lock relay, which the panel reports after every unlock
+                config_payload_lock = {
+                    "name": f"{door_name} Lock",
+                    "unique_id": f"{ha_identifier}_lock_{door_id}",
+                    "command_topic": topics.command_topic(object_id),
+                    "payload_lock": "LOCK",
+                    "payload_unlock": "UNLOCK",
+                    "state_topic": topics.state_topic(f"relay_lock_{door_id}"),
+                    "state_locked": "OFF",
+                    "state_unlocked": "ON",
+                    "device": device_info,
+                    "qos": 1
+                }
+                config_topic = autoconfig_component_topic.format(component='lock') + f"/{object_id}/config"
+                entity_configs.append(("lock", object_id, config_topic, config_payload_lock))
         except (TypeError, ValueError, AttributeError) as e: 
             log.error(f"Invalid door data: {door}. Skip. Err: {e}", exc_info=True)
 
@@ -83,8 +201,8 @@ def publish_discovery_messages(
                 "unique_id": f"{ha_identifier}_reader_{reader_id}_scan", 
                 "device": device_info,
                 "automation_type": "trigger", 
-                "state_topic": build_state_topic(object_id, serial_number),
-                "json_attributes_topic": build_state_topic(object_id, serial_number),
+                "state_topic": topics.state_topic(object_id),
+                "json_attributes_topic": topics.state_topic(object_id),
                 "event_types": [ 
                     "card_scan_success", 
                     "card_scan_denied", 
@@ -107,22 +225,18 @@ def publish_discovery_messages(
                 "name": f"{reader_name} Card", 
                 "unique_id": f"{ha_identifier}_reader_{reader_id}_card", 
                 "device": device_info,
-                "state_topic": build_state_topic(object_id, serial_number),
+                "state_topic": topics.state_topic(object_id),
                 "value_template": "{{ value_json.card_id }}",
                 "icon": "mdi:card-account-details",
-                "json_attributes_topic": build_state_topic(object_id, serial_number),
+                "json_attributes_topic": topics.state_topic(object_id),
                 "qos": 1,
                 "expire_after": expire_time
             }
             scan_config_topic = autoconfig_component_topic.format(component='event') + f"/{object_id}/config"
-            scan_payload_json = json.dumps(config_payload_scan)
-
-            mqtt_handler.publish_message(mqtt_client, scan_config_topic, scan_payload_json, qos=1, retain=True)
+            entity_configs.append(("event", f"reader_{reader_id}_scan", scan_config_topic, config_payload_scan))
             
             card_config_topic = autoconfig_component_topic.format(component='sensor') + f"/{object_id}/config"
-            card_payload_json = json.dumps(config_payload_card)
-
-            mqtt_handler.publish_message(mqtt_client, card_config_topic, card_payload_json, qos=1, retain=True)
+            entity_configs.append(("sensor", object_id, card_config_topic, config_payload_card))
         except (TypeError, ValueError, AttributeError) as e:
             log.error(f"Invalid reader data: {reader}. Skip. Err: {e}", exc_info=True)
 
@@ -142,8 +256,8 @@ def publish_discovery_messages(
             config_payload = {
                 "name": entity_name,
                 "unique_id": unique_id,
-                "state_topic": build_state_topic(object_id, serial_number),
-                "json_attributes_topic": build_state_topic(object_id, serial_number).replace('/state', '/attributes'),
+                "state_topic": topics.state_topic(object_id),
+                "json_attributes_topic": topics.attributes_topic(object_id),
                 "payload_on": "ON", 
                 "payload_off": "OFF",
                 "device": device_info,
@@ -152,8 +266,21 @@ def publish_discovery_messages(
                 "expire_after": expire_time
             }
             config_topic = f"{autoconfig_component_topic.format(component='binary_sensor')}/{object_id}/config"
-            payload_json = json.dumps(config_payload)
-            mqtt_handler.publish_message(mqtt_client, config_topic, payload_json, qos=1, retain=True)
+            entity_configs.append(("binary_sensor", object_id, config_topic, config_payload))
+
+            if settings.COMMANDS_ENABLED:
+                object_id = f"aux_output_{relay_num}"
+                config_payload_button = {
+                    "name": f"Aux Output {relay_num}",
+                    "unique_id": f"{ha_identifier}_aux_output_{relay_num}",
+                    "command_topic": topics.command_topic(object_id),
+                    "payload_press": "PRESS",
+                    "icon": "mdi:gesture-tap-button",
+                    "device": device_info,
+                    "qos": 1
+                }
+                config_topic = f"{autoconfig_component_topic.format(component='button')}/{object_id}/config"
+                entity_configs.append(("button", object_id, config_topic, config_payload_button))
 
         except (TypeError, ValueError, AttributeError) as e:
             log.error(f"Invalid or incomplete relay data: {relay}. Skipping. Error: {e}", exc_info=True)
@@ -172,8 +299,8 @@ def publish_discovery_messages(
             config_payload = {
                 "name": aux_name,
                 "unique_id": unique_id,
-                "state_topic": build_state_topic(object_id, serial_number),
-                "json_attributes_topic": build_state_topic(object_id, serial_number).replace('/state', '/attributes'),
+                "state_topic": topics.state_topic(object_id),
+                "json_attributes_topic": topics.attributes_topic(object_id),
                 "payload_on": "ON", 
                 "payload_off": "OFF", 
                 "device": device_info,
@@ -181,9 +308,13 @@ def publish_discovery_messages(
                 "expire_after": expire_time
             }
             config_topic = f"{autoconfig_component_topic.format(component='binary_sensor')}/{object_id}/config"
-            payload_json = json.dumps(config_payload)
-            mqtt_handler.publish_message(mqtt_client, config_topic, payload_json, qos=1, retain=True)
+            entity_configs.append(("binary_sensor", object_id, config_topic, config_payload))
 
         except (TypeError, ValueError, AttributeError) as e:
             log.error(f"Invalid or incomplete aux input data: {aux_input}. Skipping. Error: {e}", exc_info=True)
             continue
+
+    if mqtt_handler.availability_topic:
+        for _, _, _, config_payload in entity_configs:
+            config_payload["availability_topic"] = mqtt_handler.availability_topic
+    return entity_configs
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from core.utils import write_json_atomic
+
+log = logging.getLogger(__name__)
+
+class DiscoveryCache:
+    """Persists a content hash of every retained discovery config published, per device.
+
+    Lets startup publish only configs that are new or changed, and clear the ones of
+    entities that no longer exist, instead of republishing every retained config.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._devices: Dict[str, Dict[str, str]] = {}
+        self.load()
+
+    @staticmethod
+    def payload_hash(payload: str) -> str:
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self._devices = {device_id: dict(topics) for device_id, topics in data.get("devices", {}).items()}
+            log.info(f"Loaded discovery cache with {sum(len(t) for t in self._devices.values())} config(s) from {self.path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            log.error(f"Error loading discovery cache, all configs will be republished: {e}")
+            self._devices = {}
+
+    def get_changes(self, device_id: str, messages: Dict[str, str], force: bool = False) -> Tuple[Dict[str, str], List[str]]:
+        """Returns the messages that need publishing and the config topics that need clearing."""
+        with self._lock:
+            published = self._devices.get(device_id, {})
+            if force:
+                changed = dict(messages)
+            else:
+                changed = {
+                    topic: payload for topic, payload in messages.items()
+                    if published.get(topic) != self.payload_hash(payload)
+                }
+            removed = [topic for topic in published if topic not in messages]
+        return changed, removed
+
+    def mark_published(self, device_id: str, topic: str, payload: Optional[str]):
+        with self._lock:
+            topics = self._devices.setdefault(device_id, {})
+            if payload:
+                topics[topic] = self.payload_hash(payload)
+            else:
+                topics.pop(topic, None)
+
+    def clear(self, device_id: Optional[str] = None):
+        with self._lock:
+            if device_id is None:
+                self._devices.clear()
+            else:
+                self._devices.pop(device_id, None)
+
+    def save(self):
+        # Held while writing, so concurrent saves from several devices cannot reorder snapshots
+        with self._lock:
+            data = {"devices": self._devices}
+            try:
+                write_json_atomic(self.path, data, prefix=".discovery-")
+            except Exception as e:
+                log.error(f"Error saving discovery cache: {e}")
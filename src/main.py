@@ -1,11 +1,16 @@
+import asyncio
+import os
+import queue
 import signal
 import sys
+import threading
 import time
 import logging
-from typing import Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
 import schedule
 from dotenv import load_dotenv, find_dotenv
-import uuid
+import hashlib
 
 load_dotenv(find_dotenv(raise_error_if_not_found=True))
 
@@ -13,82 +18,472 @@ import settings
 from zkt import handler as zkt_handler
 from mqtt import handler as mqtt_handler
 from ha_integration import discovery as ha_discovery
+from ha_integration.discovery_cache import DiscoveryCache
 from scheduler.jobs import JobScheduler
+from scheduler.multi_device import MultiDeviceScheduler
+from scheduler.adaptive import AdaptivePoller, AdaptivePollingInterval, parse_busy_hours
+from scheduler.async_runtime import AsyncBridgeRuntime
+from scheduler.device_worker import DeviceWorker
+from scheduler import profiling
 from mqtt.publisher import MQTTPublisher
+from mqtt.spool import MessageSpool
+from mqtt.topics import TopicRegistry
 from core.models import DeviceDefinition
+from core.definition_cache import DefinitionCache
 from core.state_manager import StateManager
+from core.event_archive import EventArchive
+from core.transaction_cursor import TransactionCursor
+from core.dedup import DedupIndex
+from core.startup import DefinitionResolver, StartupTimer
+from core.logging_setup import configure_logging, parse_module_levels
+from metrics import bridge as metrics
+from metrics.server import MetricsServer
 
-numeric_level = getattr(logging, settings.LOG_LEVEL)
-logging.basicConfig(level=numeric_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging(
+    settings.LOG_LEVEL, settings.LOG_FORMAT, parse_module_levels(settings.LOG_LEVELS), settings.LOG_QUEUE_SIZE
+)
 log = logging.getLogger(__name__)
 
 shutdown_requested = False
+job_schedulers: List[JobScheduler] = []
+discovery_cache: Optional[DiscoveryCache] = None
+event_archive: Optional[EventArchive] = None
+dedup_index: Optional[DedupIndex] = None
+definition_cache: Optional[DefinitionCache] = None
+definition_resolver: Optional[DefinitionResolver] = None
+
+startup_timer = StartupTimer()
+# Set by the first broker connection, and by a shutdown request to stop waiting for it
+mqtt_ready = threading.Event()
+# Ends the retries of panels that have not answered yet
+startup_stop = threading.Event()
+
+DEFINITION_REFRESH_RETRY_SECONDS = 60
 
 def handle_signal(signum, frame):
     global shutdown_requested
     log.info(f"Received signal {signum}, initiating shutdown")
     shutdown_requested = True
+    mqtt_ready.set()
+    startup_stop.set()
+
+def handle_resync_signal(signum, frame):
+    log.info(f"Received signal {signum}, requesting full state resync")
+    request_resync()
+
+def handle_profile_signal(signum, frame):
+    log.info(f"Received signal {signum}, profiling the next {settings.PROFILING_CYCLES} polling cycle(s)")
+    profiling.profiler.request(settings.PROFILING_CYCLES)
+
+def handle_profile_command(payload: str):
+    try:
+        cycles = int(payload) if payload.strip() else settings.PROFILING_CYCLES
+    except ValueError:
+        log.error(f"Ignoring profiling command, expected a number of cycles: {payload!r}")
+        return
+    log.info(f"Profiling the next {cycles} polling cycle(s) on MQTT command")
+    profiling.profiler.request(cycles)
+
+def request_resync():
+    for job_scheduler in job_schedulers:
+        job_scheduler.request_resync()
+
+def handle_ha_status(payload: str):
+    if payload.strip().lower() == "online":
+        # Home Assistant does not keep entity states across restarts
+        log.info("Home Assistant is online, republishing the full state snapshot")
+        request_resync()
+
+def add_resync_listener(mqtt_client):
+    # Retained state is not used, so republish the full snapshot whenever the broker connection comes back.
+    mqtt_handler.add_connect_listener(request_resync)
+    if settings.HA_STATUS_TOPIC:
+        mqtt_handler.add_subscription(mqtt_client, settings.HA_STATUS_TOPIC, handle_ha_status)
+    if not 0 < settings.STATE_RESYNC_INTERVAL_SECONDS < ha_discovery.expire_time:
+        log.warning(
+            "STATE_RESYNC_INTERVAL_SECONDS is not below the entity expiry of "
+            f"{ha_discovery.expire_time}s, unchanged entities will become unavailable in Home Assistant"
+        )
+
+def get_device_file_path(path: str, serial_number: str) -> str:
+    if not settings.MULTI_DEVICE_MODE:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}_{serial_number}{ext}"
+
+def get_state_file_path(serial_number: str) -> str:
+    return get_device_file_path(settings.STATE_FILE_PATH, serial_number)
+
+def get_client_id(devices: List[Tuple[zkt_handler.ZKTConnection, "Future[DeviceDefinition]"]]) -> Optional[str]:
+    if settings.MULTI_DEVICE_MODE:
+        if settings.MQTT_CLIENT_ID:
+            return settings.MQTT_CLIENT_ID
+        # Derived from the configured panels, so the client id and the availability topic in every
+        # discovery config stay the same across restarts
+        addresses = "|".join(sorted(connection.address for connection, _ in devices))
+        return f"zkt_bridge_{hashlib.sha256(addresses.encode()).hexdigest()[:8]}"
+    connection, future = devices[0]
+    if not future.done():
+        # Without a cached definition the broker connection has to wait for the serial number
+        log.info(f"MQTT client id needs the serial number of {connection.address}, waiting for the device")
+    try:
+        return f"zkt_{future.result().serial_number}"
+    except Exception as e:
+        log.error(f"Failed to fetch device definition of {connection.address}: {e}")
+        return None
+
+def build_polling_interval() -> AdaptivePollingInterval:
+    if settings.POLLING_ADAPTIVE:
+        return AdaptivePollingInterval(
+            settings.POLLING_MIN_INTERVAL_SECONDS,
+            settings.POLLING_MAX_INTERVAL_SECONDS,
+            settings.POLLING_BACKOFF_FACTOR,
+            parse_busy_hours(settings.POLLING_BUSY_HOURS)
+        )
+    # A fixed interval is an adaptive one that never backs off
+    return AdaptivePollingInterval(settings.POLLING_INTERVAL_SECONDS, settings.POLLING_INTERVAL_SECONDS, 1.0)
+
+def start_device(
+    mqtt_client,
+    connection: zkt_handler.ZKTConnection,
+    device_definition: DeviceDefinition,
+    background_flush: bool = True
+) -> JobScheduler:
+    serial_number = device_definition.serial_number
+
+    publisher = MQTTPublisher(mqtt_client, serial_number)
+    state_manager = StateManager(
+        get_state_file_path(serial_number), settings.STATE_FLUSH_INTERVAL_SECONDS, background_flush
+    )
+    transaction_cursor = None
+    if settings.BACKFILL_ENABLED:
+        transaction_cursor = TransactionCursor(get_device_file_path(settings.BACKFILL_CURSOR_PATH, serial_number))
+    job_scheduler = JobScheduler(publisher, state_manager, connection, event_archive, transaction_cursor, dedup_index)
+    # The asyncio runtime starts devices on their worker already, the schedule loop gets one here
+    job_scheduler.worker = DeviceWorker.current() or DeviceWorker(f"zkt_{serial_number}")
+
+    with startup_timer.stage(f"discovery and initial states of {serial_number}"):
+        announce_device(mqtt_client, job_scheduler, device_definition)
+    job_schedulers.append(job_scheduler)
+    if definition_resolver is not None and connection.address in definition_resolver.cached_addresses:
+        job_scheduler.worker.submit(refresh_device_definition, mqtt_client, job_scheduler, device_definition)
+    return job_scheduler
+
+def announce_device(mqtt_client, job_scheduler: JobScheduler, device_definition: DeviceDefinition):
+    """Publishes discovery and the last known states of the device's entities."""
+    topics = TopicRegistry.from_device_definition(device_definition)
+    ha_discovery.publish_discovery_messages(
+        mqtt_client, device_definition, f"zkt_{device_definition.serial_number}", discovery_cache,
+        settings.HA_DISCOVERY_FORCE_REPUBLISH, topics
+    )
+    job_scheduler.publisher.topics = topics
+    job_scheduler.initialize_states(device_definition)
+    if settings.COMMANDS_ENABLED:
+        subscribe_commands(mqtt_client, job_scheduler, device_definition, topics)
+
+def refresh_device_definition(mqtt_client, job_scheduler: JobScheduler, cached: DeviceDefinition):
+    """Confirms a cached definition with the panel, runs on the device's worker."""
+    connection = job_scheduler.connection
+    try:
+        definition = connection.get_device_definition()
+    except Exception as e:
+        log.warning(f"Could not refresh the definition of {connection.address}, retrying in {DEFINITION_REFRESH_RETRY_SECONDS}s: {e}")
+        retry = threading.Timer(DEFINITION_REFRESH_RETRY_SECONDS, resubmit_definition_refresh, (mqtt_client, job_scheduler, cached))
+        retry.daemon = True
+        retry.start()
+        return
+    definition_resolver.cached_addresses.discard(connection.address)
+
+    if definition_cache is None or not definition_cache.put(connection.address, definition):
+        log.info(f"Cached definition of {connection.address} confirmed by the panel")
+        return
+    if definition.serial_number != cached.serial_number:
+        # Topics, state file and client id all derive from the serial number
+        log.warning(
+            f"Device at {connection.address} is now {definition.serial_number} instead of {cached.serial_number}, "
+            "restart the bridge to use it"
+        )
+        return
+    log.info(f"Definition of {connection.address} changed, republishing discovery")
+    announce_device(mqtt_client, job_scheduler, definition)
+
+def resubmit_definition_refresh(mqtt_client, job_scheduler: JobScheduler, cached: DeviceDefinition):
+    try:
+        job_scheduler.worker.submit(refresh_device_definition, mqtt_client, job_scheduler, cached)
+    except RuntimeError:
+        # Shutting down
+        pass
+
+def subscribe_commands(mqtt_client, job_scheduler: JobScheduler, device_definition: DeviceDefinition, topics: TopicRegistry):
+    object_ids = [f"lock_{door['number']}" for door in device_definition.doors]
+    object_ids += [f"aux_output_{relay['number']}" for relay in device_definition.relays]
+    for object_id in object_ids:
+        mqtt_handler.add_subscription(
+            mqtt_client,
+            topics.command_topic(object_id),
+            lambda payload, object_id=object_id: job_scheduler.handle_command(object_id, payload)
+        )
+    log.info(f"Listening for commands on {len(object_ids)} topic(s) of {device_definition.serial_number}")
+
+def start_ready_devices(mqtt_client, ready_devices: "queue.Queue", timeout: float = 0.0) -> int:
+    """Starts the devices whose definition arrived, waiting up to timeout for the first one."""
+    started = 0
+    while True:
+        try:
+            connection, future = ready_devices.get(timeout=timeout) if timeout > 0 else ready_devices.get_nowait()
+        except queue.Empty:
+            return started
+        timeout = 0.0
+        try:
+            device_definition = future.result()
+        except Exception as e:
+            log.error(f"Could not start device {connection.address}: {e}")
+            continue
+        start_device(mqtt_client, connection, device_definition)
+        started += 1
+
+def publish_offline(mqtt_client):
+    message_info = mqtt_handler.publish_availability(mqtt_client, False)
+    if message_info is None:
+        return
+    try:
+        message_info.wait_for_publish(2)
+    except (RuntimeError, ValueError) as e:
+        log.debug(f"Could not announce the bridge offline: {e}")
+
+def start_metrics_server(message_spool: Optional[MessageSpool]) -> Optional[MetricsServer]:
+    if settings.METRICS_PORT <= 0:
+        return None
+    if message_spool is not None:
+        metrics.MQTT_SPOOL_DEPTH.set_function(lambda: message_spool.depth)
+        metrics.MQTT_SPOOL_DROPPED.set_function(lambda: message_spool.dropped)
+    metrics_server = MetricsServer(settings.METRICS_BIND_ADDRESS, settings.METRICS_PORT)
+    try:
+        metrics_server.start()
+    except OSError as e:
+        log.error(f"Could not start the metrics endpoint on {settings.METRICS_BIND_ADDRESS}:{settings.METRICS_PORT}: {e}")
+        return None
+    return metrics_server
+
+def stop_devices():
+    """Stops the device workers and sends the batched raw events, must run while MQTT is still connected."""
+    for job_scheduler in job_schedulers:
+        if job_scheduler.worker is not None:
+            job_scheduler.worker.shutdown(wait=True)
+        job_scheduler.publisher.flush_raw_events(force=True)
+
+def close_resources(message_spool: Optional[MessageSpool], connections: List[zkt_handler.ZKTConnection]):
+    # The devices are stopped already (stop_devices, or the asyncio runtime on its own) while MQTT was connected
+    for job_scheduler in job_schedulers:
+        job_scheduler.state_manager.close()
+    if message_spool is not None:
+        message_spool.close()
+    if event_archive is not None:
+        event_archive.close()
+    if dedup_index is not None:
+        dedup_index.save()
+    for connection in connections:
+        connection.close_zkteco_connection()
+
+def add_mqtt_ready_listener():
+    began = time.perf_counter()
+
+    def on_connect():
+        if not mqtt_ready.is_set():
+            startup_timer.record("MQTT connection", began)
+            mqtt_ready.set()
+
+    mqtt_handler.add_connect_listener(on_connect)
+
+def run_async(
+    mqtt_client,
+    devices: List[Tuple[zkt_handler.ZKTConnection, "Future[DeviceDefinition]"]],
+    message_spool: Optional[MessageSpool]
+) -> int:
+    runtime = AsyncBridgeRuntime(
+        mqtt_client,
+        settings.DEVICE_CALL_TIMEOUT_SECONDS,
+        build_polling_interval,
+        settings.DEVICE_POLL_STAGGER_SECONDS,
+        connect_timeout=settings.MQTT_CONNECT_TIMEOUT_SECONDS,
+        state_flush_interval=settings.STATE_FLUSH_INTERVAL_SECONDS
+    )
+    if message_spool is not None:
+        runtime.every(60, message_spool.log_stats, "MQTT spool stats")
+    if event_archive is not None:
+        runtime.every(60 * 60, event_archive.prune, "Event archive retention")
+    if dedup_index is not None:
+        runtime.every(60, dedup_index.save, "Dedup index save")
+
+    if settings.STATE_RESYNC_INTERVAL_SECONDS > 0:
+        runtime.every(settings.STATE_RESYNC_INTERVAL_SECONDS, request_resync, "State resync")
+    add_resync_listener(mqtt_client)
+
+    return asyncio.run(runtime.run(
+        devices,
+        lambda connection, device_definition: start_device(mqtt_client, connection, device_definition, False),
+        on_started=startup_timer.log_summary
+    ))
 
 def main():
+    global discovery_cache, event_archive, dedup_index, definition_cache, definition_resolver
     log.info("Starting ZKTeco to MQTT Bridge Service")
 
     signal.signal(signal.SIGINT, handle_signal)
     signal.signal(signal.SIGTERM, handle_signal)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, handle_resync_signal)
+
+    profiling.configure_profiler(profiling.CycleProfiler(settings.PROFILING_REPORT_DIR))
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, handle_profile_signal)
+
+    if settings.MULTI_DEVICE_MODE:
+        connections = zkt_handler.build_connections()
+    else:
+        connections = [zkt_handler.get_default_connection()]
+
+    if settings.DEVICE_DEFINITION_CACHE_ENABLED:
+        definition_cache = DefinitionCache(settings.DEVICE_DEFINITION_CACHE_PATH)
+
+    # Panels are queried while local state loads and the broker connects
+    definition_executor = ThreadPoolExecutor(
+        max_workers=max(1, min(settings.DEVICE_POLL_WORKERS, len(connections))), thread_name_prefix="definition"
+    )
+    definition_resolver = DefinitionResolver(definition_executor, definition_cache, startup_timer, startup_stop)
+    devices = definition_resolver.resolve(connections)
+    definition_executor.shutdown(wait=False)
+
+    if settings.HA_DISCOVERY_CACHE_ENABLED:
+        discovery_cache = DiscoveryCache(settings.HA_DISCOVERY_CACHE_PATH)
+
+    with startup_timer.stage("local state"):
+        if settings.EVENT_ARCHIVE_ENABLED:
+            event_archive = EventArchive(settings.EVENT_ARCHIVE_PATH, settings.EVENT_ARCHIVE_RETENTION_DAYS)
+            event_archive.prune()
+
+        if settings.DEDUP_HORIZON_SECONDS > 0:
+            dedup_index = DedupIndex(settings.DEDUP_HORIZON_SECONDS, settings.DEDUP_MAX_EVENTS, settings.DEDUP_INDEX_PATH)
 
-    device_definition: Optional[DeviceDefinition] = None
-    try: 
-        device_definition = zkt_handler.get_device_definition()
-    except Exception as e: 
-        log.exception(f"Critical error fetching device definition: {e}. Exiting.", exc_info=True)
+    message_spool: Optional[MessageSpool] = None
+    if settings.MQTT_SPOOL_ENABLED:
+        message_spool = MessageSpool(
+            settings.MQTT_SPOOL_DIR,
+            settings.MQTT_SPOOL_MAX_BYTES,
+            settings.MQTT_SPOOL_SEGMENT_BYTES,
+            settings.MQTT_SPOOL_REPLAY_RATE
+        )
+        mqtt_handler.configure_spool(message_spool)
+
+    client_id = get_client_id(devices)
+    if client_id is None:
+        log.critical("Critical error fetching device definition. Exiting.")
         sys.exit(1)
 
-    serial_number = device_definition.serial_number
-    device_identifier = f"zkt_{serial_number}"
-    
-    mqtt_client = mqtt_handler.setup_mqtt_client(device_identifier)
-    if not mqtt_client: 
+    add_mqtt_ready_listener()
+    mqtt_client = mqtt_handler.setup_mqtt_client(client_id)
+    if not mqtt_client:
         log.critical("Fatal: Failed to initialize MQTT client.")
         sys.exit(1)
-    
+
+    metrics_server = start_metrics_server(message_spool)
+    if settings.PROFILING_COMMAND_TOPIC:
+        mqtt_handler.add_subscription(mqtt_client, settings.PROFILING_COMMAND_TOPIC, handle_profile_command)
+
+    if settings.RUNTIME == "asyncio":
+        log.info("Using the asyncio runtime")
+        exit_code = run_async(mqtt_client, devices, message_spool)
+        startup_stop.set()
+        close_resources(message_spool, connections)
+        if metrics_server is not None:
+            metrics_server.stop()
+        log.info("Shutdown complete")
+        sys.exit(exit_code)
+
+    if message_spool is not None:
+        schedule.every(1).minutes.do(message_spool.log_stats)
+    if event_archive is not None:
+        schedule.every(1).hours.do(event_archive.prune)
+    if dedup_index is not None:
+        schedule.every(1).minutes.do(dedup_index.save)
+
     mqtt_client.loop_start()
 
-    connection_timeout_seconds = 15
-    wait_start_time = time.monotonic()
-    while not mqtt_client.is_connected():
-        if shutdown_requested: 
-            mqtt_client.loop_stop()
-            sys.exit(1)
-        if time.monotonic() - wait_start_time > connection_timeout_seconds: 
-            log.critical(f"MQTT connection timeout after {connection_timeout_seconds} seconds")
-            mqtt_client.loop_stop()
-            sys.exit(1)
-        time.sleep(0.5)
+    mqtt_ready.wait(settings.MQTT_CONNECT_TIMEOUT_SECONDS)
+    if shutdown_requested:
+        mqtt_client.loop_stop()
+        sys.exit(1)
+    if not mqtt_ready.is_set():
+        log.critical(f"MQTT connection timeout after {settings.MQTT_CONNECT_TIMEOUT_SECONDS:g} seconds")
+        mqtt_client.loop_stop()
+        sys.exit(1)
     log.info("MQTT Connected.")
 
+    # Every device starts as soon as its definition is there, cached ones right away. Panels that
+    # do not answer yet keep being retried and join the polling once they do.
+    ready_devices: "queue.Queue[Tuple[zkt_handler.ZKTConnection, Future]]" = queue.Queue()
+    for connection, future in devices:
+        future.add_done_callback(lambda future, connection=connection: ready_devices.put((connection, future)))
+    start_ready_devices(mqtt_client, ready_devices)
+    if not job_schedulers and all(future.done() for _, future in devices):
+        log.critical("Critical error fetching device definition. Exiting.")
+        mqtt_client.loop_stop()
+        sys.exit(1)
+    if all(future.done() for _, future in devices):
+        startup_timer.log_summary()
+    else:
+        log.info(f"Started {len(job_schedulers)} of {len(devices)} device(s), the others start once they answer")
+
+    multi_device_scheduler: Optional[MultiDeviceScheduler] = None
     if not shutdown_requested:
-        ha_discovery.publish_discovery_messages(mqtt_client, device_definition, device_identifier)
-        
-        publisher = MQTTPublisher(mqtt_client, serial_number)
-        state_manager = StateManager(settings.STATE_FILE_PATH)
-        job_scheduler = JobScheduler(publisher, state_manager)
-        
-        job_scheduler.initialize_states(device_definition)
-        
-        schedule.every(settings.POLLING_INTERVAL_SECONDS).seconds.do(job_scheduler.polling_job)
-        schedule.every(1).days.do(job_scheduler.time_update_job)
+        add_resync_listener(mqtt_client)
+        if settings.STATE_RESYNC_INTERVAL_SECONDS > 0:
+            schedule.every(settings.STATE_RESYNC_INTERVAL_SECONDS).seconds.do(request_resync)
+
+        if settings.MULTI_DEVICE_MODE:
+            multi_device_scheduler = MultiDeviceScheduler(
+                job_schedulers, settings.DEVICE_POLL_WORKERS, settings.DEVICE_POLL_STAGGER_SECONDS, len(devices)
+            )
+            log.info(f"Driving {len(job_schedulers)} device(s) with {multi_device_scheduler.max_workers} worker(s)")
+            polling_job = multi_device_scheduler.polling_job
+            time_update_job = multi_device_scheduler.time_update_job
+            polling_label = "all"
+        else:
+            polling_job = job_schedulers[0].polling_job
+            time_update_job = job_schedulers[0].time_update_job
+            polling_label = job_schedulers[0].device_label
+
+        if settings.POLLING_ADAPTIVE:
+            adaptive_interval = build_polling_interval()
+            AdaptivePoller(polling_job, adaptive_interval, polling_label).schedule()
+            log.info(f"Adaptive polling between {adaptive_interval.min_interval:g}s and {adaptive_interval.max_interval:g}s")
+        else:
+            schedule.every(settings.POLLING_INTERVAL_SECONDS).seconds.do(polling_job)
+            metrics.POLLING_INTERVAL.labels(device=polling_label).set(settings.POLLING_INTERVAL_SECONDS)
+        schedule.every(1).days.do(time_update_job)
 
     log.info("Starting scheduler loop. Ctrl+C to exit.")
-    while not shutdown_requested: 
+    while not shutdown_requested:
         schedule.run_pending()
-        time.sleep(min(1.0, schedule.idle_seconds() if schedule.next_run else 1.0))
+        # Waits for late devices instead of sleeping until the next job
+        timeout = max(0.0, min(1.0, schedule.idle_seconds() if schedule.next_run else 1.0))
+        if start_ready_devices(mqtt_client, ready_devices, timeout) and all(future.done() for _, future in devices):
+            startup_timer.log_summary()
 
     log.info("Shutting down...")
+    startup_stop.set()
     schedule.clear()
+    if multi_device_scheduler is not None:
+        multi_device_scheduler.shutdown()
+    stop_devices()
+    publish_offline(mqtt_client)
     mqtt_client.loop_stop()
     mqtt_client.disconnect()
-    zkt_handler.close_zkteco_connection()
+    close_resources(message_spool, connections)
+    if metrics_server is not None:
+        metrics_server.stop()
     log.info("Shutdown complete")
     sys.exit(0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
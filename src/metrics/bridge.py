@@ -0,0 +1,44 @@
+from metrics.registry import counter, gauge, histogram
+
+POLL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+EVENTS_PER_POLL_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+COMMAND_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0)
+SAVE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+POLL_DURATION = histogram(
+    "zkt_poll_duration_seconds", "Duration of poll_zkteco_changes per device, including the backlog drain.",
+    ["device"], POLL_BUCKETS
+)
+POLL_EVENTS = histogram(
+    "zkt_poll_events", "Events returned per poll per device.", ["device"], EVENTS_PER_POLL_BUCKETS
+)
+POLL_FAILURES = counter("zkt_poll_failures_total", "Polls that failed to read from the device.", ["device"])
+EVENTS = counter("zkt_events_total", "Processed events by device and Home Assistant event type.", ["device", "event_type"])
+BACKFILL_EVENTS = counter(
+    "zkt_backfill_events_total", "Historical events taken from the stored transaction table per device.", ["device"]
+)
+DUPLICATE_EVENTS = counter(
+    "zkt_duplicate_events_total", "Events dropped because they were already processed within the dedup horizon.", ["device"]
+)
+COMMANDS = counter("zkt_commands_total", "Output commands received over MQTT by device and result.", ["device", "result"])
+COMMAND_LATENCY = histogram(
+    "zkt_command_latency_seconds", "Time from receiving a command to the end of the confirming poll.", ["device"],
+    COMMAND_BUCKETS
+)
+DEVICE_RECONNECTS = counter(
+    "zkt_device_reconnects_total", "Reconnects of the device session after failed calls or keepalive probes.", ["device"]
+)
+
+MQTT_PUBLISHES = counter("zkt_mqtt_publishes_total", "MQTT publishes by result (ok, failed, spooled).", ["result"])
+MQTT_INFLIGHT = gauge("zkt_mqtt_inflight_messages", "QoS 1/2 messages handed to the client and not yet acknowledged.")
+MQTT_SPOOL_DEPTH = gauge("zkt_mqtt_spool_depth", "Messages waiting in the on-disk MQTT spool.")
+MQTT_SPOOL_DROPPED = gauge("zkt_mqtt_spool_dropped", "Spooled messages dropped because the spool was full.")
+
+STATE_SAVE_DURATION = histogram(
+    "zkt_state_save_duration_seconds", "Duration of atomic state file writes.", buckets=SAVE_BUCKETS
+)
+STATE_SAVE_FAILURES = counter("zkt_state_save_failures_total", "State file writes that failed.")
+
+POLLING_INTERVAL = gauge(
+    "zkt_polling_interval_seconds", "Current polling interval, follows activity with adaptive polling.", ["device"]
+)
@@ -1,23 +1,87 @@
 import logging
 import paho.mqtt.client as mqtt
-from typing import Optional
+from typing import Callable, Dict, List, Optional
 
 import settings
+from metrics import bridge as metrics
+from mqtt.spool import MessageSpool
 
 log = logging.getLogger(__name__)
 
+connect_listeners: List[Callable[[], None]] = []
+# Command topic -> handler of the decoded payload, subscribed again on every connect
+subscriptions: Dict[str, Callable[[str], None]] = {}
+spool: Optional[MessageSpool] = None
+# Resolved for the client id in setup_mqtt_client, None while availability is disabled
+availability_topic: Optional[str] = None
+
+published_ok = metrics.MQTT_PUBLISHES.labels(result="ok")
+published_failed = metrics.MQTT_PUBLISHES.labels(result="failed")
+published_spooled = metrics.MQTT_PUBLISHES.labels(result="spooled")
+
+def configure_spool(message_spool: Optional[MessageSpool]):
+    global spool
+    spool = message_spool
+
+def add_connect_listener(listener: Callable[[], None]):
+    connect_listeners.append(listener)
+
+def add_subscription(client: mqtt.Client, topic: str, handler: Callable[[str], None]):
+    subscriptions[topic] = handler
+
+    def on_message(client, userdata, message):
+        try:
+            handler(message.payload.decode("utf-8", errors="replace"))
+        except Exception as e:
+            log.error(f"Error handling MQTT message on {message.topic}: {e}")
+
+    client.message_callback_add(topic, on_message)
+    if client.is_connected():
+        client.subscribe(topic, qos=1)
+
+def get_availability_topic(client_id: str) -> Optional[str]:
+    if settings.AVAILABILITY_TOPIC is None:
+        return f"zkt_eco/{client_id}/availability"
+    return settings.AVAILABILITY_TOPIC or None
+
+def publish_availability(client: mqtt.Client, online: bool) -> Optional[mqtt.MQTTMessageInfo]:
+    if not availability_topic:
+        return None
+    # Sent directly, never spooled: a replayed availability message would be stale
+    try:
+        return client.publish(availability_topic, "online" if online else "offline", qos=1, retain=True)
+    except Exception as e:
+        log.warning(f"Could not publish availability to {availability_topic}: {e}")
+        return None
+
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc != 0:
         log.error(f"Failed to connect to MQTT Broker, return code {rc}")
+        return
+
+    publish_availability(client, True)
+
+    for topic in subscriptions:
+        client.subscribe(topic, qos=1)
+
+    if spool is not None:
+        spool.start_replay(client)
+
+    for listener in connect_listeners:
+        try:
+            listener()
+        except Exception as e:
+            log.error(f"Error in MQTT connect listener: {e}")
 
 def on_disconnect(client, userdata, flags, rc, properties=None):
     if rc != 0:
         log.warning(f"Unexpectedly disconnected from MQTT Broker with result code {rc}. Reconnection might be attempted by loop.")
 
 def on_publish(client, userdata, mid, properties=None, reason_codes=None):
-    log.debug(f"Published message ID: {mid}")
+    log.debug("Published message ID: %s", mid)
 
 def setup_mqtt_client(client_id: str) -> Optional[mqtt.Client]:
+    global availability_topic
     log.info(f"Setting up MQTT client at {settings.MQTT_BROKER_HOST}:{settings.MQTT_BROKER_PORT}...")
     try:
         client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
@@ -28,6 +92,8 @@ def setup_mqtt_client(client_id: str) -> Optional[mqtt.Client]:
     client.on_connect = on_connect
     client.on_disconnect = on_disconnect
     client.on_publish = on_publish
+    # paho keeps every message until it is sent (QoS 0) or acknowledged (QoS 1/2), there is no public accessor
+    metrics.MQTT_INFLIGHT.set_function(lambda: len(getattr(client, "_out_messages", ())))
 
     if settings.MQTT_USERNAME and settings.MQTT_PASSWORD:
         try:
@@ -35,6 +101,11 @@ def setup_mqtt_client(client_id: str) -> Optional[mqtt.Client]:
         except Exception as e:
             return None
 
+    availability_topic = get_availability_topic(client_id)
+    if availability_topic:
+        # The broker announces the bridge offline when the connection drops without a clean shutdown
+        client.will_set(availability_topic, "offline", qos=1, retain=True)
+
     # TODO: Add TLS configuration via settings if needed
 
     try:
@@ -49,12 +120,29 @@ def publish_message(client: mqtt.Client, topic: str, payload: str, qos: int = 1,
         log.error(f"Cannot publish to {topic}, MQTT client is invalid.")
         return False
 
+    # While disconnected, or while older messages are still spooled, keep the order by spooling as well
+    if spool is not None and (spool.depth > 0 or not client.is_connected()):
+        spool_message(client, topic, payload, qos, retain)
+        return True
+
     try:
         result = client.publish(topic, payload, qos=qos, retain=retain)
         if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            log.debug(f"Topic: {topic}, Payload: {payload}")
+            log.debug("Topic: %s, Payload: %s", topic, payload)
+            published_ok.inc()
             return True
-        else:
-            return False
     except Exception as e:
-        return False
+        log.debug("Publishing to %s failed: %s", topic, e)
+
+    if spool is not None:
+        spool_message(client, topic, payload, qos, retain)
+        return True
+    published_failed.inc()
+    return False
+
+def spool_message(client: mqtt.Client, topic: str, payload: str, qos: int, retain: bool):
+    spool.append(topic, payload, qos, retain)
+    published_spooled.inc()
+    if client.is_connected():
+        # on_connect only starts a replay after a reconnect, restart one that stopped while connected
+        spool.start_replay(client)
@@ -2,49 +2,67 @@ import json
 import logging
 from typing import Dict, Any, List, Optional
 
+import settings
 from mqtt import handler as mqtt_handler
-from ha_integration import discovery as ha_discovery
-from core.models import ProcessedEvent, EntityState
+from mqtt.raw_events import RawEventBatcher
+from mqtt.topics import STATE_PAYLOADS, TopicRegistry
+from core.models import ProcessedEvent, EntityState, EventBatch
 
 log = logging.getLogger(__name__)
 
 class MQTTPublisher:
-    def __init__(self, mqtt_client: mqtt_handler.mqtt.Client, serial_number: str):
+    def __init__(self, mqtt_client: mqtt_handler.mqtt.Client, serial_number: str, topics: Optional[TopicRegistry] = None):
         self.mqtt_client = mqtt_client
         self.serial_number = serial_number
+        self.topics = topics or TopicRegistry(serial_number)
+        self.raw_event_mode = settings.RAW_EVENT_MODE
+        self.raw_event_batcher = None
+        if self.raw_event_mode in ("batch", "both"):
+            self.raw_event_batcher = RawEventBatcher(
+                self._publish_raw_event_batch,
+                settings.RAW_EVENT_BATCH_FORMAT,
+                settings.RAW_EVENT_BATCH_MAX_EVENTS,
+                settings.RAW_EVENT_BATCH_WINDOW_SECONDS
+            )
         
     def publish_entity_state(self, entity_id: str, state: str, attributes: Optional[Dict[str, Any]] = None):
-        state_topic = ha_discovery.build_state_topic(entity_id, self.serial_number)
-        attributes_topic = state_topic.replace('/state', '/attributes')
+        topics = self.topics.get(entity_id)
+        payload = STATE_PAYLOADS.get(state)
+        if payload is None:
+            payload = str(state)
 
-        log.debug(f"Publishing state to {state_topic}: {state}")
-        mqtt_handler.publish_message(self.mqtt_client, state_topic, str(state), qos=1, retain=False)
+        log.debug("Publishing state to %s: %s", topics.state, state)
+        mqtt_handler.publish_message(self.mqtt_client, topics.state, payload, qos=1, retain=False)
         
         if attributes and isinstance(attributes, dict):
             try:
                 payload = json.dumps(attributes)
-                log.debug(f"Publishing attributes to {attributes_topic}: {payload}")
-                mqtt_handler.publish_message(self.mqtt_client, attributes_topic, payload, qos=1, retain=False)
+                log.debug("Publishing attributes to %s: %s", topics.attributes, payload)
+                mqtt_handler.publish_message(self.mqtt_client, topics.attributes, payload, qos=1, retain=False)
             except (TypeError, ValueError) as e: 
                 log.error(f"Failed to serialize attributes for {entity_id}: {attributes}. Err: {e}")
     
+    @staticmethod
+    def build_raw_event_payload(event: ProcessedEvent) -> Dict[str, Any]:
+        raw_payload = {
+            "timestamp": event.timestamp.isoformat(),
+            "door": event.door_id,
+            "card": event.card_id,
+            "pin": event.pin,
+            "event_code": event.zk_event_code,
+            "event_desc": event.zk_event_desc,
+            "verify_mode": event.verify_mode,
+            "entry_exit": event.entry_exit
+        }
+        return {k: v for k, v in raw_payload.items() if v is not None}
+
     def publish_raw_event(self, event: ProcessedEvent):
         try:
-            raw_payload = {
-                "timestamp": event.timestamp.isoformat(),
-                "door": event.door_id,
-                "card": event.card_id,
-                "pin": event.pin,
-                "event_code": event.zk_event_code,
-                "event_desc": event.zk_event_desc,
-                "verify_mode": event.verify_mode,
-                "entry_exit": event.entry_exit
-            }
-            payload_str = json.dumps({k: v for k, v in raw_payload.items() if v is not None})
+            payload_str = json.dumps(self.build_raw_event_payload(event))
             log.debug("Publishing raw event to general topic")
             mqtt_handler.publish_message(
                 self.mqtt_client,
-                ha_discovery.build_state_topic('raw_event', self.serial_number),
+                self.topics.state_topic('raw_event'),
                 payload_str,
                 qos=0,
                 retain=False
@@ -55,3 +73,46 @@ class MQTTPublisher:
     def publish_entity_states(self, states: List[EntityState]):
         for state in states:
             self.publish_entity_state(state.entity_id, state.state, state.attributes)
+
+    def publish_batch(self, changed_states: List[EntityState], batch: EventBatch):
+        self.publish_entity_states(changed_states)
+        self.publish_entity_states(batch.event_states)
+        if self.raw_event_mode != "batch":
+            for event in batch.processed_events:
+                self.publish_raw_event(event)
+        if self.raw_event_batcher is not None and batch.processed_events:
+            self.raw_event_batcher.add([self.build_raw_event_payload(event) for event in batch.processed_events])
+
+    def publish_historical_events(self, events: List[ProcessedEvent]):
+        """Publishes backfilled events as raw events only, they are marked historical and change no entity state."""
+        payloads = []
+        for event in events:
+            payload = self.build_raw_event_payload(event)
+            payload["historical"] = True
+            payloads.append(payload)
+        if self.raw_event_mode != "batch":
+            for payload in payloads:
+                mqtt_handler.publish_message(
+                    self.mqtt_client, self.topics.state_topic('raw_event'), json.dumps(payload), qos=0, retain=False
+                )
+        if self.raw_event_batcher is not None and payloads:
+            self.raw_event_batcher.add(payloads)
+
+    def flush_raw_events(self, force: bool = False):
+        """Publishes batched raw events whose time window has passed, or all of them when forced."""
+        if self.raw_event_batcher is None:
+            return
+        if force:
+            self.raw_event_batcher.flush()
+        else:
+            self.raw_event_batcher.flush_if_due()
+
+    def _publish_raw_event_batch(self, payload: str) -> bool:
+        # A lost batch loses many events at once, so unlike single raw events it is sent with QoS 1
+        return mqtt_handler.publish_message(
+            self.mqtt_client,
+            self.topics.state_topic('raw_events'),
+            payload,
+            qos=1,
+            retain=False
+        )
@@ -0,0 +1,58 @@
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+RawEventPayload = Dict[str, Any]
+
+class RawEventBatcher:
+    """Collects raw event payloads and publishes them as one NDJSON or JSON array message per window.
+
+    Every event gets a sequence number (`seq`), so consumers can spot gaps. Numbering restarts at 1
+    when the bridge restarts.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str], bool],
+        batch_format: str = "ndjson",
+        max_events: int = 500,
+        window_seconds: float = 0.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.publish = publish
+        self.batch_format = batch_format
+        self.max_events = max(1, max_events)
+        self.window_seconds = max(0.0, window_seconds)
+        self.clock = clock
+        self.sequence = 0
+        self._lock = threading.Lock()
+        self._pending: List[RawEventPayload] = []
+        self._window_started = 0.0
+
+    def add(self, payloads: List[RawEventPayload]):
+        with self._lock:
+            if not self._pending:
+                self._window_started = self.clock()
+            for payload in payloads:
+                self.sequence += 1
+                payload["seq"] = self.sequence
+                self._pending.append(payload)
+            full = len(self._pending) >= self.max_events
+        if full or self.window_seconds == 0:
+            self.flush()
+
+    def flush_if_due(self):
+        if self._pending and self.clock() - self._window_started >= self.window_seconds:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.max_events):
+            self.publish(self.serialize(pending[start:start + self.max_events]))
+
+    def serialize(self, payloads: List[RawEventPayload]) -> str:
+        if self.batch_format == "json":
+            return json.dumps(payloads, separators=(",", ":"))
+        return "\n".join(json.dumps(payload, separators=(",", ":")) for payload in payloads)
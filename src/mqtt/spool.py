@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import paho.mqtt.client as mqtt
+
+log = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson"
+CURSOR_FILE = "cursor.json"
+CURSOR_SAVE_EVERY = 100
+REPLAY_RETRY_MIN_SECONDS = 0.1
+REPLAY_RETRY_MAX_SECONDS = 5.0
+
+class MessageSpool:
+    """Bounded, append-only on-disk queue for messages that could not be handed to the broker.
+
+    Messages are stored as NDJSON lines in rotating segment files. Only the open write
+    segment handle and a read cursor are kept in memory, so memory use does not grow
+    with the length of an outage. When the total size exceeds max_bytes the oldest
+    segment is dropped and its messages are counted in `dropped`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 50 * 1024 * 1024, segment_bytes: int = 1024 * 1024, replay_rate: float = 100.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.replay_rate = replay_rate
+
+        self.dropped = 0
+        self.replayed = 0
+        self.last_replay_rate = 0.0
+
+        self._lock = threading.Lock()
+        self._segments: List[int] = []
+        self._segment_sizes: Dict[int, int] = {}
+        self._write_file = None
+        self._read_offset = 0
+        self._acks_since_cursor_save = 0
+        self._depth = 0
+        self._replay_thread: Optional[threading.Thread] = None
+        self._replay_lock = threading.Lock()
+        self._stop_replay = threading.Event()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def append(self, topic: str, payload: Union[str, bytes], qos: int, retain: bool):
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode("utf-8")
+        record = (json.dumps({"t": topic, "p": payload, "q": qos, "r": retain}) + "\n").encode("utf-8")
+
+        with self._lock:
+            if (self._write_file is None or not self._segments
+                    or self._segment_sizes[self._segments[-1]] + len(record) > self.segment_bytes):
+                self._rotate()
+            self._write_file.write(record)
+            self._write_file.flush()
+            self._segment_sizes[self._segments[-1]] += len(record)
+            self._depth += 1
+            self._enforce_max_bytes()
+
+    def log_stats(self):
+        if self._depth or self.dropped:
+            log.info(f"MQTT spool: depth={self._depth}, dropped={self.dropped}, replayed={self.replayed}, "
+                     f"last replay rate={self.last_replay_rate:.1f} msg/s")
+
+    def start_replay(self, client: mqtt.Client):
+        with self._replay_lock:
+            if self._replay_thread is not None and self._replay_thread.is_alive():
+                return
+            if self._depth == 0:
+                return
+            self._stop_replay.clear()
+            self._replay_thread = threading.Thread(target=self._replay, args=(client,), name="mqtt_spool_replay", daemon=True)
+            self._replay_thread.start()
+
+    def close(self):
+        self._stop_replay.set()
+        if self._replay_thread is not None:
+            self._replay_thread.join()
+        with self._lock:
+            self._save_cursor()
+            if self._write_file is not None:
+                self._write_file.close()
+                self._write_file = None
+
+    def _replay(self, client: mqtt.Client):
+        log.info(f"Replaying {self._depth} spooled MQTT message(s) at up to {self.replay_rate:g} msg/s")
+        interval = 1.0 / self.replay_rate if self.replay_rate > 0 else 0.0
+        started = time.monotonic()
+        sent = 0
+        retry_delay = REPLAY_RETRY_MIN_SECONDS
+
+        while not self._stop_replay.is_set() and client.is_connected():
+            with self._lock:
+                next_message = self._peek()
+            if next_message is None:
+                break
+
+            message, index, length = next_message
+            try:
+                rc = client.publish(message["t"], message["p"], qos=message["q"], retain=message["r"]).rc
+            except Exception as e:
+                log.warning(f"Replay of spooled message to {message['t']} failed: {e}")
+                rc = None
+            if rc == mqtt.MQTT_ERR_NO_CONN:
+                # on_connect starts the replay again
+                break
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                # Transient (e.g. paho's queue is full), retry the same message while connected
+                log.debug("Replay paused for %.1fs, publish returned %s", retry_delay, rc)
+                self._stop_replay.wait(retry_delay)
+                retry_delay = min(REPLAY_RETRY_MAX_SECONDS, retry_delay * 2)
+                continue
+            retry_delay = REPLAY_RETRY_MIN_SECONDS
+
+            with self._lock:
+                self._ack(index, length)
+            sent += 1
+            self.replayed += 1
+            if interval:
+                self._stop_replay.wait(interval)
+
+        elapsed = time.monotonic() - started
+        self.last_replay_rate = sent / elapsed if elapsed > 0 else 0.0
+        with self._lock:
+            self._save_cursor()
+        log.info(f"Replayed {sent} spooled MQTT message(s) at {self.last_replay_rate:.1f} msg/s, {self._depth} left")
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{index:08d}{SEGMENT_SUFFIX}")
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                index = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                self._segments.append(index)
+                self._segment_sizes[index] = os.path.getsize(self._segment_path(index))
+        self._segments.sort()
+
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), "r") as f:
+                cursor = json.load(f)
+            if self._segments and cursor.get("segment") == self._segments[0]:
+                self._read_offset = int(cursor.get("offset", 0))
+        except (OSError, ValueError):
+            pass
+
+        for position, index in enumerate(self._segments):
+            offset = self._read_offset if position == 0 else 0
+            records, end = self._count_records(index, offset)
+            if end < self._segment_sizes[index]:
+                # A crash in the middle of a write leaves a partial last line, which never was a message
+                log.warning(f"Dropping a partly written message at the end of {self._segment_path(index)}")
+                with open(self._segment_path(index), "r+b") as f:
+                    f.truncate(end)
+                self._segment_sizes[index] = end
+            self._depth += records
+
+        if self._depth:
+            log.info(f"Loaded MQTT spool with {self._depth} pending message(s) from {self.directory}")
+
+    def _count_records(self, index: int, offset: int) -> Tuple[int, int]:
+        """Complete records of a segment from the offset on, and where the last of them ends."""
+        records = 0
+        end = offset
+        with open(self._segment_path(index), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                records += 1
+                end += len(line)
+        return records, end
+
+    def _rotate(self):
+        if self._write_file is not None:
+            self._write_file.close()
+        index = self._segments[-1] + 1 if self._segments else 1
+        self._segments.append(index)
+        self._segment_sizes[index] = 0
+        self._write_file = open(self._segment_path(index), "ab")
+
+    def _enforce_max_bytes(self):
+        while len(self._segments) > 1 and sum(self._segment_sizes.values()) > self.max_bytes:
+            index = self._segments[0]
+            lost, _ = self._count_records(index, self._read_offset)
+            self._remove_segment(index)
+            self._depth -= lost
+            self.dropped += lost
+            log.warning(f"MQTT spool full ({self.max_bytes} bytes), dropped {lost} oldest message(s)")
+
+    def _remove_segment(self, index: int):
+        self._segments.remove(index)
+        del self._segment_sizes[index]
+        self._read_offset = 0
+        os.unlink(self._segment_path(index))
+        self._save_cursor()
+
+    def _peek(self) -> Optional[Tuple[dict, int, int]]:
+        while self._segments:
+            index = self._segments[0]
+            with open(self._segment_path(index), "rb") as f:
+                f.seek(self._read_offset)
+                line = f.readline()
+            if line.endswith(b"\n"):
+                return json.loads(line), index, len(line)
+            if index == self._segments[-1]:
+                return None
+            # Fully replayed segment that is no longer written to, anything left in it is not a message
+            skipped, _ = self._count_records(index, self._read_offset)
+            self._remove_segment(index)
+            self._depth -= skipped
+        return None
+
+    def _ack(self, index: int, length: int):
+        if not self._segments or self._segments[0] != index:
+            # The segment was dropped while its message was being published
+            return
+        self._read_offset += length
+        self._depth -= 1
+        if self._depth == 0:
+            # Everything replayed, start over with a fresh segment on the next append
+            if self._write_file is not None:
+                self._write_file.close()
+                self._write_file = None
+            for remaining in list(self._segments):
+                self._remove_segment(remaining)
+            return
+        self._acks_since_cursor_save += 1
+        if self._acks_since_cursor_save >= CURSOR_SAVE_EVERY:
+            self._save_cursor()
+
+    def _save_cursor(self):
+        self._acks_since_cursor_save = 0
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        temp_path = cursor_path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump({"segment": self._segments[0] if self._segments else None, "offset": self._read_offset}, f)
+            os.replace(temp_path, cursor_path)
+        except OSError as e:
+            log.error(f"Failed to save MQTT spool cursor: {e}")
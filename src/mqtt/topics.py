@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, NamedTuple
+
+import settings
+from core.models import DeviceDefinition
+
+# Constant state payloads, handed to paho as bytes so they are not encoded again on every publish
+STATE_PAYLOADS: Dict[str, bytes] = {"ON": b"ON", "OFF": b"OFF"}
+
+def build_base_topic(serial_number: str) -> str:
+    return f"zkt_eco/{settings.ZKT_DEVICE_MODEL}/{serial_number}"
+
+def build_state_topic(object_id: str, serial_number: str) -> str:
+    return f"{build_base_topic(serial_number)}/{object_id}/state"
+
+def entity_ids(device_definition: DeviceDefinition) -> Iterable[str]:
+    """Yields the object id of every entity the bridge publishes for the panel."""
+    for door in device_definition.doors:
+        yield f"door_{door['number']}"
+        yield f"lock_{door['number']}"
+    for reader in device_definition.readers:
+        yield f"reader_{reader['number']}_scan"
+        yield f"reader_{reader['number']}_card"
+    for relay in device_definition.relays:
+        yield f"relay_lock_{relay['number']}"
+        yield f"aux_output_{relay['number']}"
+    for aux_input in device_definition.aux_inputs:
+        yield f"aux_input_{aux_input['number']}"
+    yield "raw_event"
+    yield "raw_events"
+
+class EntityTopics(NamedTuple):
+    state: str
+    attributes: str
+    command: str
+
+class TopicRegistry:
+    """State, attributes and command topics of one panel's entities, built once instead of on every publish."""
+
+    def __init__(self, serial_number: str, object_ids: Iterable[str] = ()):
+        self.serial_number = serial_number
+        self.base_topic = build_base_topic(serial_number)
+        self._topics: Dict[str, EntityTopics] = {}
+        for object_id in object_ids:
+            self._add(object_id)
+
+    @classmethod
+    def from_device_definition(cls, device_definition: DeviceDefinition) -> "TopicRegistry":
+        return cls(device_definition.serial_number, entity_ids(device_definition))
+
+    def get(self, object_id: str) -> EntityTopics:
+        topics = self._topics.get(object_id)
+        if topics is None:
+            # Entities missing from the device definition still work, their topics are cached on first use
+            topics = self._add(object_id)
+        return topics
+
+    def state_topic(self, object_id: str) -> str:
+        return self.get(object_id).state
+
+    def attributes_topic(self, object_id: str) -> str:
+        return self.get(object_id).attributes
+
+    def command_topic(self, object_id: str) -> str:
+        return self.get(object_id).command
+
+    def _add(self, object_id: str) -> EntityTopics:
+        prefix = f"{self.base_topic}/{object_id}"
+        topics = EntityTopics(f"{prefix}/state", f"{prefix}/attributes", f"{prefix}/set")
+        self._topics[object_id] = topics
+        return topics
@@ -0,0 +1,93 @@
+import logging
+from datetime import datetime, time as dt_time
+from typing import Callable, List, Optional, Tuple
+
+import schedule
+
+from metrics import bridge as metrics
+
+log = logging.getLogger(__name__)
+
+BusyHours = List[Tuple[dt_time, dt_time]]
+
+def parse_busy_hours(value: str) -> BusyHours:
+    """Parses a comma separated list of HH:MM-HH:MM ranges, e.g. "07:00-09:30,16:00-18:00"."""
+    busy_hours = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            start, end = entry.split("-", 1)
+            busy_hours.append((
+                datetime.strptime(start.strip(), "%H:%M").time(),
+                datetime.strptime(end.strip(), "%H:%M").time()
+            ))
+        except ValueError:
+            log.error(f"Ignoring invalid busy hours range '{entry}', expected HH:MM-HH:MM")
+    return busy_hours
+
+class AdaptivePollingInterval:
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        backoff_factor: float = 2.0,
+        busy_hours: Optional[BusyHours] = None,
+        clock: Callable[[], datetime] = datetime.now
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff_factor = max(1.0, backoff_factor)
+        self.busy_hours = busy_hours or []
+        self.clock = clock
+        self.current_interval = min_interval
+
+    def in_busy_hours(self) -> bool:
+        now = self.clock().time()
+        for start, end in self.busy_hours:
+            if start <= end:
+                if start <= now < end:
+                    return True
+            elif now >= start or now < end:
+                # Range wraps around midnight, e.g. 22:00-02:00
+                return True
+        return False
+
+    def record_poll(self, event_count: int) -> float:
+        if event_count > 0 or self.in_busy_hours():
+            self.current_interval = self.min_interval
+        else:
+            self.current_interval = min(self.max_interval, self.current_interval * self.backoff_factor)
+        return self.current_interval
+
+class AdaptivePoller:
+    """Runs a polling job on a schedule job whose interval follows an AdaptivePollingInterval."""
+
+    def __init__(self, polling_job: Callable[[], Optional[int]], interval: AdaptivePollingInterval, device_label: str = "all"):
+        self.polling_job = polling_job
+        self.interval = interval
+        self.job: Optional[schedule.Job] = None
+        self._interval_gauge = metrics.POLLING_INTERVAL.labels(device=device_label)
+
+    @property
+    def current_interval(self) -> float:
+        return self.interval.current_interval
+
+    def schedule(self) -> schedule.Job:
+        self._interval_gauge.set(self.interval.current_interval)
+        self.job = schedule.every(self.interval.current_interval).seconds.do(self.run)
+        return self.job
+
+    def run(self):
+        previous_interval = self.interval.current_interval
+        event_count = self.polling_job() or 0
+        new_interval = self.interval.record_poll(event_count)
+
+        self._interval_gauge.set(new_interval)
+        if new_interval != previous_interval:
+            log.info(f"Polling interval changed from {previous_interval:g}s to {new_interval:g}s")
+
+        # schedule computes the next run from job.interval right after this returns
+        if self.job is not None:
+            self.job.interval = new_interval
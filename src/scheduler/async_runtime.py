@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import signal
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import paho.mqtt.client as mqtt
+
+from core.models import DeviceDefinition
+from metrics import bridge as metrics
+from mqtt import handler as mqtt_handler
+from scheduler.adaptive import AdaptivePollingInterval
+from scheduler.device_worker import DeviceWorker
+from scheduler.jobs import JobScheduler
+from zkt.handler import ZKTConnection
+
+log = logging.getLogger(__name__)
+
+MQTT_MISC_INTERVAL_SECONDS = 1.0
+MQTT_RECONNECT_MIN_DELAY_SECONDS = 1.0
+MQTT_RECONNECT_MAX_DELAY_SECONDS = 120.0
+TIME_UPDATE_INTERVAL_SECONDS = 24 * 60 * 60
+SHUTDOWN_GRACE_SECONDS = 5.0
+
+class AsyncMqttLoop:
+    """Drives a paho client from an asyncio event loop instead of paho's network thread.
+
+    The broker socket is watched with add_reader/add_writer, keepalive and reconnects
+    are handled by a task calling loop_misc. Paho may invoke the socket callbacks from
+    other threads (publishes from executor threads), those loop changes are scheduled
+    with call_soon_threadsafe. Must be created on the event loop's thread.
+    """
+
+    def __init__(self, client: mqtt.Client, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self.loop = loop
+        self._task: Optional[asyncio.Task] = None
+        self._loop_thread_id = threading.get_ident()
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def start(self, stop: asyncio.Event) -> asyncio.Task:
+        self._task = self.loop.create_task(self._run(stop), name="mqtt_loop")
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            mqtt_handler.publish_availability(self.client, False)
+            self.client.disconnect()
+            # Nothing watches the socket any more, send the DISCONNECT packet right away
+            self.client.loop_write()
+        except Exception as e:
+            log.debug(f"Error disconnecting from MQTT broker: {e}")
+        # Let the queued reader/writer removals run
+        await asyncio.sleep(0)
+
+    async def _run(self, stop: asyncio.Event):
+        delay = MQTT_RECONNECT_MIN_DELAY_SECONDS
+        while not stop.is_set():
+            if self.client.socket() is None:
+                try:
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                except Exception as e:
+                    log.warning(f"MQTT connection to broker failed: {e}, retrying in {delay:g}s")
+                    if await wait_for_stop(stop, delay):
+                        return
+                    delay = min(MQTT_RECONNECT_MAX_DELAY_SECONDS, delay * 2)
+                    continue
+            elif self.client.is_connected():
+                delay = MQTT_RECONNECT_MIN_DELAY_SECONDS
+
+            self.client.loop_misc()
+            if await wait_for_stop(stop, MQTT_MISC_INTERVAL_SECONDS):
+                return
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call_in_loop(self._watch, sock, self.loop.add_reader, self._on_readable)
+
+    def _on_socket_close(self, client, userdata, sock):
+        # The socket is closed right after this callback, so the fd is captured now
+        self._call_in_loop(self.loop.remove_reader, sock.fileno())
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call_in_loop(self._watch, sock, self.loop.add_writer, self._on_writable)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.remove_writer, sock.fileno())
+
+    def _call_in_loop(self, callback: Callable[..., Any], *args):
+        if self._loop_thread_id == threading.get_ident():
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _watch(self, sock, add: Callable[..., Any], callback: Callable[[], Any]):
+        # A deferred registration may arrive after paho has already closed or replaced the socket
+        if self.client.socket() is sock:
+            add(sock.fileno(), callback)
+
+    def _on_readable(self):
+        self.client.loop_read()
+
+    def _on_writable(self):
+        self.client.loop_write()
+
+async def wait_for_stop(stop: asyncio.Event, seconds: float) -> bool:
+    """Sleeps for the given time, returns True right away once stop is set."""
+    if seconds <= 0:
+        return stop.is_set()
+    try:
+        await asyncio.wait_for(stop.wait(), seconds)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+class AsyncBridgeRuntime:
+    """Runs the bridge on an asyncio event loop as an alternative to the schedule loop in main.
+
+    Every panel gets its own polling and time update tasks. Blocking C3 calls run on the
+    panel's DeviceWorker, so calls on one connection never overlap and commands go first,
+    and are awaited with a timeout so a hanging panel only delays its own tasks.
+    """
+
+    def __init__(
+        self,
+        mqtt_client: mqtt.Client,
+        call_timeout: float,
+        interval_factory: Callable[[], AdaptivePollingInterval],
+        stagger_seconds: float = 0.0,
+        connect_timeout: float = 15.0,
+        state_flush_interval: float = 0.0,
+        handle_signals: bool = True
+    ):
+        self.mqtt_client = mqtt_client
+        self.call_timeout = call_timeout
+        self.interval_factory = interval_factory
+        self.stagger_seconds = max(0.0, stagger_seconds)
+        self.connect_timeout = connect_timeout
+        self.state_flush_interval = state_flush_interval
+        self.handle_signals = handle_signals
+
+        self.job_schedulers: List[JobScheduler] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._periodic_jobs: List[Tuple[float, Callable[[], Any], str]] = []
+        self._executors: Dict[int, DeviceWorker] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def every(self, interval: float, job: Callable[[], Any], name: str):
+        """Registers a blocking maintenance job that runs on the default executor every interval seconds."""
+        self._periodic_jobs.append((interval, job, name))
+
+    def request_stop(self):
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    def request_resync(self):
+        for job_scheduler in self.job_schedulers:
+            job_scheduler.request_resync()
+
+    async def run_blocking(self, func: Callable[..., Any], *args, executor: Optional[Executor] = None, timeout: Optional[float] = None) -> Any:
+        return await asyncio.wait_for(self.loop.run_in_executor(executor, func, *args), timeout)
+
+    async def run(
+        self,
+        devices: List[Tuple[ZKTConnection, Union[DeviceDefinition, "Future[DeviceDefinition]"]]],
+        start_device: Callable[[ZKTConnection, DeviceDefinition], JobScheduler],
+        on_started: Optional[Callable[[], None]] = None
+    ) -> int:
+        """Connects to the broker, starts the devices and runs their tasks until a stop is requested.
+
+        A definition may still be pending, the broker connects meanwhile. start_device is called on
+        the device's executor once both MQTT and the definition are ready and must publish discovery
+        and initial states, the device's tasks start right after. on_started is called once every
+        device was started. Returns the process exit code.
+        """
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        connected = asyncio.Event()
+        connect_listener = lambda: self.loop.call_soon_threadsafe(connected.set)
+        mqtt_handler.add_connect_listener(connect_listener)
+
+        if self.handle_signals:
+            self._install_signal_handlers()
+
+        mqtt_loop = AsyncMqttLoop(self.mqtt_client, self.loop)
+        mqtt_loop.start(self._stop)
+        self._tasks = []
+        starts = [
+            self.loop.create_task(self._start_device(connection, definition, start_device, connected))
+            for connection, definition in devices
+        ]
+        try:
+            if not await self._wait_for_connection(connected):
+                return 1
+            log.info("MQTT Connected.")
+            for interval, job, name in self._periodic_jobs:
+                self._tasks.append(self.loop.create_task(self._periodic(interval, job, name), name=name))
+
+            # Every device runs its tasks as soon as it started, a panel answering late holds up no other
+            starting = asyncio.gather(*starts, return_exceptions=True)
+            stop_waiter = self.loop.create_task(self._stop.wait())
+            await asyncio.wait({starting, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+            stop_waiter.cancel()
+            if starting.done():
+                for (connection, _), result in zip(devices, starting.result()):
+                    if isinstance(result, BaseException):
+                        log.error(f"Failed to start device {connection.address}: {result}")
+                if not self.job_schedulers:
+                    log.critical("No device could be started. Exiting.")
+                    return 1
+                if on_started is not None:
+                    on_started()
+                log.info(f"Running {len(self.job_schedulers)} device(s) on the asyncio runtime. Ctrl+C to exit.")
+                await self._stop.wait()
+            log.info("Shutting down...")
+            return 0
+        finally:
+            tasks = starts + self._tasks
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._shutdown_executors()
+            await self._flush_raw_events()
+            await mqtt_loop.stop()
+            mqtt_handler.connect_listeners.remove(connect_listener)
+            if self.handle_signals:
+                self._remove_signal_handlers()
+
+    async def _wait_for_connection(self, connected: asyncio.Event) -> bool:
+        stop_waiter = self.loop.create_task(self._stop.wait())
+        connect_waiter = self.loop.create_task(connected.wait())
+        try:
+            await asyncio.wait({stop_waiter, connect_waiter}, timeout=self.connect_timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_waiter.cancel()
+            connect_waiter.cancel()
+
+        if connected.is_set():
+            return True
+        if not self._stop.is_set():
+            log.critical(f"MQTT connection timeout after {self.connect_timeout:g} seconds")
+        return False
+
+    async def _start_device(
+        self,
+        connection: ZKTConnection,
+        definition: Union[DeviceDefinition, "Future[DeviceDefinition]"],
+        start_device: Callable[[ZKTConnection, DeviceDefinition], JobScheduler],
+        connected: asyncio.Event
+    ) -> JobScheduler:
+        if isinstance(definition, Future):
+            definition = await asyncio.wrap_future(definition)
+        await connected.wait()
+        executor = DeviceWorker(f"zkt_{definition.serial_number}")
+        try:
+            job_scheduler = await self.run_blocking(start_device, connection, definition, executor=executor)
+        except BaseException:
+            executor.shutdown(wait=False)
+            raise
+        self._executors[id(job_scheduler)] = executor
+        self.job_schedulers.append(job_scheduler)
+        self._start_device_tasks(job_scheduler, len(self.job_schedulers) - 1)
+        return job_scheduler
+
+    def _start_device_tasks(self, job_scheduler: JobScheduler, index: int):
+        self._tasks.append(self.loop.create_task(
+            self._polling_loop(job_scheduler, index * self.stagger_seconds), name=f"poll_{index}"
+        ))
+        self._tasks.append(self.loop.create_task(self._time_update_loop(job_scheduler), name=f"time_update_{index}"))
+        if self.state_flush_interval > 0:
+            self._tasks.append(self.loop.create_task(
+                self._periodic(self.state_flush_interval, job_scheduler.state_manager.flush, "State flush"),
+                name=f"state_flush_{index}"
+            ))
+
+    async def _call_device(self, job_scheduler: JobScheduler, job: Callable[[], Any], job_name: str) -> Any:
+        address = job_scheduler.connection.address if job_scheduler.connection is not None else "device"
+        try:
+            return await self.run_blocking(job, executor=self._executors.get(id(job_scheduler)), timeout=self.call_timeout)
+        except asyncio.TimeoutError:
+            # The call cannot be interrupted, it keeps the device executor busy until the panel answers
+            log.error(f"{job_name} job for {address} timed out after {self.call_timeout:g}s")
+        except Exception as e:
+            log.error(f"{job_name} job for {address} failed: {e}")
+        return None
+
+    async def _polling_loop(self, job_scheduler: JobScheduler, offset: float):
+        interval = self.interval_factory()
+        interval_gauge = metrics.POLLING_INTERVAL.labels(device=job_scheduler.device_label)
+        interval_gauge.set(interval.current_interval)
+        if await wait_for_stop(self._stop, offset):
+            return
+        while not self._stop.is_set():
+            previous_interval = interval.current_interval
+            event_count = await self._call_device(job_scheduler, job_scheduler.polling_job, "Polling")
+            new_interval = interval.record_poll(event_count or 0)
+            interval_gauge.set(new_interval)
+            if new_interval != previous_interval:
+                log.info(f"Polling interval changed from {previous_interval:g}s to {new_interval:g}s")
+            if await wait_for_stop(self._stop, new_interval):
+                return
+
+    async def _time_update_loop(self, job_scheduler: JobScheduler):
+        while not await wait_for_stop(self._stop, TIME_UPDATE_INTERVAL_SECONDS):
+            await self._call_device(job_scheduler, job_scheduler.time_update_job, "Time update")
+
+    async def _periodic(self, interval: float, job: Callable[[], Any], name: str):
+        while not await wait_for_stop(self._stop, interval):
+            try:
+                await self.run_blocking(job)
+            except Exception as e:
+                log.error(f"{name} job failed: {e}")
+
+    async def _flush_raw_events(self):
+        # Batched raw events go out on the open connection, before the bridge announces itself offline
+        for job_scheduler in self.job_schedulers:
+            try:
+                await self.run_blocking(job_scheduler.publisher.flush_raw_events, True)
+            except Exception as e:
+                log.error(f"Could not flush the raw events of {job_scheduler.device_label}: {e}")
+
+    async def _shutdown_executors(self):
+        executors = list(self._executors.values())
+        self._executors.clear()
+
+        def shutdown_all():
+            for executor in executors:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        try:
+            # Give device calls that are already running a moment to finish before state is closed
+            await asyncio.wait_for(self.loop.run_in_executor(None, shutdown_all), SHUTDOWN_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            log.warning(f"Device calls still running after {SHUTDOWN_GRACE_SECONDS:g}s, shutting down anyway")
+
+    def _install_signal_handlers(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self._handle_stop_signal, signum)
+        if hasattr(signal, "SIGHUP"):
+            self.loop.add_signal_handler(signal.SIGHUP, self._handle_resync_signal, signal.SIGHUP)
+
+    def _remove_signal_handlers(self):
+        for signum in (signal.SIGINT, signal.SIGTERM, getattr(signal, "SIGHUP", None)):
+            if signum is not None:
+                self.loop.remove_signal_handler(signum)
+
+    def _handle_stop_signal(self, signum: int):
+        log.info(f"Received signal {signum}, initiating shutdown")
+        self._stop.set()
+
+    def _handle_resync_signal(self, signum: int):
+        log.info(f"Received signal {signum}, requesting full state resync")
+        self.request_resync()
@@ -0,0 +1,93 @@
+import itertools
+import logging
+import queue
+import sys
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Optional
+
+log = logging.getLogger(__name__)
+
+PRIORITY_COMMAND = 0
+PRIORITY_DEFAULT = 1
+_PRIORITY_STOP = sys.maxsize
+
+_current = threading.local()
+
+class DeviceWorker(Executor):
+    """Single thread that owns a panel's connection and runs its device calls one at a time.
+
+    Calls are served by priority, then in submission order: a command submitted while a poll
+    runs goes next, ahead of polls and time updates that are already queued. A running call is
+    never interrupted, C3 calls cannot be.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def current() -> Optional["DeviceWorker"]:
+        """The worker running the calling thread, if any."""
+        return getattr(_current, "worker", None)
+
+    def owns_current_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, fn: Callable[..., Any], /, *args, **kwargs) -> Future:
+        return self.submit_with_priority(PRIORITY_DEFAULT, fn, *args, **kwargs)
+
+    def submit_with_priority(self, priority: int, fn: Callable[..., Any], /, *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(f"Device worker {self.name} is shut down")
+            self._queue.put((priority, next(self._sequence), future, fn, args, kwargs))
+        return future
+
+    def run(self, fn: Callable[..., Any], priority: int = PRIORITY_DEFAULT) -> Any:
+        """Runs fn on the worker and waits for its result, directly when called from the worker itself."""
+        if self.owns_current_thread():
+            return fn()
+        return self.submit_with_priority(priority, fn).result()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            if not self._shutdown:
+                self._shutdown = True
+                if cancel_futures:
+                    self._cancel_pending()
+                self._queue.put((_PRIORITY_STOP, next(self._sequence), None, None, (), {}))
+        if wait and not self.owns_current_thread():
+            self._thread.join()
+
+    def _cancel_pending(self):
+        while True:
+            try:
+                _, _, future, _, _, _ = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if future is not None:
+                future.cancel()
+
+    def _run(self):
+        _current.worker = self
+        while True:
+            _, _, future, fn, args, kwargs = self._queue.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
@@ -1,68 +1,340 @@
 import logging
+import threading
+import time
+from collections import Counter
 
+import settings
 from zkt import handler as zkt_handler
-from core.event_processor import process_event, get_related_entity_states
+from core.event_processor import process_events
 from mqtt.publisher import MQTTPublisher
 from core.state_manager import StateManager
 from core.models import EntityState
+from core.event_archive import EventArchive
+from core.dedup import DedupIndex, event_key, event_seconds
+from core.transaction_cursor import EventPosition, OccurrenceCounter, TransactionCursor
+from metrics import bridge as metrics
+from scheduler import profiling
+from scheduler.device_worker import PRIORITY_COMMAND, DeviceWorker
+from zkt.commands import DeviceCommand, parse_command
+from c3.consts import ControlOutputAddress
 from c3.rtlog import EventRecord
 from datetime import datetime
+from typing import Collection, Dict, List, Optional
 import pytz
 
 log = logging.getLogger(__name__)
 
 class JobScheduler:   
-    def __init__(self, publisher: MQTTPublisher, state_manager: StateManager):
+    def __init__(
+        self,
+        publisher: MQTTPublisher,
+        state_manager: StateManager,
+        connection: Optional[zkt_handler.ZKTConnection] = None,
+        event_archive: Optional[EventArchive] = None,
+        transaction_cursor: Optional[TransactionCursor] = None,
+        dedup_index: Optional[DedupIndex] = None
+    ):
         self.publisher = publisher
         self.state_manager = state_manager
+        self.connection = connection
+        self.event_archive = event_archive
+        self.resync_requested = False
+        self.device_label = connection.address if connection is not None else f"{settings.ZKT_DEVICE_IP}:{settings.ZKT_DEVICE_PORT}"
+        self.slow_cycle_seconds = settings.SLOW_CYCLE_THRESHOLD_SECONDS
+        # Seconds spent per stage of the last cycle: backfill, device_read, processing, state_save, publish, archive
+        self.stage_times = {}
+        self.transaction_cursor = transaction_cursor
+        self.dedup_index = dedup_index
+        self._duplicates = metrics.DUPLICATE_EVENTS.labels(device=self.device_label)
+        self.backfill_chunk_size = max(1, settings.BACKFILL_CHUNK_SIZE)
+        self.backfill_requested = transaction_cursor is not None
+        # The whole table is downloaded on the device's thread, a flaky link must not do that every cycle
+        self.backfill_min_interval = settings.BACKFILL_MIN_INTERVAL_SECONDS
+        self._last_backfill_attempt: Optional[float] = None
+        self._realtime_positions = OccurrenceCounter()
+        # Realtime events taken while a backfill is pending, applied to the cursor once it succeeded
+        self._pending_positions: List[EventPosition] = []
+        # Polls after a backfill whose events are checked against the cursor
+        self._handoff_cycles = 0
+        # Owns the device connection once attached, device jobs and commands then run on its thread
+        self.worker: Optional[DeviceWorker] = None
+        # Lock entity -> when the panel ends the timed unlock of that door
+        self._relock_deadlines: Dict[str, float] = {}
     
-    def polling_job(self):
+    def polling_job(self) -> Optional[int]:
+        if self.worker is not None and not self.worker.owns_current_thread():
+            return self.worker.run(self.polling_job)
+        profiler = profiling.profiler
+        if profiler is not None and profiler.pending:
+            return profiler.run_cycle(self.device_label, self._polling_cycle)
+        return self._polling_cycle()
+
+    def _polling_cycle(self) -> Optional[int]:
         log.info("--- Running Polling Job ---")
-        raw_events = zkt_handler.poll_zkteco_changes()
+        if self.resync_requested:
+            self.resync()
+
+        started = time.perf_counter()
+        self.stage_times = {}
+        raw_events = self._poll_device()
+        self.stage_times["device_read"] = time.perf_counter() - started
         
         if raw_events is None:
             log.warning("No events received or error occurred during polling")
-            return
+            if self.transaction_cursor is not None:
+                # Whatever happens while the panel is unreachable is taken from its table once it is back
+                self.backfill_requested = True
+            self._log_slow_cycle(started)
+            return None
+
+        if self.transaction_cursor is not None:
+            raw_events = self._take_new_events(raw_events)
+        if self.dedup_index is not None:
+            # Numbered within this poll only: an event the panel sends again in a later poll keeps its key
+            batch_positions = OccurrenceCounter()
+            raw_events = self._drop_duplicates(raw_events, [batch_positions.position(event) for event in raw_events])
 
-        log.info(f"Found {len(raw_events)} new event(s)")
-        for raw_event in raw_events:
-            self._process_single_event(raw_event)
+        log.info("Found %d new event(s)", len(raw_events))
+        if raw_events:
+            self._process_events(raw_events)
+        self.publisher.flush_raw_events()
             
+        self._log_slow_cycle(started, len(raw_events))
         log.info("--- Polling Job Complete ---")
+        return len(raw_events)
+
+    def _log_slow_cycle(self, started: float, event_count: int = 0):
+        duration = time.perf_counter() - started
+        if 0 < self.slow_cycle_seconds <= duration:
+            spans = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.stage_times.items())
+            log.warning("Slow polling cycle on %s: %.3fs for %d event(s) (%s)", self.device_label, duration, event_count, spans)
 
     def time_update_job(self):
+        if self.worker is not None and not self.worker.owns_current_thread():
+            return self.worker.run(self.time_update_job)
         log.info("--- Updating DateTime ---")
         now = datetime.now()
         local_dt = now.astimezone(pytz.utc)
 
-        zkt_handler.update_time(local_dt)
+        if self.connection is not None:
+            self.connection.update_time(local_dt)
+        else:
+            zkt_handler.update_time(local_dt)
 
-    def _process_single_event(self, raw_event: EventRecord):
-        self._update_state(raw_event)
+    def _poll_device(self):
+        if self.connection is not None:
+            return self.connection.poll_zkteco_changes()
+        return zkt_handler.poll_zkteco_changes()
 
-        last_event = self.state_manager.get_last_event()
-        all_states = self.state_manager.get_states()
-        entity_states = [
-            EntityState(entity_id=entity_id, state=state) for entity_id, state in all_states.items()
-        ]
+    def _get_connection(self) -> zkt_handler.ZKTConnection:
+        return self.connection if self.connection is not None else zkt_handler.get_default_connection()
+
+    def _take_new_events(self, raw_events: List[EventRecord]) -> List[EventRecord]:
+        cursor = self.transaction_cursor
+        # Right after a backfill the poll may deliver events the table already had, those are dropped
+        check_cursor = self.backfill_requested or self._handoff_cycles > 0
+        self._handoff_cycles = 0
+        new_events = []
+        new_positions = []
+        for event in raw_events:
+            position = self._realtime_positions.position(event)
+            if position is not None:
+                if check_cursor and cursor.covers(position):
+                    continue
+                new_positions.append(position)
+            new_events.append(event)
+        if len(new_events) < len(raw_events):
+            log.info("Skipped %d realtime event(s) already taken from the transaction table", len(raw_events) - len(new_events))
+
+        if self.backfill_requested:
+            # Realtime events are handled as such, the backfill only fills the gap around them. Until it
+            # succeeds they must not move the cursor past that gap.
+            self._pending_positions.extend(new_positions)
+            if not self._backfill_due():
+                return new_events
+            started = time.perf_counter()
+            backfilled = self.backfill(set(self._pending_positions))
+            self.stage_times["backfill"] = time.perf_counter() - started
+            if backfilled is None:
+                return new_events
+            new_positions, self._pending_positions = self._pending_positions, []
+
+        for position in new_positions:
+            cursor.advance(position)
+        cursor.save()
+        return new_events
+
+    def _backfill_due(self) -> bool:
+        now = time.monotonic()
+        if self._last_backfill_attempt is not None and now - self._last_backfill_attempt < self.backfill_min_interval:
+            return False
+        self._last_backfill_attempt = now
+        return True
+
+    def backfill(self, skip: Collection[EventPosition] = ()) -> Optional[int]:
+        """Processes the events of the panel's transaction table that are newer than the cursor as historical events."""
+        cursor = self.transaction_cursor
+        records = self._get_connection().fetch_transactions()
+        if records is None:
+            log.warning(f"Backfill of {self.device_label} failed, retrying next cycle")
+            return None
+        self.backfill_requested = False
+        self._handoff_cycles = 1
+
+        positions = OccurrenceCounter()
+        if not cursor.initialized:
+            # Without a cursor the stored history predates the bridge, only remember where it ends
+            for record in records:
+                position = positions.position(zkt_handler.transaction_to_event(record))
+                if position is not None:
+                    cursor.advance(position)
+            cursor.save()
+            log.info(f"Transaction cursor of {self.device_label} starts after {len(records)} stored event(s)")
+            return 0
+
+        # Skip older records before converting them, only records from the cursor's second on are counted
+        oldest = zkt_handler.transaction_time_value(cursor.time)
+        backfilled = 0
+        chunk: List[EventRecord] = []
+        chunk_positions: List[EventPosition] = []
+        for record in records:
+            if record.get("Time_second", 0) < oldest:
+                continue
+            event = zkt_handler.transaction_to_event(record)
+            position = positions.position(event)
+            if position is None or position in skip or cursor.covers(position):
+                continue
+            chunk.append(event)
+            chunk_positions.append(position)
+            if len(chunk) >= self.backfill_chunk_size:
+                backfilled += self._process_historical_events(chunk, chunk_positions)
+                chunk, chunk_positions = [], []
+        if chunk:
+            backfilled += self._process_historical_events(chunk, chunk_positions)
+
+        metrics.BACKFILL_EVENTS.labels(device=self.device_label).inc(backfilled)
+        log.info(f"Backfilled {backfilled} historical event(s) from {self.device_label}")
+        return backfilled
+
+    def _drop_duplicates(
+        self, raw_events: List[EventRecord], positions: List[Optional[EventPosition]]
+    ) -> List[EventRecord]:
+        serial_number = self.publisher.serial_number
+        unique = []
+        for event, position in zip(raw_events, positions):
+            # Door/alarm status records have no position, they are repeated by design and always kept
+            seconds = event_seconds(event) if position is not None else None
+            if seconds is None or self.dedup_index.add(serial_number, event_key(serial_number, position), seconds):
+                unique.append(event)
+        duplicates = len(raw_events) - len(unique)
+        if duplicates:
+            self._duplicates.inc(duplicates)
+            log.info("Dropped %d duplicate event(s) from %s", duplicates, self.device_label)
+        return unique
+
+    def _process_historical_events(self, events: List[EventRecord], positions: List[EventPosition]) -> int:
+        if self.dedup_index is not None:
+            events = self._drop_duplicates(events, positions)
+        batch = process_events(events)
+        self.publisher.publish_historical_events(batch.processed_events)
+        if self.event_archive is not None:
+            self.event_archive.add_events(self.publisher.serial_number, batch.processed_events)
+        for position in positions:
+            self.transaction_cursor.advance(position)
+        # Saved per chunk, an interrupted backfill resumes after the last published chunk
+        self.transaction_cursor.save()
+        return len(batch.processed_events)
 
-        self.publisher.publish_entity_states(entity_states)
-        if last_event:
-            self.publisher.publish_raw_event(last_event)
+    def handle_command(self, object_id: str, payload: str):
+        """Queues an output command received over MQTT, ahead of the device jobs waiting on the worker."""
+        received = time.perf_counter()
+        command = parse_command(object_id, payload)
+        if command is None:
+            log.warning(f"Ignoring unknown command for {object_id} on {self.device_label}: {payload!r}")
+            metrics.COMMANDS.labels(device=self.device_label, result="invalid").inc()
+            return
+        if self.worker is None:
+            self.run_command(command, received)
+        else:
+            self.worker.submit_with_priority(PRIORITY_COMMAND, self.run_command, command, received)
+
+    def run_command(self, command: DeviceCommand, received: float) -> bool:
+        executed = self._get_connection().execute_command(command)
+        metrics.COMMANDS.labels(device=self.device_label, result="ok" if executed else "failed").inc()
+        if executed:
+            if command.address == ControlOutputAddress.DOOR_OUTPUT:
+                self._schedule_relock(command)
+            # Poll right away, the panel reports the new output state as events
+            self.polling_job()
+            latency = time.perf_counter() - received
+            metrics.COMMAND_LATENCY.labels(device=self.device_label).observe(latency)
+            log.info("Command %s on %s confirmed in %.0fms", command.object_id, self.device_label, latency * 1000)
+        return executed
+
+    def _schedule_relock(self, command: DeviceCommand):
+        if not command.timed_unlock:
+            self._relock_deadlines.pop(command.lock_entity_id, None)
+            return
+        self._relock_deadlines[command.lock_entity_id] = time.monotonic() + command.duration
+        timer = threading.Timer(command.duration, self._submit_relock, args=(command.lock_entity_id,))
+        timer.daemon = True
+        timer.start()
 
-    def _update_state(self, raw_event: EventRecord):
+    def _submit_relock(self, entity_id: str):
+        if self.worker is None:
+            self.relock(entity_id)
+            return
         try:
-            processed_event = process_event(raw_event)
-            if not processed_event:
-                log.warning(f"Failed to process event: {raw_event}")
-                return
-
-            self.state_manager.update_last_event(processed_event)
-            related_states = get_related_entity_states(processed_event)
-            for state in related_states:
-                self.state_manager.update_state(state.entity_id, state.state)
-        except Exception as e:
-            log.exception(f"Error processing event: {e}")
+            self.worker.submit(self.relock, entity_id)
+        except RuntimeError:
+            # Shutting down, the lock state is republished on the next start
+            pass
+
+    def relock(self, entity_id: str):
+        """Shows the lock closed again once the panel ended a timed unlock, it reports no event for that."""
+        deadline = self._relock_deadlines.get(entity_id)
+        if deadline is None or time.monotonic() < deadline:
+            # Locked by command meanwhile, or a later unlock extended it and relocks itself
+            return
+        del self._relock_deadlines[entity_id]
+        if self.state_manager.update_states({entity_id: "OFF"}):
+            self.publisher.publish_entity_states([EntityState(entity_id=entity_id, state="OFF")])
+
+    def request_resync(self):
+        # Called from other threads (MQTT reconnect, signals), the snapshot is published by the next poll.
+        self.resync_requested = True
+
+    def resync(self):
+        self.resync_requested = False
+        states = self.state_manager.get_entity_states()
+        log.info(f"Resyncing full state snapshot of {len(states)} entities")
+        self.publisher.publish_entity_states(states)
+
+    def _process_events(self, raw_events: List[EventRecord]):
+        started = time.perf_counter()
+        batch = process_events(raw_events)
+        for event_type, count in Counter(event.event_type for event in batch.processed_events).items():
+            metrics.EVENTS.labels(device=self.device_label, event_type=event_type.value).inc(count)
+        processed = time.perf_counter()
+
+        if batch.processed_events:
+            self.state_manager.update_last_event(batch.processed_events[-1])
+        changed_entity_ids = self.state_manager.update_states(batch.entity_states)
+        saved = time.perf_counter()
+
+        changed_states = [
+            EntityState(entity_id=entity_id, state=batch.entity_states[entity_id]) for entity_id in changed_entity_ids
+        ]
+        self.publisher.publish_batch(changed_states, batch)
+
+        published = time.perf_counter()
+
+        self.stage_times["processing"] = processed - started
+        self.stage_times["state_save"] = saved - processed
+        self.stage_times["publish"] = published - saved
+        if self.event_archive is not None:
+            self.event_archive.add_events(self.publisher.serial_number, batch.processed_events)
+            self.stage_times["archive"] = time.perf_counter() - published
     
     def initialize_states(self, device_definition):
         log.info("--- Initializing Entity States ---")
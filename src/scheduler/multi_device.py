@@ -0,0 +1,65 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional
+
+from scheduler.jobs import JobScheduler
+
+log = logging.getLogger(__name__)
+
+class MultiDeviceScheduler:
+    """Runs the jobs of one JobScheduler per panel concurrently on a bounded worker pool.
+
+    The list may grow while running, panels that answer late are appended to it. device_count
+    sizes the pool for the number of panels it will hold, by default its current length.
+    """
+
+    def __init__(
+        self,
+        schedulers: List[JobScheduler],
+        max_workers: int = 8,
+        stagger_seconds: float = 0.0,
+        device_count: Optional[int] = None
+    ):
+        self.schedulers = schedulers
+        device_count = len(schedulers) if device_count is None else device_count
+        self.max_workers = max(1, min(max_workers, device_count or 1))
+        self.stagger_seconds = max(0.0, stagger_seconds)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="zkt_poll")
+
+    def polling_job(self) -> int:
+        results = self._run_all(lambda job_scheduler: job_scheduler.polling_job, "Polling")
+        return sum(result for result in results if result)
+
+    def time_update_job(self):
+        self._run_all(lambda job_scheduler: job_scheduler.time_update_job, "Time update")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def _run_all(self, job_getter: Callable[[JobScheduler], Callable[[], Any]], job_name: str) -> List[Any]:
+        started = time.monotonic()
+        futures = []
+        for index, job_scheduler in enumerate(list(self.schedulers)):
+            # Only the first wave needs an explicit offset, later submissions wait for a free worker anyway.
+            offset = index * self.stagger_seconds if index < self.max_workers else 0.0
+            futures.append(self.executor.submit(self._run_one, job_getter(job_scheduler), offset))
+
+        wait(futures)
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is not None:
+                log.error(f"{job_name} job failed: {error}")
+                results.append(None)
+            else:
+                results.append(future.result())
+
+        log.info(f"{job_name} cycle for {len(futures)} device(s) took {time.monotonic() - started:.2f}s")
+        return results
+
+    @staticmethod
+    def _run_one(job: Callable[[], Any], offset: float) -> Any:
+        if offset > 0:
+            time.sleep(offset)
+        return job()
@@ -0,0 +1,145 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+log = logging.getLogger(__name__)
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# Bounds a request, profiling slows every cycle down
+MAX_CYCLES = 100
+
+class CycleProfiler:
+    """Profiles the next N polling cycles on request, with cProfile and tracemalloc snapshot diffs.
+
+    Nothing is traced until a request arrives, the polling job only checks `pending`. Requests may come
+    from signal handlers, so `request` only assigns an attribute and the session starts on the next cycle.
+    """
+
+    def __init__(self, report_dir: str, memory_frames: int = 10):
+        self.report_dir = report_dir
+        self.memory_frames = max(1, memory_frames)
+        self._requested = 0
+        self._remaining = 0
+        self._lock = threading.Lock()
+        self._profile: Optional[cProfile.Profile] = None
+        self._started_tracing = False
+        self._first_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._memory_report: List[str] = []
+        self._cycles: List[str] = []
+        self._session_name = ""
+
+    @property
+    def pending(self) -> bool:
+        return self._requested > 0 or self._remaining > 0
+
+    def request(self, cycles: int):
+        if cycles > MAX_CYCLES:
+            log.warning(f"Profiling {MAX_CYCLES} cycles instead of the {cycles} requested")
+        self._requested = max(1, min(MAX_CYCLES, cycles))
+
+    def run_cycle(self, label: str, cycle: Callable[[], Any]) -> Any:
+        # cProfile cannot be enabled twice at once, concurrent cycles of other panels run unprofiled
+        if not self._lock.acquire(blocking=False):
+            return cycle()
+        try:
+            if self._remaining == 0:
+                if self._requested == 0:
+                    return cycle()
+                self._start_session()
+
+            started = time.perf_counter()
+            try:
+                self._profile.enable()
+            except ValueError as e:
+                log.error(f"Profiling aborted, another profiler is active: {e}")
+                self._end_session()
+                return cycle()
+            try:
+                return cycle()
+            finally:
+                self._profile.disable()
+                self._record_cycle(label, time.perf_counter() - started)
+                self._remaining -= 1
+                if self._remaining == 0:
+                    self._finish_session()
+        finally:
+            self._lock.release()
+
+    def _start_session(self):
+        self._remaining, self._requested = self._requested, 0
+        self._session_name = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self._profile = cProfile.Profile()
+        self._cycles = []
+        self._memory_report = []
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(self.memory_frames)
+        self._first_snapshot = self._last_snapshot = self._take_snapshot()
+        log.info(f"Profiling the next {self._remaining} polling cycle(s)")
+
+    def _record_cycle(self, label: str, duration: float):
+        snapshot = self._take_snapshot()
+        number = len(self._cycles) + 1
+        self._cycles.append(f"cycle {number} ({label}): {duration:.3f}s")
+        self._memory_report.append(f"--- cycle {number} ({label}), {duration:.3f}s, top allocation changes ---")
+        self._memory_report.extend(str(stat) for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:TOP_ALLOCATIONS])
+        self._last_snapshot = snapshot
+
+    def _finish_session(self):
+        try:
+            self._write_reports()
+        except OSError as e:
+            log.error(f"Could not write profiling reports to {self.report_dir}: {e}")
+        finally:
+            self._end_session()
+
+    def _end_session(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+        self._remaining = 0
+        self._profile = None
+        self._first_snapshot = self._last_snapshot = None
+
+    def _write_reports(self):
+        os.makedirs(self.report_dir, exist_ok=True)
+        base = os.path.join(self.report_dir, f"poll-{self._session_name}")
+
+        # Binary stats load into pstats, snakeviz or gprof2dot for a closer look
+        self._profile.dump_stats(f"{base}.prof")
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        with open(f"{base}-cpu.txt", "w") as f:
+            f.write("\n".join(self._cycles) + "\n\n")
+            f.write(stream.getvalue())
+
+        with open(f"{base}-memory.txt", "w") as f:
+            f.write("\n".join(self._memory_report) + "\n\n")
+            if self._first_snapshot is not None and self._last_snapshot is not None:
+                f.write(f"--- all {len(self._cycles)} cycle(s), top allocation changes ---\n")
+                for stat in self._last_snapshot.compare_to(self._first_snapshot, "lineno")[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+        log.info(f"Profiled {len(self._cycles)} polling cycle(s), reports written to {base}-cpu.txt and {base}-memory.txt")
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        # The profiler's own bookkeeping would otherwise dominate the diffs
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+        ))
+
+profiler: Optional[CycleProfiler] = None
+
+def configure_profiler(cycle_profiler: Optional[CycleProfiler]):
+    global profiler
+    profiler = cycle_profiler
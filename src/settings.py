@@ -4,21 +4,138 @@ ZKT_DEVICE_IP = os.getenv("DEVICE_IP", "192.168.1.201")
 ZKT_DEVICE_PORT = int(os.getenv("DEVICE_PORT", 4370))
 ZKT_DEVICE_PASSWORD = os.getenv("DEVICE_PASSWORD", "")
 ZKT_DEVICE_MODEL = os.getenv("DEVICE_MODEL", "C3")
+# Successful device calls prove the session is alive, a keepalive probe is only sent after this much idle time.
+DEVICE_KEEPALIVE_SECONDS = float(os.getenv("DEVICE_KEEPALIVE_SECONDS", 300))
+
+def parse_device_list(value: str) -> list:
+    """Parses DEVICES, a comma separated list of ip[:port[:password]] entries."""
+    devices = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        parts = entry.split(":", 2)
+        devices.append({
+            "ip": parts[0],
+            "port": int(parts[1]) if len(parts) > 1 and parts[1] else ZKT_DEVICE_PORT,
+            "password": parts[2] if len(parts) > 2 else ZKT_DEVICE_PASSWORD,
+        })
+    return devices
+
+# --- Multi-device Settings ---
+# When DEVICES is set the bridge drives every listed panel from one process,
+# otherwise it falls back to the single DEVICE_IP panel.
+ZKT_DEVICES = parse_device_list(os.getenv("DEVICES", ""))
+MULTI_DEVICE_MODE = len(ZKT_DEVICES) > 0
+DEVICE_POLL_WORKERS = int(os.getenv("DEVICE_POLL_WORKERS", 8))
+DEVICE_POLL_STAGGER_SECONDS = float(os.getenv("DEVICE_POLL_STAGGER_SECONDS", 0.2))
+# Timeout for a single blocking device job (poll, time update) in the asyncio runtime.
+DEVICE_CALL_TIMEOUT_SECONDS = float(os.getenv("DEVICE_CALL_TIMEOUT_SECONDS", 30))
 
 # --- MQTT Broker Settings ---
 MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "localhost")
 MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", 1883))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", None)
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", None)
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", None)
+MQTT_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MQTT_CONNECT_TIMEOUT_SECONDS", 15))
+# Retained "online"/"offline" of the bridge, "offline" is also the last will. Unset, it is
+# zkt_eco/<client id>/availability so bridges sharing a broker do not overwrite each other. Empty disables it.
+AVAILABILITY_TOPIC = os.getenv("AVAILABILITY_TOPIC", None)
+# Disk spool for messages that cannot be handed to the broker, replayed in order after reconnect.
+MQTT_SPOOL_ENABLED = os.getenv("MQTT_SPOOL_ENABLED", "false").lower() in ("1", "true", "yes")
+MQTT_SPOOL_DIR = os.getenv("MQTT_SPOOL_DIR", "mqtt_spool")
+MQTT_SPOOL_MAX_BYTES = int(os.getenv("MQTT_SPOOL_MAX_BYTES", 50 * 1024 * 1024))
+MQTT_SPOOL_SEGMENT_BYTES = int(os.getenv("MQTT_SPOOL_SEGMENT_BYTES", 1024 * 1024))
+MQTT_SPOOL_REPLAY_RATE = float(os.getenv("MQTT_SPOOL_REPLAY_RATE", 100))
 
 # --- Application Settings ---
 POLLING_INTERVAL_SECONDS = int(os.getenv("POLLING_INTERVAL_SECONDS", 60))
+# Adaptive polling polls at the minimum interval after events (and during busy hours)
+# and backs off exponentially towards the maximum interval while the panel is idle.
+POLLING_ADAPTIVE = os.getenv("POLLING_ADAPTIVE", "false").lower() in ("1", "true", "yes")
+POLLING_MIN_INTERVAL_SECONDS = float(os.getenv("POLLING_MIN_INTERVAL_SECONDS", 0.5))
+POLLING_MAX_INTERVAL_SECONDS = float(os.getenv("POLLING_MAX_INTERVAL_SECONDS", POLLING_INTERVAL_SECONDS))
+POLLING_BACKOFF_FACTOR = float(os.getenv("POLLING_BACKOFF_FACTOR", 2.0))
+POLLING_BUSY_HOURS = os.getenv("POLLING_BUSY_HOURS", "")
+# Keep reading the realtime log while it returns events, bounded by a time budget and batch count per poll.
+POLL_DRAIN_TIME_BUDGET_SECONDS = float(os.getenv("POLL_DRAIN_TIME_BUDGET_SECONDS", 5))
+POLL_DRAIN_MAX_BATCHES = int(os.getenv("POLL_DRAIN_MAX_BATCHES", 1000))
+# "schedule" runs jobs from a sleep loop, "asyncio" runs MQTT, device I/O and persistence as tasks on an event loop.
+RUNTIME = os.getenv("RUNTIME", "schedule").lower()
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "event" publishes every raw event on its own, "batch" publishes one NDJSON or JSON array message per poll or window, "both" does both.
+RAW_EVENT_MODE = os.getenv("RAW_EVENT_MODE", "event").lower()
+RAW_EVENT_BATCH_FORMAT = os.getenv("RAW_EVENT_BATCH_FORMAT", "ndjson").lower()
+RAW_EVENT_BATCH_MAX_EVENTS = int(os.getenv("RAW_EVENT_BATCH_MAX_EVENTS", 500))
+# 0 sends the events of every poll as one message, longer windows collect events across polls.
+RAW_EVENT_BATCH_WINDOW_SECONDS = float(os.getenv("RAW_EVENT_BATCH_WINDOW_SECONDS", 0))
+# "text" or "json" (one object per line), written from a background thread.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Per-module levels overriding LOG_LEVEL, e.g. "mqtt=DEBUG,zkt.handler=WARNING".
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Prometheus metrics endpoint on http://METRICS_BIND_ADDRESS:METRICS_PORT/metrics, 0 disables it.
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_BIND_ADDRESS = os.getenv("METRICS_BIND_ADDRESS", "127.0.0.1")
+# Polling cycles taking at least this long are logged with a per-stage breakdown, 0 disables it.
+SLOW_CYCLE_THRESHOLD_SECONDS = float(os.getenv("SLOW_CYCLE_THRESHOLD_SECONDS", 0))
+# On-demand profiling of the next PROFILING_CYCLES polling cycles, started by SIGUSR1 or a message on PROFILING_COMMAND_TOPIC.
+PROFILING_CYCLES = int(os.getenv("PROFILING_CYCLES", 10))
+PROFILING_REPORT_DIR = os.getenv("PROFILING_REPORT_DIR", "profiles")
+# Empty disables the MQTT trigger, any client allowed to publish on the topic can start profiling
+PROFILING_COMMAND_TOPIC = os.getenv("PROFILING_COMMAND_TOPIC", "")
+
+# Command topics for door locks and auxiliary outputs, with lock and button entities in Home Assistant.
+COMMANDS_ENABLED = os.getenv("COMMANDS_ENABLED", "false").lower() in ("1", "true", "yes")
+COMMAND_UNLOCK_SECONDS = float(os.getenv("COMMAND_UNLOCK_SECONDS", 5))
+COMMAND_AUX_OUTPUT_SECONDS = float(os.getenv("COMMAND_AUX_OUTPUT_SECONDS", 5))
 
 HA_DISCOVERY_PREFIX = os.getenv("HA_DISCOVERY_PREFIX", "homeassistant")
+# Home Assistant announces "online" here once it (re)started, the full state snapshot is then republished. Empty disables it.
+HA_STATUS_TOPIC = os.getenv("HA_STATUS_TOPIC", f"{HA_DISCOVERY_PREFIX}/status")
+# "entity" publishes one config per entity, "device" one device-based config per panel with abbreviated keys.
+HA_DISCOVERY_MODE = os.getenv("HA_DISCOVERY_MODE", "entity").lower()
+# Only publish discovery configs that changed since the last run, the hashes are kept in HA_DISCOVERY_CACHE_PATH.
+HA_DISCOVERY_CACHE_ENABLED = os.getenv("HA_DISCOVERY_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+HA_DISCOVERY_FORCE_REPUBLISH = os.getenv("HA_DISCOVERY_FORCE_REPUBLISH", "false").lower() in ("1", "true", "yes")
 
 HA_DEVICE_NAME = os.getenv("HA_DEVICE_NAME", f"ZKTeco {ZKT_DEVICE_MODEL} Controller")
 HA_DEVICE_MANUFACTURER = os.getenv("HA_DEVICE_MANUFACTURER", "ZKTeco")
 HA_DEVICE_SW_VERSION = "zkt_mqtt_bridge_2.5"
 TIME_ZONE = os.getenv("TIME_ZONE", "UTC")
 STATE_FILE_PATH = os.getenv("STATE_FILE_PATH", "state.json")
+# Last definition reported by every panel, the bridge starts from it without waiting for the panel.
+DEVICE_DEFINITION_CACHE_ENABLED = os.getenv("DEVICE_DEFINITION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+DEVICE_DEFINITION_CACHE_PATH = os.getenv(
+    "DEVICE_DEFINITION_CACHE_PATH", os.path.join(os.path.dirname(STATE_FILE_PATH), "device_definitions.json")
+)
+HA_DISCOVERY_CACHE_PATH = os.getenv(
+    "HA_DISCOVERY_CACHE_PATH", os.path.join(os.path.dirname(STATE_FILE_PATH), "discovery_cache.json")
+)
+# Seconds between write-behind flushes of the state file, 0 writes every change immediately.
+STATE_FLUSH_INTERVAL_SECONDS = float(os.getenv("STATE_FLUSH_INTERVAL_SECONDS", 5))
+# Seconds between full state snapshots. Entities expire in Home Assistant after 3 days without a message,
+# so this has to stay below that. 0 disables it.
+STATE_RESYNC_INTERVAL_SECONDS = float(os.getenv("STATE_RESYNC_INTERVAL_SECONDS", 3600))
+# Local SQLite archive of every processed event, exported with src/export_events.py.
+EVENT_ARCHIVE_ENABLED = os.getenv("EVENT_ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+EVENT_ARCHIVE_PATH = os.getenv(
+    "EVENT_ARCHIVE_PATH", os.path.join(os.path.dirname(STATE_FILE_PATH), "events.sqlite3")
+)
+# Archived events older than this are deleted, 0 keeps them forever.
+EVENT_ARCHIVE_RETENTION_DAYS = float(os.getenv("EVENT_ARCHIVE_RETENTION_DAYS", 365))
+# Events seen again within this many seconds (after reconnects, replays or backfills) are dropped, 0 disables it.
+DEDUP_HORIZON_SECONDS = float(os.getenv("DEDUP_HORIZON_SECONDS", 0))
+DEDUP_MAX_EVENTS = int(os.getenv("DEDUP_MAX_EVENTS", 100000))
+DEDUP_INDEX_PATH = os.getenv(
+    "DEDUP_INDEX_PATH", os.path.join(os.path.dirname(STATE_FILE_PATH), "dedup_index.json")
+)
+# Download events missed while the bridge was stopped or disconnected from the panel's stored transaction table.
+BACKFILL_ENABLED = os.getenv("BACKFILL_ENABLED", "false").lower() in ("1", "true", "yes")
+BACKFILL_CURSOR_PATH = os.getenv(
+    "BACKFILL_CURSOR_PATH", os.path.join(os.path.dirname(STATE_FILE_PATH), "transaction_cursor.json")
+)
+# Historical events are processed, published and archived this many at a time.
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", 500))
+BACKFILL_MIN_INTERVAL_SECONDS = float(os.getenv("BACKFILL_MIN_INTERVAL_SECONDS", 300))
@@ -0,0 +1,45 @@
+from typing import NamedTuple, Optional
+
+from c3.consts import ControlOutputAddress
+
+import settings
+
+# A duration of 255 keeps an output open until it is closed again, 0 closes it
+OUTPUT_KEEP_OPEN = 255
+
+class DeviceCommand(NamedTuple):
+    object_id: str
+    address: ControlOutputAddress
+    number: int
+    duration: int
+
+    @property
+    def timed_unlock(self) -> bool:
+        """A door unlock the panel ends by itself after duration seconds, without an event for it."""
+        return self.address == ControlOutputAddress.DOOR_OUTPUT and 0 < self.duration < OUTPUT_KEEP_OPEN
+
+    @property
+    def lock_entity_id(self) -> str:
+        return f"relay_lock_{self.number}"
+
+def _output_duration(seconds: float) -> int:
+    return max(1, min(OUTPUT_KEEP_OPEN - 1, int(round(seconds))))
+
+def parse_command(object_id: str, payload: str) -> Optional[DeviceCommand]:
+    """Maps a command topic payload to the output operation it requests, None for unknown payloads."""
+    kind, _, number = object_id.rpartition("_")
+    if not number.isdigit():
+        return None
+    action = payload.strip().upper()
+
+    if kind == "lock":
+        if action in ("UNLOCK", "OPEN"):
+            return DeviceCommand(object_id, ControlOutputAddress.DOOR_OUTPUT, int(number), _output_duration(settings.COMMAND_UNLOCK_SECONDS))
+        if action == "LOCK":
+            return DeviceCommand(object_id, ControlOutputAddress.DOOR_OUTPUT, int(number), 0)
+    elif kind == "aux_output":
+        if action in ("PRESS", "ON"):
+            return DeviceCommand(object_id, ControlOutputAddress.AUX_OUTPUT, int(number), _output_duration(settings.COMMAND_AUX_OUTPUT_SECONDS))
+        if action == "OFF":
+            return DeviceCommand(object_id, ControlOutputAddress.AUX_OUTPUT, int(number), 0)
+    return None
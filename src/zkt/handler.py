@@ -1,138 +1,318 @@
 import logging
-from typing import List, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
 from c3 import C3
-from c3.rtlog import EventRecord
+from c3.controldevice import ControlDeviceOutput
+from c3.consts import EventType as C3EventType, InOutDirection, VerificationMode
+from c3.rtlog import EventRecord, DoorAlarmStatusRecord
+from c3.utils import C3DateTime
 from datetime import datetime
 
 import settings
 from core.models import DeviceDefinition
+from core.timestamps import TIMESTAMP_FORMAT
+from metrics import bridge as metrics
+from zkt.commands import DeviceCommand
 
 log = logging.getLogger(__name__)
 
-panel: Optional[C3] = None
+T = TypeVar("T")
 
-def poll_zkteco_changes() -> Optional[List[EventRecord]]:
-    global panel
-    log.info(f"Polling ZKTeco device at {settings.ZKT_DEVICE_IP}:{settings.ZKT_DEVICE_PORT}...")
-    new_events: List[EventRecord] = []
-    
+# The panel's stored event log, the same records the realtime log delivers while the bridge is connected
+TRANSACTION_TABLE = "transaction"
+TRANSACTION_FIELDS = ["Cardno", "Pin", "Verified", "DoorID", "EventType", "InOutState", "Time_second"]
+
+def _enum_value(enum_type, value, default):
     try:
-        if not ensure_connection():
-            return None
-        
-        new_events = panel.get_rt_log()
-        log.info(f"Retrieved {len(new_events)} events from device")
+        return enum_type(value)
+    except ValueError:
+        return default
+
+def transaction_time_value(timestamp: str) -> int:
+    """Encodes a "YYYY-MM-DD HH:MM:SS" time the way the table stores it, the encoding sorts like the time."""
+    return C3DateTime.strptime(timestamp, TIMESTAMP_FORMAT).to_value()
+
+def transaction_to_event(record: Dict[str, Any]) -> EventRecord:
+    """Converts a row of the transaction table into the EventRecord the realtime log would have delivered."""
+    event = EventRecord()
+    event.card_no = record.get("Cardno", 0)
+    event.pin = record.get("Pin", 0)
+    event.verified = _enum_value(VerificationMode, record.get("Verified", 0), VerificationMode.OTHER)
+    event.port_nr = record.get("DoorID", 0)
+    event.event_type = _enum_value(C3EventType, record.get("EventType", 0), C3EventType.UNKNOWN_UNSUPPORTED)
+    event.in_out_state = _enum_value(InOutDirection, record.get("InOutState", 0), InOutDirection.UNKNOWN_UNSUPPORTED)
+    event.time_second = C3DateTime.from_value(record.get("Time_second", 0))
+    return event
+
+class ZKTConnection:
+    def __init__(self, ip: str, port: int = 4370, password: str = ""):
+        self.ip = ip
+        self.port = port
+        self.password = password
+        self.panel: Optional[C3] = None
+        self.last_poll_stats: Dict[str, Any] = {}
+        # Monotonic time of the last successful device call, any successful call proves the session is alive.
+        self.last_activity: float = 0.0
+        self.reconnect_count = 0
+
+        self._poll_duration = metrics.POLL_DURATION.labels(device=self.address)
+        self._poll_events = metrics.POLL_EVENTS.labels(device=self.address)
+        self._poll_failures = metrics.POLL_FAILURES.labels(device=self.address)
+        self._reconnects = metrics.DEVICE_RECONNECTS.labels(device=self.address)
+
+    @property
+    def address(self) -> str:
+        return f"{self.ip}:{self.port}"
+
+    def poll_zkteco_changes(self) -> Optional[List[EventRecord]]:
+        started = time.perf_counter()
+        new_events = self._poll()
+        self._poll_duration.observe(time.perf_counter() - started)
+        if new_events is None:
+            self._poll_failures.inc()
+        else:
+            self._poll_events.observe(len(new_events))
         return new_events
-    except ConnectionRefusedError: 
-        log.error(f"Polling: Connection refused by ZKTeco device {settings.ZKT_DEVICE_IP}:{settings.ZKT_DEVICE_PORT}")
-        return None
-    except TimeoutError: 
-        log.error(f"Polling: Connection timeout to ZKTeco device {settings.ZKT_DEVICE_IP}:{settings.ZKT_DEVICE_PORT}")
-        return None
-    except Exception as e: 
-        log.exception(f"Unexpected error during ZKTeco polling: {e}", exc_info=True)
-        return None
 
-def update_time(date_time: datetime):
-    global panel
-    try:
-        if not ensure_connection():
+    def _poll(self) -> Optional[List[EventRecord]]:
+        log.info("Polling ZKTeco device at %s...", self.address)
+        new_events: List[EventRecord] = []
+
+        try:
+            if not self.ensure_connection():
+                return None
+
+            new_events = self._drain_rt_log()
+            log.info("Retrieved %d events from device %s", len(new_events), self.address)
+            return new_events
+        except ConnectionRefusedError:
+            log.error(f"Polling: Connection refused by ZKTeco device {self.address}")
+            return None
+        except TimeoutError:
+            log.error(f"Polling: Connection timeout to ZKTeco device {self.address}")
+            return None
+        except Exception as e:
+            log.exception(f"Unexpected error during ZKTeco polling of {self.address}: {e}", exc_info=True)
             return None
-        log.debug(f"Setting device DateTime to {date_time.isoformat()}")
-        panel.set_device_datetime(date_time)
-    except Exception as e:
-        log.exception(f"Unexpected error during Setting time: {e}", exc_info=True)
-        return None
 
+    def _drain_rt_log(self) -> List[EventRecord]:
+        # The panel hands out a limited number of records per call, so keep reading while
+        # it returns events (within the per-cycle time budget) to clear backlogs quickly.
+        started = time.monotonic()
+        records: List[EventRecord] = []
+        batch_sizes: List[int] = []
 
-def ensure_connection() -> bool:
-    global panel
-    
-    try:
-        if panel is not None:
+        while True:
             try:
-                panel.get_device_param(["~SerialNumber"])
-                return True
-            except Exception:
-                close_zkteco_connection()
-        
-        log.info(f"Connecting to ZKTeco device at {settings.ZKT_DEVICE_IP}:{settings.ZKT_DEVICE_PORT}...")
-        panel = C3(settings.ZKT_DEVICE_IP, settings.ZKT_DEVICE_PORT)
-        
-        if settings.ZKT_DEVICE_PASSWORD:
-            connected = panel.connect(settings.ZKT_DEVICE_PASSWORD)
-        else:
-            connected = panel.connect()
-            
-        if connected:
-            log.info("Successfully connected to ZKTeco device")
-            return True
-        else:
-            panel = None
-            raise Exception("Failed to connect to ZKTeco device")
-            
-    except Exception as e:
-        log.exception(f"Error establishing connection to device: {e}")
-        panel = None
-        raise
+                batch = self._call(lambda: self.panel.get_rt_log())
+            except Exception as e:
+                if not batch_sizes:
+                    raise
+                # The records read so far are gone from the panel's buffer, they must not be lost with the cycle
+                log.error(f"Drain of {self.address} failed after {len(batch_sizes)} batches, "
+                          f"keeping the {len(records)} records read: {e}")
+                break
+            records.extend(batch)
+            event_count = sum(1 for record in batch if not isinstance(record, DoorAlarmStatusRecord))
+            batch_sizes.append(event_count)
 
-def get_device_definition() -> Optional[DeviceDefinition]:
-    global panel
-    definition: Optional[DeviceDefinition] = None
-    
-    try:
-        ensure_connection()
-            
-        # Retrieve device parameters using C3 library
-        params = [
-            "~SerialNumber",  # Serial number
-            "LockCount",      # Number of doors/locks
-            "ReaderCount",    # Number of readers
-            "AuxInCount",     # Number of auxiliary inputs
-            "AuxOutCount",    # Number of auxiliary outputs
-            "FirmVer",        # Firmware version
-        ]
-        
-        parameters = panel.get_device_param(params)
-        log.debug(f"Retrieved parameters: {parameters}")
-        
-        serial_number = parameters.get("~SerialNumber", "N/A")
-        lock_count = int(parameters.get("LockCount", 0))
-        reader_count = int(parameters.get("ReaderCount", 0))
-        aux_in_count = int(parameters.get("AuxInCount", 0))
-        aux_out_count = int(parameters.get("AuxOutCount", 0))
-        firmware_version = parameters.get("FirmVer", "N/A")
-
-        doors = [{'number': i+1, 'name': f'Door {i+1}'} for i in range(lock_count)]
-        readers = [{'number': i+1, 'name': f'Reader {i+1}'} for i in range(reader_count)]
-        relays = [{'number': i+1, 'name': f'Relay {i+1}'} for i in range(aux_out_count)]
-        aux_inputs = [{'number': i+1, 'name': f'AuxInput {i+1}'} for i in range(aux_in_count)]
-        
-        param_obj = {
-            'serial_number': serial_number,
-            'firmware_version': firmware_version,
+            if event_count == 0 or settings.POLL_DRAIN_TIME_BUDGET_SECONDS <= 0:
+                break
+            if len(batch_sizes) >= settings.POLL_DRAIN_MAX_BATCHES:
+                log.warning(f"Drain of {self.address} stopped after {len(batch_sizes)} batches, continuing next cycle")
+                break
+            if time.monotonic() - started >= settings.POLL_DRAIN_TIME_BUDGET_SECONDS:
+                log.warning(f"Drain of {self.address} exceeded its {settings.POLL_DRAIN_TIME_BUDGET_SECONDS}s budget, continuing next cycle")
+                break
+
+        self.last_poll_stats = {
+            'iterations': len(batch_sizes),
+            'batch_sizes': batch_sizes,
+            'events': sum(batch_sizes),
+            'duration': time.monotonic() - started,
         }
-        
-        definition = DeviceDefinition(param_obj, doors, readers, relays, aux_inputs)
-        
-        log.info(f"Fetched Definition: SN={serial_number}, Doors={lock_count}, "
-                 f"Readers={reader_count}, Relays={aux_out_count}, AuxInputs={aux_in_count}")
-        
-        log.debug(f"Definition: {definition}")
+        if len(batch_sizes) > 1:
+            log.info(f"Drained {sum(batch_sizes)} events from {self.address} in {len(batch_sizes)} calls, "
+                     f"batch sizes {batch_sizes}")
+        return records
 
-        return definition
+    def fetch_transactions(self) -> Optional[List[Dict[str, Any]]]:
+        """Downloads the panel's stored transaction table, oldest record first."""
+        try:
+            if not self.ensure_connection():
+                return None
+            started = time.monotonic()
+            records = self._call(lambda: self.panel.get_device_data(TRANSACTION_TABLE, TRANSACTION_FIELDS))
+            log.info(f"Downloaded {len(records)} stored transaction(s) from {self.address} "
+                     f"in {time.monotonic() - started:.1f}s")
+            return records
+        except Exception as e:
+            log.exception(f"Error downloading stored transactions from {self.address}: {e}")
+            return None
 
-    except Exception as e: 
-        log.exception(f"Unexpected error fetching device definition: {e}", exc_info=True)
-        raise
+    def execute_command(self, command: DeviceCommand) -> bool:
+        try:
+            if not self.ensure_connection():
+                return False
+            log.info(f"Operating output {command.number} ({command.address.name}) of {self.address} "
+                     f"for {command.duration}s")
+            self._call(lambda: self.panel.control_device(
+                ControlDeviceOutput(command.number, command.address, command.duration)
+            ))
+            return True
+        except Exception as e:
+            log.exception(f"Error operating {command.object_id} on {self.address}: {e}")
+            return False
 
-def close_zkteco_connection():
-    global panel
-    if panel is not None:
+    def update_time(self, date_time: datetime):
+        try:
+            if not self.ensure_connection():
+                return None
+            log.debug(f"Setting device {self.address} DateTime to {date_time.isoformat()}")
+            self._call(lambda: self.panel.set_device_datetime(date_time))
+        except Exception as e:
+            log.exception(f"Unexpected error during Setting time on {self.address}: {e}", exc_info=True)
+            return None
+
+    def _call(self, operation: Callable[[], T]) -> T:
+        # A failed data call is treated as a broken session: reconnect once and retry.
         try:
-            panel.disconnect()
+            result = operation()
         except Exception as e:
-            log.warning(f"Error when disconnecting from ZKTeco device: {e}")
-        finally:
-            panel = None
-            log.debug("Closed connection to ZKTeco device")
+            log.warning(f"Call to ZKTeco device {self.address} failed ({e}), reconnecting and retrying once")
+            self.close_zkteco_connection()
+            self.reconnect_count += 1
+            self._reconnects.inc()
+            self.ensure_connection()
+            result = operation()
+        self.last_activity = time.monotonic()
+        return result
+
+    def ensure_connection(self) -> bool:
+        try:
+            if self.panel is not None:
+                if time.monotonic() - self.last_activity < settings.DEVICE_KEEPALIVE_SECONDS:
+                    return True
+                try:
+                    log.debug(f"Session to {self.address} idle, sending keepalive probe")
+                    self.panel.get_device_param(["~SerialNumber"])
+                    self.last_activity = time.monotonic()
+                    return True
+                except Exception:
+                    self.close_zkteco_connection()
+                    self.reconnect_count += 1
+                    self._reconnects.inc()
+
+            log.info(f"Connecting to ZKTeco device at {self.address}...")
+            self.panel = C3(self.ip, self.port)
+
+            if self.password:
+                connected = self.panel.connect(self.password)
+            else:
+                connected = self.panel.connect()
+
+            if connected:
+                log.info(f"Successfully connected to ZKTeco device {self.address}")
+                self.last_activity = time.monotonic()
+                return True
+            else:
+                self.panel = None
+                raise Exception(f"Failed to connect to ZKTeco device {self.address}")
+
+        except Exception as e:
+            log.exception(f"Error establishing connection to device {self.address}: {e}")
+            self.panel = None
+            raise
+
+    def get_device_definition(self) -> Optional[DeviceDefinition]:
+        definition: Optional[DeviceDefinition] = None
+
+        try:
+            self.ensure_connection()
+
+            # Retrieve device parameters using C3 library
+            params = [
+                "~SerialNumber",  # Serial number
+                "LockCount",      # Number of doors/locks
+                "ReaderCount",    # Number of readers
+                "AuxInCount",     # Number of auxiliary inputs
+                "AuxOutCount",    # Number of auxiliary outputs
+                "FirmVer",        # Firmware version
+            ]
+
+            parameters = self._call(lambda: self.panel.get_device_param(params))
+            log.debug(f"Retrieved parameters: {parameters}")
+
+            serial_number = parameters.get("~SerialNumber", "N/A")
+            lock_count = int(parameters.get("LockCount", 0))
+            reader_count = int(parameters.get("ReaderCount", 0))
+            aux_in_count = int(parameters.get("AuxInCount", 0))
+            aux_out_count = int(parameters.get("AuxOutCount", 0))
+            firmware_version = parameters.get("FirmVer", "N/A")
+
+            doors = [{'number': i+1, 'name': f'Door {i+1}'} for i in range(lock_count)]
+            readers = [{'number': i+1, 'name': f'Reader {i+1}'} for i in range(reader_count)]
+            relays = [{'number': i+1, 'name': f'Relay {i+1}'} for i in range(aux_out_count)]
+            aux_inputs = [{'number': i+1, 'name': f'AuxInput {i+1}'} for i in range(aux_in_count)]
+
+            param_obj = {
+                'serial_number': serial_number,
+                'firmware_version': firmware_version,
+            }
+
+            definition = DeviceDefinition(param_obj, doors, readers, relays, aux_inputs)
+
+            log.info(f"Fetched Definition from {self.address}: SN={serial_number}, Doors={lock_count}, "
+                     f"Readers={reader_count}, Relays={aux_out_count}, AuxInputs={aux_in_count}")
+
+            log.debug(f"Definition: {definition}")
+
+            return definition
+
+        except Exception as e:
+            log.exception(f"Unexpected error fetching device definition from {self.address}: {e}", exc_info=True)
+            raise
+
+    def close_zkteco_connection(self):
+        if self.panel is not None:
+            try:
+                self.panel.disconnect()
+            except Exception as e:
+                log.warning(f"Error when disconnecting from ZKTeco device {self.address}: {e}")
+            finally:
+                self.panel = None
+                log.debug(f"Closed connection to ZKTeco device {self.address}")
+
+def build_connections() -> List[ZKTConnection]:
+    return [
+        ZKTConnection(device['ip'], device['port'], device['password'])
+        for device in settings.ZKT_DEVICES
+    ]
+
+# Single-device mode keeps using the module level functions below, backed by a
+# connection built from DEVICE_IP/DEVICE_PORT/DEVICE_PASSWORD.
+default_connection: Optional[ZKTConnection] = None
+
+def get_default_connection() -> ZKTConnection:
+    global default_connection
+    if default_connection is None:
+        default_connection = ZKTConnection(
+            settings.ZKT_DEVICE_IP, settings.ZKT_DEVICE_PORT, settings.ZKT_DEVICE_PASSWORD
+        )
+    return default_connection
+
+def poll_zkteco_changes() -> Optional[List[EventRecord]]:
+    return get_default_connection().poll_zkteco_changes()
+
+def update_time(date_time: datetime):
+    return get_default_connection().update_time(date_time)
+
+def ensure_connection() -> bool:
+    return get_default_connection().ensure_connection()
+
+def get_device_definition() -> Optional[DeviceDefinition]:
+    return get_default_connection().get_device_definition()
+
+def close_zkteco_connection():
+    if default_connection is not None:
+        default_connection.close_zkteco_connection()
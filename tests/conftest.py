@@ -8,6 +8,8 @@ src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
 if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
+from core.models import DeviceDefinition
+
 @pytest.fixture(autouse=True)
 def setup_test_env():
     logging.basicConfig(level=logging.DEBUG)
@@ -29,3 +31,16 @@ def setup_test_env():
     
     with patch.dict(os.environ, env_vars):
         yield
+
+@pytest.fixture
+def make_device_definition():
+    """Builds the definition of a panel with numbered doors, readers, relays and aux inputs."""
+    def make(doors=2, readers=2, relays=2, aux_inputs=1, serial_number="1234567890") -> DeviceDefinition:
+        return DeviceDefinition(
+            parameters={"serial_number": serial_number},
+            doors=[{"number": n} for n in range(1, doors + 1)],
+            readers=[{"number": n} for n in range(1, readers + 1)],
+            relays=[{"number": n} for n in range(1, relays + 1)],
+            aux_inputs=[{"number": n} for n in range(1, aux_inputs + 1)]
+        )
+    return make
@@ -21,10 +21,10 @@ class TestZKAccessToMQTT:
         return mock_c3
     
     @pytest.fixture
-    def setup_test_environment(self, mock_c3):
+    def setup_test_environment(self, mock_c3, tmp_path):
         mqtt_client = MagicMock()
         publisher = MQTTPublisher(mqtt_client, mock_c3.serial_number)
-        state_manager = StateManager(settings.STATE_FILE_PATH)
+        state_manager = StateManager(str(tmp_path / "state.json"))
         job_scheduler = JobScheduler(publisher, state_manager)
         
         return (job_scheduler, publisher, mqtt_client, mock_c3)
@@ -56,7 +56,7 @@ class TestZKAccessToMQTT:
             assert door_state_calls, "No door state update was published"
             
             door_state_payload = door_state_calls[0][0][2]  # args[0][2] is the payload
-            assert door_state_payload == "ON", f"Door state should be ON, got {door_state_payload}"
+            assert door_state_payload == b"ON", f"Door state should be ON, got {door_state_payload}"
             
             reader_event_calls = [
                 call_args for call_args in mock_publish.call_args_list 
@@ -137,7 +137,7 @@ class TestZKAccessToMQTT:
             assert aux_state_calls, "No aux input state update was published"
             
             aux_state_payload = aux_state_calls[0][0][2]  # args[0][2] is the payload
-            assert aux_state_payload == "ON", f"Aux input state should be ON, got {aux_state_payload}"
+            assert aux_state_payload == b"ON", f"Aux input state should be ON, got {aux_state_payload}"
     
     @patch('zkt.handler.C3')
     @patch('mqtt.handler.publish_message')
@@ -222,7 +222,7 @@ class TestZKAccessToMQTT:
             door_topic = f"zkt_eco/{model_name}/{serial_number}/door_{door['number']}/state"
             door_calls = [call for call in mock_publish.call_args_list if call[0][1] == door_topic]
             assert door_calls, f"No state message published for door {door['number']}"
-            assert door_calls[0][0][2] in ["ON", "OFF"], f"Invalid door state payload: {door_calls[0][0][2]}"
+            assert door_calls[0][0][2] in [b"ON", b"OFF"], f"Invalid door state payload: {door_calls[0][0][2]}"
         
         # Verify reader states
         for reader in device_def.readers:
@@ -235,14 +235,14 @@ class TestZKAccessToMQTT:
             relay_topic = f"zkt_eco/{model_name}/{serial_number}/relay_lock_{relay['number']}/state"
             relay_calls = [call for call in mock_publish.call_args_list if relay_topic in call[0][1]]
             assert relay_calls, f"No state message published for relay lock_{relay['number']}"
-            assert relay_calls[0][0][2] in ["ON", "OFF"], f"Invalid relay state payload: {relay_calls[0][0][2]}"
+            assert relay_calls[0][0][2] in [b"ON", b"OFF"], f"Invalid relay state payload: {relay_calls[0][0][2]}"
         
         # Verify aux input states
         for aux in device_def.aux_inputs:
             aux_topic = f"zkt_eco/{model_name}/{serial_number}/aux_input_{aux['number']}/state"
             aux_calls = [call for call in mock_publish.call_args_list if aux_topic in call[0][1]]
             assert aux_calls, f"No state message published for aux input {aux['number']}"
-            assert aux_calls[0][0][2] in ["ON", "OFF"], f"Invalid aux input state payload: {aux_calls[0][0][2]}"
+            assert aux_calls[0][0][2] in [b"ON", b"OFF"], f"Invalid aux input state payload: {aux_calls[0][0][2]}"
             
     @patch('zkt.handler.C3')
     @patch('mqtt.handler.publish_message')
@@ -272,3 +272,60 @@ class TestZKAccessToMQTT:
         with patch('zkt.handler.poll_zkteco_changes', return_value=[door_event]):
             job_scheduler.polling_job()
             assert mock_publish.call_count > 0, "Expected MQTT messages after recovery"
+
+    @patch('mqtt.handler.publish_message')
+    def test_only_changed_states_are_published(self, mock_publish, setup_test_environment, mock_c3):
+        job_scheduler, _, _, _ = setup_test_environment
+        device_def = DeviceDefinition(
+            parameters={'serial_number': mock_c3.serial_number},
+            doors=[{'number': i} for i in range(1, 5)],
+            readers=[{'number': i} for i in range(1, 5)],
+            relays=[{'number': i} for i in range(1, 5)],
+            aux_inputs=[{'number': i} for i in range(1, 5)]
+        )
+        job_scheduler.initialize_states(device_def)
+        mock_publish.reset_mock()
+
+        door_close_event = mock_c3.generate_event(port_nr=1, event_type=C3EventType.DOOR_CLOSED_CORRECT)
+
+        with patch('zkt.handler.poll_zkteco_changes', return_value=[door_close_event]):
+            job_scheduler.polling_job()
+
+        topics = [call_args[0][1] for call_args in mock_publish.call_args_list]
+        # door_1 and relay_lock_1 are already OFF, so only the reader event, reader card and raw event go out
+        assert not any("door_1/state" in topic for topic in topics)
+        assert not any("door_2/state" in topic for topic in topics)
+        assert any("reader_1_scan/state" in topic for topic in topics)
+        assert len(topics) == 3
+
+    @patch('mqtt.handler.publish_message')
+    def test_resync_publishes_full_snapshot(self, mock_publish, setup_test_environment, mock_c3):
+        job_scheduler, _, _, _ = setup_test_environment
+        job_scheduler.state_manager.update_state("door_1", "ON")
+        job_scheduler.state_manager.update_state("aux_input_1", "OFF")
+
+        job_scheduler.request_resync()
+        with patch('zkt.handler.poll_zkteco_changes', return_value=[]):
+            job_scheduler.polling_job()
+
+        topics = [call_args[0][1] for call_args in mock_publish.call_args_list]
+        assert any(topic.endswith("door_1/state") for topic in topics)
+        assert any(topic.endswith("aux_input_1/state") for topic in topics)
+        assert job_scheduler.resync_requested is False
+
+    @patch('mqtt.handler.publish_message')
+    def test_burst_publishes_collapsed_states_once(self, mock_publish, setup_test_environment, mock_c3):
+        job_scheduler, _, _, _ = setup_test_environment
+        burst = []
+        for _ in range(25):
+            burst.append(mock_c3.generate_event(port_nr=1, event_type=C3EventType.DOOR_OPENED_CORRECT, verified=VerificationMode.NONE))
+            burst.append(mock_c3.generate_event(port_nr=1, event_type=C3EventType.DOOR_CLOSED_CORRECT, verified=VerificationMode.NONE))
+
+        with patch('zkt.handler.poll_zkteco_changes', return_value=burst):
+            job_scheduler.polling_job()
+
+        door_calls = [call_args for call_args in mock_publish.call_args_list if call_args[0][1].endswith("door_1/state")]
+        scan_calls = [call_args for call_args in mock_publish.call_args_list if call_args[0][1].endswith("reader_1_scan/state")]
+        assert [call_args[0][2] for call_args in door_calls] == [b"OFF"]
+        assert len(scan_calls) == 50
+        assert job_scheduler.state_manager.get_state("door_1") == "OFF"
@@ -1,4 +1,4 @@
-from c3.consts import EventType as C3EventType, VerificationMode, InOutDirection
+from c3.consts import EventType as C3EventType, VerificationMode, InOutDirection, ControlOutputAddress
 import datetime
 
 class MockEventRecord:
@@ -37,6 +37,9 @@ class MockC3:
         self.connected = False
         self.serial_number = "TEST123456"
         self._event_queue = []
+        self.batch_size = None
+        self.transactions = []
+        self.controls = []
         
     def connect(self, password=None):
         self.connected = True
@@ -44,6 +47,17 @@ class MockC3:
         
     def disconnect(self):
         self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    def control_device(self, command):
+        self.controls.append(command)
+        # The panel reports a remote door opening as an event on the door
+        if command.address == ControlOutputAddress.DOOR_OUTPUT and command.duration > 0:
+            self.add_events_to_queue([MockEventRecord(
+                port_nr=command.output_number, event_type=C3EventType.REMOTE_OPENING, verified=VerificationMode.OTHER
+            )])
         
     def get_device_param(self, params):
         return {
@@ -60,9 +74,15 @@ class MockC3:
     def get_rt_log(self):
         if not self._event_queue:
             return []
-        events = self._event_queue.copy()
-        self._event_queue = []
+        batch_size = self.batch_size or len(self._event_queue)
+        events = self._event_queue[:batch_size]
+        self._event_queue = self._event_queue[batch_size:]
         return events
         
+    def get_device_data(self, table_name, field_names=None):
+        if table_name != "transaction":
+            return []
+        return [dict(record) for record in self.transactions]
+
     def generate_event(self, port_nr=1, card_no=0, event_type=C3EventType.NORMAL_PUNCH_OPEN, verified=VerificationMode.CARD):
         return MockEventRecord(port_nr=port_nr, card_no=card_no, event_type=event_type, verified=verified)
\ No newline at end of file
@@ -0,0 +1,45 @@
+from datetime import datetime, time
+from unittest.mock import MagicMock
+
+import schedule
+
+from scheduler.adaptive import AdaptivePoller, AdaptivePollingInterval, parse_busy_hours
+
+
+class TestAdaptivePolling:
+    def test_backs_off_while_idle_and_resets_on_events(self):
+        interval = AdaptivePollingInterval(0.5, 8, backoff_factor=2)
+
+        assert [interval.record_poll(0) for _ in range(5)] == [1, 2, 4, 8, 8]
+        assert interval.record_poll(3) == 0.5
+        assert interval.record_poll(0) == 1
+
+    def test_busy_hours_keep_minimum_interval(self):
+        now = datetime(2024, 1, 1, 8, 15)
+        interval = AdaptivePollingInterval(0.5, 60, busy_hours=parse_busy_hours("07:00-09:30"), clock=lambda: now)
+
+        assert interval.record_poll(0) == 0.5
+        now = datetime(2024, 1, 1, 12, 0)
+        assert interval.record_poll(0) == 1
+
+    def test_busy_hours_wrapping_midnight(self):
+        busy_hours = parse_busy_hours("22:00-02:00, invalid")
+        assert busy_hours == [(time(22, 0), time(2, 0))]
+
+        interval = AdaptivePollingInterval(1, 60, busy_hours=busy_hours, clock=lambda: datetime(2024, 1, 1, 1, 0))
+        assert interval.in_busy_hours()
+
+    def test_poller_updates_schedule_job_interval(self):
+        polling_job = MagicMock(side_effect=[0, 0, 5])
+        poller = AdaptivePoller(polling_job, AdaptivePollingInterval(1, 30))
+        job = poller.schedule()
+        try:
+            poller.run()
+            assert job.interval == 2
+            poller.run()
+            assert job.interval == 4
+            poller.run()
+            assert job.interval == 1
+            assert poller.current_interval == 1
+        finally:
+            schedule.cancel_job(job)
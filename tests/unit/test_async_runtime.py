@@ -0,0 +1,373 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import paho.mqtt.client as mqtt
+
+from core.startup import DefinitionResolver
+from mqtt import handler as mqtt_handler
+from scheduler.adaptive import AdaptivePollingInterval
+from scheduler.async_runtime import AsyncBridgeRuntime, AsyncMqttLoop, wait_for_stop
+
+
+class FakeBroker:
+    """Minimal MQTT 3.1.1 broker: acknowledges CONNECT and records everything else it receives."""
+
+    def __init__(self, connack_delay: float = 0.0):
+        self.connack_delay = connack_delay
+        self.received = bytearray()
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            header = await reader.readexactly(2)
+            await reader.readexactly(header[1])
+            await asyncio.sleep(self.connack_delay)
+            writer.write(b"\x20\x02\x00\x00")
+            await writer.drain()
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                self.received.extend(data)
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def make_client(port: int) -> mqtt.Client:
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="test_async_runtime")
+    client.on_connect = mqtt_handler.on_connect
+    client.connect_async("127.0.0.1", port, keepalive=60)
+    return client
+
+
+def make_runtime(client, **kwargs) -> AsyncBridgeRuntime:
+    options = dict(
+        call_timeout=5.0,
+        interval_factory=lambda: AdaptivePollingInterval(0.05, 0.05, 1.0),
+        connect_timeout=2.0,
+        handle_signals=False
+    )
+    options.update(kwargs)
+    return AsyncBridgeRuntime(client, **options)
+
+
+def make_job_scheduler(polling_job=None):
+    job_scheduler = MagicMock()
+    job_scheduler.connection.address = "10.0.0.1:4370"
+    if polling_job is not None:
+        job_scheduler.polling_job = polling_job
+    else:
+        job_scheduler.polling_job.return_value = 0
+    return job_scheduler
+
+
+def make_device(serial_number="SN1"):
+    definition = MagicMock()
+    definition.serial_number = serial_number
+    return MagicMock(), definition
+
+
+class TestAsyncRuntime:
+    def test_wait_for_stop_returns_immediately_on_stop(self):
+        async def scenario():
+            stop = asyncio.Event()
+            asyncio.get_running_loop().call_later(0.05, stop.set)
+            started = time.monotonic()
+            stopped = await wait_for_stop(stop, 10)
+            return stopped, time.monotonic() - started
+
+        stopped, elapsed = asyncio.run(scenario())
+        assert stopped is True
+        assert elapsed < 1.0
+
+    def test_mqtt_client_runs_on_event_loop(self):
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            client = make_client(broker.port)
+            connected = asyncio.Event()
+            client.on_connect = lambda *args: connected.set()
+
+            stop = asyncio.Event()
+            mqtt_loop = AsyncMqttLoop(client, asyncio.get_running_loop())
+            mqtt_loop.start(stop)
+            await asyncio.wait_for(connected.wait(), 2)
+
+            # Publishes from other threads are written by the event loop
+            thread = threading.Thread(target=client.publish, args=("zkt_test/state", "ON"))
+            thread.start()
+            thread.join()
+            for _ in range(50):
+                if b"zkt_test/state" in broker.received:
+                    break
+                await asyncio.sleep(0.02)
+
+            stop.set()
+            await mqtt_loop.stop()
+            await broker.close()
+            return broker.received, client.is_connected()
+
+        received, still_connected = asyncio.run(scenario())
+        assert b"zkt_test/state" in received
+        assert still_connected is False
+
+    def test_runtime_polls_devices_until_stopped(self):
+        job_scheduler = make_job_scheduler()
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            runtime = make_runtime(make_client(broker.port))
+            asyncio.get_running_loop().call_later(0.5, runtime.request_stop)
+            exit_code = await runtime.run([make_device()], lambda connection, definition: job_scheduler)
+            await broker.close()
+            return exit_code
+
+        assert asyncio.run(scenario()) == 0
+        assert job_scheduler.polling_job.call_count >= 3
+        job_scheduler.time_update_job.assert_not_called()
+
+    def test_slow_device_call_times_out_without_blocking_others(self):
+        release = threading.Event()
+
+        def hanging_poll():
+            release.wait(2)
+            return 0
+
+        hanging = make_job_scheduler(hanging_poll)
+        healthy = make_job_scheduler()
+        schedulers = iter([hanging, healthy])
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            runtime = make_runtime(make_client(broker.port), call_timeout=0.1)
+            asyncio.get_running_loop().call_later(0.5, runtime.request_stop)
+            asyncio.get_running_loop().call_later(0.5, release.set)
+            await runtime.run([make_device("SN1"), make_device("SN2")], lambda connection, definition: next(schedulers))
+            await broker.close()
+
+        asyncio.run(scenario())
+        assert healthy.polling_job.call_count >= 3
+
+    def test_shutdown_does_not_wait_for_polling_interval(self):
+        job_scheduler = make_job_scheduler()
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            runtime = make_runtime(
+                make_client(broker.port), interval_factory=lambda: AdaptivePollingInterval(60, 60, 1.0)
+            )
+            asyncio.get_running_loop().call_later(0.3, runtime.request_stop)
+            started = time.monotonic()
+            await runtime.run([make_device()], lambda connection, definition: job_scheduler)
+            elapsed = time.monotonic() - started
+            await broker.close()
+            return elapsed
+
+        assert asyncio.run(scenario()) < 2.0
+        job_scheduler.polling_job.assert_called_once()
+
+    def test_state_flush_runs_as_task(self):
+        job_scheduler = make_job_scheduler()
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            runtime = make_runtime(make_client(broker.port), state_flush_interval=0.05)
+            asyncio.get_running_loop().call_later(0.4, runtime.request_stop)
+            await runtime.run([make_device()], lambda connection, definition: job_scheduler)
+            await broker.close()
+
+        asyncio.run(scenario())
+        assert job_scheduler.state_manager.flush.call_count >= 2
+
+    def test_connection_timeout_exits_with_error(self):
+        async def scenario():
+            # Nothing listens on the port of a closed server
+            broker = FakeBroker()
+            await broker.start()
+            await broker.close()
+            runtime = make_runtime(make_client(broker.port), connect_timeout=0.3)
+            return await runtime.run([make_device()], lambda connection, definition: make_job_scheduler())
+
+        assert asyncio.run(scenario()) == 1
+
+    def test_devices_start_as_soon_as_definition_and_broker_are_ready(self):
+        connection, definition = make_device()
+        pending: Future = Future()
+        job_scheduler = make_job_scheduler()
+        started = []
+
+        def start_device(connection, device_definition):
+            started.append((time.monotonic(), device_definition))
+            return job_scheduler
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            runtime = make_runtime(make_client(broker.port))
+            loop = asyncio.get_running_loop()
+            # The panel answers only after the broker connected
+            loop.call_later(0.2, pending.set_result, definition)
+            loop.call_later(0.5, runtime.request_stop)
+            began = time.monotonic()
+            on_started = MagicMock()
+            exit_code = await runtime.run([(connection, pending)], start_device, on_started=on_started)
+            await broker.close()
+            return exit_code, began, on_started
+
+        exit_code, began, on_started = asyncio.run(scenario())
+        assert exit_code == 0
+        assert [device_definition for _, device_definition in started] == [definition]
+        assert 0.2 <= started[0][0] - began < 0.4
+        on_started.assert_called_once()
+
+    def test_failed_definition_only_skips_that_device(self):
+        failed: Future = Future()
+        failed.set_exception(ConnectionError("panel unreachable"))
+        job_scheduler = make_job_scheduler()
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            runtime = make_runtime(make_client(broker.port))
+            asyncio.get_running_loop().call_later(0.3, runtime.request_stop)
+            exit_code = await runtime.run([(MagicMock(), failed), make_device()], lambda connection, definition: job_scheduler)
+            await broker.close()
+            return exit_code, runtime.job_schedulers
+
+        exit_code, job_schedulers = asyncio.run(scenario())
+        assert exit_code == 0
+        assert job_schedulers == [job_scheduler]
+
+    def test_late_device_starts_polling_without_holding_up_the_others(self):
+        late_connection, late_definition = make_device("SN2")
+        pending: Future = Future()
+        early = make_job_scheduler()
+        late = make_job_scheduler()
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            runtime = make_runtime(make_client(broker.port))
+            loop = asyncio.get_running_loop()
+            # The second panel was unreachable and answers a retry later
+            loop.call_later(0.3, pending.set_result, late_definition)
+            loop.call_later(0.6, runtime.request_stop)
+            schedulers = {"SN1": early, "SN2": late}
+            on_started = MagicMock()
+            await runtime.run(
+                [make_device("SN1"), (late_connection, pending)],
+                lambda connection, definition: schedulers[definition.serial_number],
+                on_started=on_started
+            )
+            await broker.close()
+            return runtime.job_schedulers, on_started
+
+        job_schedulers, on_started = asyncio.run(scenario())
+        assert job_schedulers == [early, late]
+        assert early.polling_job.call_count > late.polling_job.call_count >= 1
+        on_started.assert_called_once()
+
+    def test_raw_event_batches_are_flushed_before_disconnect(self):
+        job_scheduler = make_job_scheduler()
+        connected_at_flush = []
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            client = make_client(broker.port)
+            job_scheduler.publisher.flush_raw_events.side_effect = lambda force: connected_at_flush.append(
+                (force, client.is_connected())
+            )
+            runtime = make_runtime(client)
+            asyncio.get_running_loop().call_later(0.3, runtime.request_stop)
+            await runtime.run([make_device()], lambda connection, definition: job_scheduler)
+            await broker.close()
+
+        asyncio.run(scenario())
+        assert connected_at_flush == [(True, True)]
+
+    def test_definition_failing_while_the_broker_connect_is_pending(self):
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=2)
+        resolver = DefinitionResolver(executor, stop=stop, retry_seconds=0.05)
+        failing, answering = MagicMock(), MagicMock()
+        failing.get_device_definition.side_effect = ConnectionError("panel unreachable")
+        _, definition = make_device()
+        answering.get_device_definition.return_value = definition
+        job_scheduler = make_job_scheduler()
+        started = []
+
+        def start_device(connection, device_definition):
+            started.append(time.monotonic())
+            return job_scheduler
+
+        async def scenario():
+            broker = FakeBroker(connack_delay=0.3)
+            await broker.start()
+            runtime = make_runtime(make_client(broker.port))
+            loop = asyncio.get_running_loop()
+            # The unreachable panel gives up (as on shutdown) before the broker acknowledged the connection
+            loop.call_later(0.1, stop.set)
+            loop.call_later(0.6, runtime.request_stop)
+            began = time.monotonic()
+            exit_code = await runtime.run(resolver.resolve([failing, answering]), start_device)
+            await broker.close()
+            return exit_code, began, runtime.job_schedulers
+
+        try:
+            exit_code, began, job_schedulers = asyncio.run(scenario())
+        finally:
+            executor.shutdown(wait=True)
+        assert exit_code == 0
+        assert job_schedulers == [job_scheduler]
+        assert started[0] - began >= 0.3
+        assert failing.get_device_definition.call_count >= 1
+
+    def test_connection_timeout_exits_while_definitions_are_pending(self):
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        resolver = DefinitionResolver(executor, stop=stop, retry_seconds=0.05)
+        connection = MagicMock()
+        connection.get_device_definition.side_effect = ConnectionError("panel unreachable")
+        start_device = MagicMock()
+
+        async def scenario():
+            broker = FakeBroker()
+            await broker.start()
+            await broker.close()
+            runtime = make_runtime(make_client(broker.port), connect_timeout=0.3)
+            devices = resolver.resolve([connection])
+            began = time.monotonic()
+            exit_code = await runtime.run(devices, start_device)
+            return exit_code, time.monotonic() - began, devices
+
+        try:
+            exit_code, duration, [(_, future)] = asyncio.run(scenario())
+            # The runtime does not wait for the panel, the retries end once startup is stopped
+            assert not future.done()
+            stop.set()
+            assert isinstance(future.exception(timeout=1), RuntimeError)
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+        assert exit_code == 1
+        assert duration < 1.0
+        start_device.assert_not_called()
@@ -0,0 +1,208 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from c3.consts import EventType as C3EventType, InOutDirection, VerificationMode
+
+from core.state_manager import StateManager
+from core.transaction_cursor import EventPosition, OccurrenceCounter, TransactionCursor
+from mqtt.publisher import MQTTPublisher
+from scheduler.jobs import JobScheduler
+from zkt.handler import ZKTConnection, transaction_time_value, transaction_to_event
+
+from tests.mocks.c3 import MockC3, MockEventRecord
+
+
+def transaction(time: str, door: int = 1, card: int = 1001) -> dict:
+    return {
+        "Cardno": card,
+        "Pin": 0,
+        "Verified": VerificationMode.CARD.value,
+        "DoorID": door,
+        "EventType": C3EventType.NORMAL_PUNCH_OPEN.value,
+        "InOutState": InOutDirection.ENTRY.value,
+        "Time_second": transaction_time_value(time),
+    }
+
+
+def realtime_event(time: str, door: int = 1, card: int = 1001) -> MockEventRecord:
+    event = MockEventRecord(port_nr=door, card_no=card)
+    event.time_second = time
+    return event
+
+
+class TestTransactionCursor:
+    def test_table_rows_match_realtime_events(self):
+        event = transaction_to_event(transaction("2024-03-01 08:00:05", door=2, card=42))
+
+        assert event.port_nr == 2
+        assert event.event_type == C3EventType.NORMAL_PUNCH_OPEN
+        assert OccurrenceCounter().position(event) == OccurrenceCounter().position(
+            realtime_event("2024-03-01 08:00:05", door=2, card=42)
+        )
+
+    def test_identical_events_of_a_second_are_numbered(self):
+        positions = OccurrenceCounter()
+        first = positions.position(realtime_event("2024-03-01 08:00:05"))
+        second = positions.position(realtime_event("2024-03-01 08:00:05"))
+        later = positions.position(realtime_event("2024-03-01 08:00:06"))
+
+        assert (first.occurrence, second.occurrence, later.occurrence) == (1, 2, 1)
+
+    def test_covers_and_persists_the_newest_position(self, tmp_path):
+        path = str(tmp_path / "cursor.json")
+        cursor = TransactionCursor(path)
+        cursor.advance(EventPosition("2024-03-01 08:00:05", "a", 1))
+        cursor.advance(EventPosition("2024-03-01 08:00:04", "b", 1))
+        cursor.save()
+
+        restored = TransactionCursor(path)
+        assert restored.time == "2024-03-01 08:00:05"
+        assert restored.covers(EventPosition("2024-03-01 08:00:04", "c", 1))
+        assert restored.covers(EventPosition("2024-03-01 08:00:05", "a", 1))
+        assert not restored.covers(EventPosition("2024-03-01 08:00:05", "a", 2))
+        assert not restored.covers(EventPosition("2024-03-01 08:00:06", "a", 1))
+
+
+class TestBackfill:
+    @pytest.fixture
+    def connection(self):
+        with patch('zkt.handler.C3', side_effect=MockC3):
+            connection = ZKTConnection("10.0.0.1", 4370)
+            connection.ensure_connection()
+            yield connection
+
+    @pytest.fixture
+    def published(self):
+        with patch('mqtt.publisher.mqtt_handler.publish_message') as mock_publish:
+            yield mock_publish
+
+    def make_scheduler(self, connection, tmp_path) -> JobScheduler:
+        state_manager = StateManager(str(tmp_path / "state.json"), flush_interval=60, background_flush=False)
+        cursor = TransactionCursor(str(tmp_path / "transaction_cursor.json"))
+        job_scheduler = JobScheduler(
+            MQTTPublisher(MagicMock(), "SN1"), state_manager, connection, transaction_cursor=cursor
+        )
+        job_scheduler.backfill_min_interval = 0
+        return job_scheduler
+
+    def lose_panel(self, job_scheduler: JobScheduler):
+        with patch.object(job_scheduler.connection, 'poll_zkteco_changes', return_value=None):
+            assert job_scheduler.polling_job() is None
+
+    def raw_events(self, published, historical: bool):
+        payloads = [
+            json.loads(call.args[2]) for call in published.call_args_list if call.args[1].endswith("/raw_event/state")
+        ]
+        return [payload for payload in payloads if payload.get("historical", False) == historical]
+
+    def test_first_start_only_marks_the_end_of_the_stored_log(self, connection, published, tmp_path):
+        connection.panel.transactions = [transaction("2024-03-01 08:00:00"), transaction("2024-03-01 08:00:01")]
+        job_scheduler = self.make_scheduler(connection, tmp_path)
+
+        job_scheduler.polling_job()
+
+        assert self.raw_events(published, historical=True) == []
+        assert job_scheduler.transaction_cursor.time == "2024-03-01 08:00:01"
+
+    def test_gap_is_backfilled_once_and_handed_off_to_realtime(self, connection, published, tmp_path):
+        panel = connection.panel
+        panel.transactions = [transaction("2024-03-01 08:00:00")]
+        job_scheduler = self.make_scheduler(connection, tmp_path)
+        job_scheduler.polling_job()
+
+        # Outage: two identical events in one second, then the session comes back with a realtime event
+        # and one more stored just after the realtime log was read
+        panel.transactions += [
+            transaction("2024-03-01 09:00:00", card=7), transaction("2024-03-01 09:00:00", card=7),
+            transaction("2024-03-01 09:05:00", door=2), transaction("2024-03-01 09:05:01", door=2, card=8),
+        ]
+        panel.add_events_to_queue([realtime_event("2024-03-01 09:05:00", door=2)])
+        self.lose_panel(job_scheduler)
+
+        assert job_scheduler.polling_job() == 1
+        historical = self.raw_events(published, historical=True)
+        assert [(event["timestamp"][11:19], event["card"]) for event in historical] == [
+            ("09:00:00", "7"), ("09:00:00", "7"), ("09:05:01", "8")
+        ]
+        assert len(self.raw_events(published, historical=False)) == 1
+        assert job_scheduler.state_manager.get_state("door_2") == "ON"
+
+        # The realtime log delivers the event the backfill already took, then a new one
+        panel.add_events_to_queue([realtime_event("2024-03-01 09:05:01", door=2, card=8)])
+        assert job_scheduler.polling_job() == 0
+        panel.add_events_to_queue([realtime_event("2024-03-01 09:06:00")])
+        assert job_scheduler.polling_job() == 1
+        assert len(self.raw_events(published, historical=True)) == 3
+
+        # A restart resumes from the persisted cursor
+        panel.transactions.append(transaction("2024-03-01 09:06:00"))
+        panel.transactions.append(transaction("2024-03-01 10:00:00", card=9))
+        published.reset_mock()
+        self.make_scheduler(connection, tmp_path).polling_job()
+        assert [event["card"] for event in self.raw_events(published, historical=True)] == ["9"]
+
+    @patch('scheduler.jobs.settings.BACKFILL_CHUNK_SIZE', 2)
+    def test_backlog_is_processed_in_chunks_without_state_changes(self, connection, published, tmp_path):
+        connection.panel.transactions = [transaction("2024-03-01 08:00:00")]
+        job_scheduler = self.make_scheduler(connection, tmp_path)
+        job_scheduler.polling_job()
+        connection.panel.transactions += [transaction(f"2024-03-01 09:00:0{second}") for second in range(5)]
+        self.lose_panel(job_scheduler)
+
+        with patch.object(job_scheduler.publisher, 'publish_historical_events') as mock_historical:
+            job_scheduler.polling_job()
+
+        assert [len(call.args[0]) for call in mock_historical.call_args_list] == [2, 2, 1]
+        assert job_scheduler.state_manager.get_state("door_1") != "ON"
+        assert job_scheduler.transaction_cursor.time == "2024-03-01 09:00:04"
+
+    def test_failed_backfill_keeps_the_gap_for_the_next_cycle(self, connection, published, tmp_path):
+        connection.panel.transactions = [transaction("2024-03-01 08:00:00")]
+        job_scheduler = self.make_scheduler(connection, tmp_path)
+        job_scheduler.polling_job()
+        connection.panel.transactions += [transaction("2024-03-01 09:00:00", card=7), transaction("2024-03-01 09:01:00")]
+        connection.panel.add_events_to_queue([realtime_event("2024-03-01 09:01:00")])
+        self.lose_panel(job_scheduler)
+
+        with patch.object(connection, 'fetch_transactions', return_value=None):
+            assert job_scheduler.polling_job() == 1
+        assert job_scheduler.backfill_requested
+        job_scheduler.polling_job()
+
+        assert [event["card"] for event in self.raw_events(published, historical=True)] == ["7"]
+        assert not job_scheduler.backfill_requested
+
+    def test_reconnect_within_a_successful_poll_does_not_backfill(self, connection, published, tmp_path):
+        connection.panel.transactions = [transaction("2024-03-01 08:00:00")]
+        job_scheduler = self.make_scheduler(connection, tmp_path)
+        job_scheduler.polling_job()
+        connection.reconnect_count += 1
+        connection.panel.add_events_to_queue([realtime_event("2024-03-01 09:00:00")])
+
+        with patch.object(connection, 'fetch_transactions') as mock_fetch:
+            assert job_scheduler.polling_job() == 1
+
+        mock_fetch.assert_not_called()
+        assert not job_scheduler.backfill_requested
+
+    def test_backfills_are_rate_limited(self, connection, published, tmp_path):
+        connection.panel.transactions = [transaction("2024-03-01 08:00:00")]
+        job_scheduler = self.make_scheduler(connection, tmp_path)
+        job_scheduler.backfill_min_interval = 300
+        job_scheduler.polling_job()
+        connection.panel.transactions.append(transaction("2024-03-01 09:00:00", card=7))
+
+        with patch.object(connection, 'fetch_transactions', wraps=connection.fetch_transactions) as mock_fetch:
+            for _ in range(3):
+                self.lose_panel(job_scheduler)
+                job_scheduler.polling_job()
+            mock_fetch.assert_not_called()
+            assert job_scheduler.backfill_requested
+
+            job_scheduler._last_backfill_attempt -= 300
+            job_scheduler.polling_job()
+
+        assert mock_fetch.call_count == 1
+        assert [event["card"] for event in self.raw_events(published, historical=True)] == ["7"]
+        assert not job_scheduler.backfill_requested
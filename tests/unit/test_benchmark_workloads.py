@@ -0,0 +1,58 @@
+from collections import Counter
+
+from c3.consts import EventType as C3EventType
+
+from benchmarks.bench_pipeline import compare, percentile
+from benchmarks.workloads import BURST_MIX, FakeMQTTClient, generate_events, split_batches
+from core.event_processor import process_events
+from mqtt import handler as mqtt_handler
+
+
+class TestBenchmarkWorkloads:
+    def test_generated_events_are_reproducible(self):
+        first = generate_events(200, seed=7)
+        second = generate_events(200, seed=7)
+
+        assert [(e.event_type, e.port_nr, e.card_no, e.time_second) for e in first] == \
+               [(e.event_type, e.port_nr, e.card_no, e.time_second) for e in second]
+
+    def test_mix_and_panel_size_are_respected(self):
+        events = generate_events(1000, BURST_MIX, doors=2)
+        event_types = Counter(event.event_type for event in events)
+
+        assert set(event_types) == {
+            C3EventType.NORMAL_PUNCH_OPEN, C3EventType.DOOR_OPENED_CORRECT, C3EventType.DOOR_CLOSED_CORRECT
+        }
+        assert event_types[C3EventType.NORMAL_PUNCH_OPEN] > event_types[C3EventType.DOOR_CLOSED_CORRECT]
+        assert {event.port_nr for event in events} == {1, 2}
+        assert events[0].time_second <= events[-1].time_second
+
+    def test_generated_events_run_through_the_pipeline(self):
+        batches = split_batches(generate_events(100), 20)
+        assert [len(batch) for batch in batches] == [20] * 5
+
+        batch = process_events(batches[0])
+        assert len(batch.processed_events) == 20
+
+    def test_fake_client_accepts_publishes(self):
+        client = FakeMQTTClient()
+
+        assert mqtt_handler.publish_message(client, "topic", "payload") is True
+        assert client.messages == 1
+        assert client.payload_bytes == len("payload")
+
+    def test_compare_reports_regressions_beyond_threshold(self):
+        baseline = {"publish": {"events_per_second": 1000}, "end_to_end": {"events_per_second": 1000}}
+        results = {"publish": {"events_per_second": 850}, "end_to_end": {"events_per_second": 700}}
+
+        regressions = compare(results, baseline, threshold=0.2)
+
+        assert len(regressions) == 1
+        assert regressions[0].startswith("end_to_end")
+
+    def test_percentile(self):
+        values = sorted(float(v) for v in range(1, 101))
+
+        assert percentile(values, 0.5) == 51.0
+        assert percentile(values, 0.99) == 99.0
+        assert percentile([], 0.5) == 0.0
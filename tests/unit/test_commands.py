@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from c3.consts import ControlOutputAddress
+
+from core.state_manager import StateManager
+from ha_integration import discovery as ha_discovery
+from mqtt.publisher import MQTTPublisher
+from mqtt.topics import TopicRegistry
+from scheduler.device_worker import PRIORITY_COMMAND, DeviceWorker
+from scheduler.jobs import JobScheduler
+from zkt.commands import parse_command
+from zkt.handler import ZKTConnection
+
+from tests.mocks.c3 import MockC3
+
+
+class TestParseCommand:
+    @patch('zkt.commands.settings.COMMAND_UNLOCK_SECONDS', 3)
+    def test_lock_payloads(self):
+        assert parse_command("lock_2", "UNLOCK") == ("lock_2", ControlOutputAddress.DOOR_OUTPUT, 2, 3)
+        assert parse_command("lock_2", " lock\n").duration == 0
+
+    def test_aux_output_press(self):
+        command = parse_command("aux_output_1", "PRESS")
+
+        assert command.address == ControlOutputAddress.AUX_OUTPUT
+        assert command.duration > 0
+
+    def test_unknown_commands_are_rejected(self):
+        assert parse_command("lock_1", "EXPLODE") is None
+        assert parse_command("door_x", "UNLOCK") is None
+        assert parse_command("door_1", "UNLOCK") is None
+
+
+class TestDeviceWorker:
+    def test_commands_go_ahead_of_queued_jobs(self):
+        worker = DeviceWorker("test_worker")
+        release = threading.Event()
+        order = []
+        try:
+            worker.submit(release.wait)
+            polls = [worker.submit(order.append, f"poll_{index}") for index in range(2)]
+            command = worker.submit_with_priority(PRIORITY_COMMAND, order.append, "command")
+            release.set()
+            for future in polls + [command]:
+                future.result(timeout=1)
+        finally:
+            worker.shutdown()
+
+        assert order == ["command", "poll_0", "poll_1"]
+
+    def test_run_on_the_worker_itself_does_not_deadlock(self):
+        worker = DeviceWorker("test_worker")
+        try:
+            assert worker.run(lambda: worker.run(lambda: DeviceWorker.current() is worker)) is True
+        finally:
+            worker.shutdown()
+
+    def test_shutdown_cancels_pending_jobs(self):
+        worker = DeviceWorker("test_worker")
+        release = threading.Event()
+        worker.submit(release.wait)
+        pending = worker.submit(time.sleep, 0)
+
+        threading.Timer(0.05, release.set).start()
+        worker.shutdown(wait=True, cancel_futures=True)
+
+        assert pending.cancelled()
+        with pytest.raises(RuntimeError):
+            worker.submit(time.sleep, 0)
+
+
+class TestCommandDiscovery:
+    @patch('ha_integration.discovery.settings.COMMANDS_ENABLED', True)
+    def test_lock_and_button_entities(self, make_device_definition):
+        definition = make_device_definition(doors=1, readers=0, relays=1, aux_inputs=0)
+        topics = TopicRegistry.from_device_definition(definition)
+
+        configs = {object_id: (component, payload) for component, object_id, _, payload in
+                   ha_discovery.build_entity_configs(definition, "zkt_1234567890", topics)}
+
+        assert configs["lock_1"][0] == "lock"
+        assert configs["lock_1"][1]["command_topic"] == topics.command_topic("lock_1")
+        assert configs["lock_1"][1]["state_topic"] == topics.state_topic("relay_lock_1")
+        assert configs["aux_output_1"][0] == "button"
+
+        message = json.loads(next(iter(ha_discovery.build_discovery_messages(definition, "zkt_1234567890", "device", topics).values())))
+        assert message["cmps"]["lock_1"]["cmd_t"] == "~/lock_1/set"
+
+    def test_no_command_entities_by_default(self, make_device_definition):
+        definition = make_device_definition(doors=1, readers=0, relays=1, aux_inputs=0)
+        configs = ha_discovery.build_entity_configs(definition, "zkt_1234567890")
+
+        assert {component for component, _, _, _ in configs} == {"binary_sensor"}
+
+
+class TestCommandPath:
+    @pytest.fixture
+    def job_scheduler(self, tmp_path):
+        with patch('zkt.handler.C3', side_effect=MockC3):
+            connection = ZKTConnection("10.0.0.1", 4370)
+            connection.ensure_connection()
+            state_manager = StateManager(str(tmp_path / "state.json"), flush_interval=60, background_flush=False)
+            job_scheduler = JobScheduler(MQTTPublisher(MagicMock(), "1234567890"), state_manager, connection)
+            job_scheduler.worker = DeviceWorker("test_worker")
+            yield job_scheduler
+            job_scheduler.worker.shutdown()
+
+    def test_unlock_is_confirmed_by_an_immediate_poll(self, job_scheduler):
+        confirmed = threading.Event()
+
+        def publish(client, topic, payload, qos=1, retain=False):
+            if topic.endswith("/relay_lock_1/state") and payload == b"ON":
+                confirmed.set()
+            return True
+
+        connection = job_scheduler.connection
+        calls = MagicMock()
+        release = threading.Event()
+        with patch('mqtt.publisher.mqtt_handler.publish_message', side_effect=publish), \
+                patch.object(connection, 'execute_command', wraps=connection.execute_command) as execute_command, \
+                patch.object(connection, 'poll_zkteco_changes', wraps=connection.poll_zkteco_changes) as poll:
+            calls.attach_mock(execute_command, "command")
+            calls.attach_mock(poll, "poll")
+            job_scheduler.worker.submit(release.wait)
+            queued_poll = job_scheduler.worker.submit(job_scheduler.polling_job)
+
+            job_scheduler.handle_command("lock_1", "UNLOCK")
+            release.set()
+            assert confirmed.wait(5)
+            queued_poll.result(timeout=5)
+
+        # The command jumps the queued poll and is confirmed by a poll of its own
+        assert [name for name, _, _ in calls.mock_calls] == ["command", "poll", "poll"]
+        panel = connection.panel
+        assert [(command.output_number, command.duration) for command in panel.controls] == [(1, 5)]
+        assert job_scheduler.state_manager.get_state("relay_lock_1") == "ON"
+
+    def test_timed_unlock_is_shown_locked_again(self, job_scheduler):
+        clock = [1000.0]
+
+        def unlock():
+            job_scheduler.worker.run(lambda: job_scheduler.run_command(parse_command("lock_1", "UNLOCK"), 0.0))
+            delay, relock = timer.call_args.args
+            return delay, lambda: relock(*timer.call_args.kwargs["args"])
+
+        with patch('mqtt.publisher.mqtt_handler.publish_message') as mock_publish, \
+                patch('scheduler.jobs.threading.Timer') as timer, \
+                patch('scheduler.jobs.time.monotonic', side_effect=lambda: clock[0]):
+            delay, first_relock = unlock()
+            clock[0] += 2
+            _, second_relock = unlock()
+
+            # The first pulse would have ended, but the second unlock extended it
+            clock[0] += delay - 2
+            first_relock()
+            job_scheduler.worker.run(lambda: None)
+            assert job_scheduler.state_manager.get_state("relay_lock_1") == "ON"
+
+            clock[0] += 2
+            second_relock()
+            job_scheduler.worker.run(lambda: None)
+
+        assert delay == 5
+        assert job_scheduler.state_manager.get_state("relay_lock_1") == "OFF"
+        topic, payload = mock_publish.call_args.args[1:3]
+        assert topic.endswith("/relay_lock_1/state") and payload == b"OFF"
+
+    def test_unknown_payload_does_not_reach_the_device(self, job_scheduler):
+        job_scheduler.handle_command("lock_1", "EXPLODE")
+        job_scheduler.worker.run(lambda: None)
+
+        assert job_scheduler.connection.panel.controls == []
@@ -0,0 +1,132 @@
+from unittest.mock import MagicMock, patch
+
+from benchmarks.workloads import generate_events
+from core.dedup import BUCKET_COUNT, DedupIndex, event_key, event_seconds
+from core.state_manager import StateManager
+from core.transaction_cursor import OccurrenceCounter
+from mqtt.publisher import MQTTPublisher
+from scheduler.jobs import JobScheduler
+from zkt.handler import ZKTConnection
+
+from tests.mocks.c3 import MockC3, MockEventRecord
+
+
+def make_event(time: str, door: int = 1, card: int = 1001) -> MockEventRecord:
+    event = MockEventRecord(port_nr=door, card_no=card)
+    event.time_second = time
+    return event
+
+
+def key(serial_number: str, event) -> int:
+    return event_key(serial_number, OccurrenceCounter().position(event))
+
+
+def positions(events):
+    counter = OccurrenceCounter()
+    return [counter.position(event) for event in events]
+
+
+class TestDedupIndex:
+    def test_key_covers_device_time_content_and_occurrence(self):
+        event = make_event("2024-03-01 08:00:00")
+        counter = OccurrenceCounter()
+        first, second = counter.position(event), counter.position(make_event("2024-03-01 08:00:00"))
+
+        assert key("SN1", event) == key("SN1", make_event("2024-03-01 08:00:00"))
+        assert key("SN1", event) != key("SN2", event)
+        assert key("SN1", event) != key("SN1", make_event("2024-03-01 08:00:01"))
+        assert key("SN1", event) != key("SN1", make_event("2024-03-01 08:00:00", door=2))
+        assert key("SN1", event) != key("SN1", make_event("2024-03-01 08:00:00", card=7))
+        assert event_key("SN1", first) != event_key("SN1", second)
+
+    def test_duplicates_are_rejected_and_counted(self):
+        index = DedupIndex(3600)
+
+        assert index.add("SN1", 1, 1000.0)
+        assert not index.add("SN1", 1, 1000.0)
+        assert index.add("SN1", 2, 1000.0)
+        assert index.duplicates == 1
+
+    def test_keys_expire_after_the_horizon(self):
+        index = DedupIndex(600)
+        index.add("SN1", 1, 0.0)
+
+        index.add("SN1", 2, 600.0 + index.bucket_seconds)
+
+        assert index.add("SN1", 1, 700.0)
+        assert len(index) == 2
+
+    def test_horizon_is_kept_per_panel(self):
+        index = DedupIndex(600)
+        index.add("SN1", 1, 1000.0)
+
+        # A panel with its clock a day ahead does not expire the keys of the others
+        index.add("SN2", 2, 1000.0 + 86400)
+
+        assert not index.add("SN1", 1, 1000.0)
+        assert len(index) == 2
+
+    def test_memory_stays_bounded_under_load(self):
+        index = DedupIndex(3600, max_events=1000)
+
+        for number in range(50000):
+            index.add("SN1", number, 1000.0 + number / 100)
+
+        assert len(index) == 1000
+        assert len(index._buckets["SN1"]) <= BUCKET_COUNT
+        assert not index.add("SN1", 49999, 1499.99)
+
+    def test_index_survives_restarts(self, tmp_path):
+        path = str(tmp_path / "dedup_index.json")
+        event = make_event("2024-03-01 08:00:00")
+        index = DedupIndex(3600, path=path)
+        index.add("SN1", key("SN1", event), event_seconds(event))
+        index.save()
+
+        restored = DedupIndex(3600, path=path)
+
+        assert len(restored) == 1
+        assert not restored.add("SN1", key("SN1", event), event_seconds(event))
+        assert len(DedupIndex(7200, path=path)) == 0
+
+    def test_replayed_poll_is_dropped_by_the_job_scheduler(self, tmp_path):
+        state_manager = StateManager(str(tmp_path / "state.json"), flush_interval=60, background_flush=False)
+        publisher = MQTTPublisher(MagicMock(), "SN1")
+        job_scheduler = JobScheduler(publisher, state_manager, dedup_index=DedupIndex(3600))
+        events = generate_events(20)
+
+        assert len(job_scheduler._drop_duplicates(events, positions(events))) == 20
+        assert job_scheduler._drop_duplicates(events, positions(events)) == []
+        assert job_scheduler.dedup_index.duplicates == 20
+
+    def make_polling_scheduler(self, tmp_path):
+        with patch('zkt.handler.C3', side_effect=MockC3):
+            connection = ZKTConnection("10.0.0.1", 4370)
+            connection.ensure_connection()
+        state_manager = StateManager(str(tmp_path / "state.json"), flush_interval=60, background_flush=False)
+        publisher = MQTTPublisher(MagicMock(), "SN1")
+        return JobScheduler(publisher, state_manager, connection, dedup_index=DedupIndex(3600)), connection
+
+    def test_repeats_within_a_second_are_kept(self, tmp_path):
+        job_scheduler, connection = self.make_polling_scheduler(tmp_path)
+        # A card, another card and the first card again within one second
+        connection.panel.add_events_to_queue([
+            make_event("2024-03-01 08:00:00"),
+            make_event("2024-03-01 08:00:00", card=7),
+            make_event("2024-03-01 08:00:00"),
+        ])
+
+        assert job_scheduler.polling_job() == 3
+        assert job_scheduler.dedup_index.duplicates == 0
+
+    def test_event_sent_again_in_a_later_poll_is_published_once(self, tmp_path):
+        job_scheduler, connection = self.make_polling_scheduler(tmp_path)
+
+        with patch.object(job_scheduler.publisher, 'publish_raw_event') as mock_publish:
+            connection.panel.add_events_to_queue([make_event("2024-03-01 08:00:00")])
+            assert job_scheduler._polling_cycle() == 1
+            connection.panel.add_events_to_queue([make_event("2024-03-01 08:00:00")])
+            assert job_scheduler._polling_cycle() == 0
+
+        assert mock_publish.call_count == 1
+        assert job_scheduler.dedup_index.duplicates == 1
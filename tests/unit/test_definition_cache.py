@@ -0,0 +1,67 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from core.definition_cache import DefinitionCache
+from ha_integration import discovery as ha_discovery
+from mqtt import handler as mqtt_handler
+
+
+class TestDefinitionCache:
+    def test_definition_survives_restarts(self, tmp_path, make_device_definition):
+        path = str(tmp_path / "device_definitions.json")
+        DefinitionCache(path).put("10.0.0.1", make_device_definition())
+
+        cached = DefinitionCache(path).get("10.0.0.1")
+
+        assert cached.serial_number == "1234567890"
+        assert cached.to_dict() == make_device_definition().to_dict()
+        assert DefinitionCache(path).get("10.0.0.2") is None
+
+    def test_put_reports_changes(self, tmp_path, make_device_definition):
+        cache = DefinitionCache(str(tmp_path / "device_definitions.json"))
+
+        assert cache.put("10.0.0.1", make_device_definition())
+        assert not cache.put("10.0.0.1", make_device_definition())
+        assert cache.put("10.0.0.1", make_device_definition(doors=4))
+
+    def test_invalid_cache_is_ignored(self, tmp_path):
+        path = tmp_path / "device_definitions.json"
+        path.write_text(json.dumps({"devices": {"10.0.0.1": {"doors": []}}}))
+
+        assert DefinitionCache(str(path)).get("10.0.0.1") is None
+
+
+class TestAvailability:
+    @patch('mqtt.handler.settings.AVAILABILITY_TOPIC', None)
+    def test_topic_defaults_to_one_per_client_id(self):
+        assert mqtt_handler.get_availability_topic("zkt_1234567890") == "zkt_eco/zkt_1234567890/availability"
+        assert mqtt_handler.get_availability_topic("zkt_bridge_2") == "zkt_eco/zkt_bridge_2/availability"
+
+    @patch('mqtt.handler.settings.AVAILABILITY_TOPIC', "site/bridge/availability")
+    def test_configured_topic_is_used_as_is(self):
+        assert mqtt_handler.get_availability_topic("zkt_1234567890") == "site/bridge/availability"
+
+    @patch('mqtt.handler.availability_topic', "zkt_eco/zkt_1234567890/availability")
+    def test_online_is_published_on_connect(self):
+        client = MagicMock()
+
+        mqtt_handler.on_connect(client, None, None, 0)
+
+        client.publish.assert_any_call("zkt_eco/zkt_1234567890/availability", "online", qos=1, retain=True)
+
+    @patch('mqtt.handler.settings.AVAILABILITY_TOPIC', "")
+    def test_disabled_availability_publishes_nothing(self):
+        assert mqtt_handler.get_availability_topic("zkt_1234567890") is None
+        client = MagicMock()
+
+        with patch('mqtt.handler.availability_topic', None):
+            assert mqtt_handler.publish_availability(client, False) is None
+        client.publish.assert_not_called()
+
+    @patch('mqtt.handler.availability_topic', "zkt_eco/zkt_1234567890/availability")
+    def test_entities_follow_the_bridge_availability(self, make_device_definition):
+        configs = ha_discovery.build_entity_configs(make_device_definition(), "zkt_1234567890")
+
+        assert {payload["availability_topic"] for _, _, _, payload in configs} == {
+            "zkt_eco/zkt_1234567890/availability"
+        }
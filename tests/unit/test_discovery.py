@@ -0,0 +1,159 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import settings
+from ha_integration import discovery as ha_discovery
+from ha_integration.discovery_cache import DiscoveryCache
+
+
+class TestDiscovery:
+    @pytest.fixture
+    def cache_path(self, tmp_path):
+        return str(tmp_path / "discovery_cache.json")
+
+    @pytest.fixture
+    def published(self):
+        with patch('ha_integration.discovery.mqtt_handler.publish_message', return_value=True) as mock_publish:
+            yield mock_publish
+
+    @staticmethod
+    def published_topics(mock_publish):
+        return {call.args[1]: call.args[2] for call in mock_publish.call_args_list}
+
+    def test_build_discovery_messages_covers_all_entities(self, make_device_definition):
+        messages = ha_discovery.build_discovery_messages(make_device_definition(), "zkt_1234567890")
+
+        # doors + 2 per reader + relays + aux inputs
+        assert len(messages) == 2 + 2 * 2 + 2 + 1
+        for payload in messages.values():
+            assert json.loads(payload)["device"]["identifiers"] == ["1234567890"]
+
+    def test_without_cache_every_config_is_published(self, published, make_device_definition):
+        definition = make_device_definition()
+
+        ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890")
+        ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890")
+
+        assert published.call_count == 2 * 9
+
+    def test_unchanged_configs_are_not_republished(self, published, cache_path, make_device_definition):
+        definition = make_device_definition()
+        ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+        assert published.call_count == 9
+
+        published.reset_mock()
+        ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+        assert published.call_count == 0
+
+    def test_changed_configs_are_republished(self, published, cache_path, make_device_definition):
+        definition = make_device_definition()
+        ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+        published.reset_mock()
+
+        with patch.object(settings, 'HA_DEVICE_NAME', "Renamed Controller"):
+            ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+
+        assert published.call_count == 9
+
+    def test_removed_entities_are_cleared(self, published, cache_path, make_device_definition):
+        ha_discovery.publish_discovery_messages(
+            MagicMock(), make_device_definition(), "zkt_1234567890", DiscoveryCache(cache_path)
+        )
+        published.reset_mock()
+
+        ha_discovery.publish_discovery_messages(
+            MagicMock(), make_device_definition(doors=1), "zkt_1234567890", DiscoveryCache(cache_path)
+        )
+
+        topics = self.published_topics(published)
+        assert list(topics.values()) == [""]
+        assert "/door_2/config" in next(iter(topics))
+        assert all(call.kwargs["retain"] for call in published.call_args_list)
+
+        published.reset_mock()
+        ha_discovery.publish_discovery_messages(
+            MagicMock(), make_device_definition(doors=1), "zkt_1234567890", DiscoveryCache(cache_path)
+        )
+        assert published.call_count == 0
+
+    def test_force_republishes_everything(self, published, cache_path, make_device_definition):
+        definition = make_device_definition()
+        ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+        published.reset_mock()
+
+        ha_discovery.publish_discovery_messages(
+            MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path), force=True
+        )
+
+        assert published.call_count == 9
+
+    def test_failed_publishes_are_retried_next_time(self, published, cache_path, make_device_definition):
+        definition = make_device_definition()
+        published.return_value = False
+        ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+
+        published.reset_mock()
+        published.return_value = True
+        ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+
+        assert published.call_count == 9
+
+    def test_cache_is_kept_per_device(self, cache_path):
+        cache = DiscoveryCache(cache_path)
+        cache.mark_published("A", "topic/a", "payload")
+
+        changed, removed = cache.get_changes("B", {"topic/b": "payload"})
+
+        assert changed == {"topic/b": "payload"}
+        assert removed == []
+
+    def test_corrupt_cache_republishes_everything(self, cache_path):
+        with open(cache_path, "w") as f:
+            f.write("{not json")
+
+        cache = DiscoveryCache(cache_path)
+        changed, removed = cache.get_changes("A", {"topic/a": "payload"})
+
+        assert changed == {"topic/a": "payload"}
+        assert removed == []
+
+    def test_device_mode_sends_one_abbreviated_message(self, make_device_definition):
+        definition = make_device_definition()
+        entity_messages = ha_discovery.build_discovery_messages(definition, "zkt_1234567890", mode="entity")
+        device_messages = ha_discovery.build_discovery_messages(definition, "zkt_1234567890", mode="device")
+
+        assert list(device_messages) == ["homeassistant/device/1234567890/config"]
+        payload = json.loads(device_messages["homeassistant/device/1234567890/config"])
+        assert payload["dev"]["ids"] == ["1234567890"]
+        assert payload["o"]["name"] == "zkt_mqtt_bridge"
+        assert payload["qos"] == 1
+
+        components = payload["cmps"]
+        assert len(components) == len(entity_messages)
+        assert components["door_1"]["p"] == "binary_sensor"
+        assert components["door_1"]["dev_cla"] == "door"
+        assert components["door_1"]["uniq_id"] == "zkt_1234567890_door_1"
+        assert payload["~"] + components["door_1"]["stat_t"][1:] == ha_discovery.build_state_topic("door_1", "1234567890")
+        assert components["reader_1_scan"]["p"] == "event"
+        assert components["reader_1_card"]["val_tpl"] == "{{ value_json.card_id }}"
+        assert "dev" not in components["door_1"]
+
+        entity_bytes = sum(len(payload) for payload in entity_messages.values())
+        device_bytes = len(device_messages["homeassistant/device/1234567890/config"])
+        assert device_bytes < entity_bytes * 0.7
+
+    def test_switching_to_device_mode_clears_entity_configs_first(self, published, cache_path, make_device_definition):
+        definition = make_device_definition()
+        with patch.object(settings, 'HA_DISCOVERY_MODE', "entity"):
+            ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+        published.reset_mock()
+
+        with patch.object(settings, 'HA_DISCOVERY_MODE', "device"):
+            ha_discovery.publish_discovery_messages(MagicMock(), definition, "zkt_1234567890", DiscoveryCache(cache_path))
+
+        payloads = [call.args[2] for call in published.call_args_list]
+        assert payloads[:9] == [""] * 9
+        assert len(payloads) == 10
+        assert published.call_args_list[-1].args[1] == "homeassistant/device/1234567890/config"
@@ -0,0 +1,102 @@
+import csv
+import datetime
+import io
+import json
+import sqlite3
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from benchmarks.workloads import generate_events
+from core.event_archive import COLUMNS, EventArchive, export_events, iter_events
+from core.models import EventType, ProcessedEvent
+from core.state_manager import StateManager
+from mqtt.publisher import MQTTPublisher
+from scheduler.jobs import JobScheduler
+
+START = datetime.datetime(2024, 3, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+
+
+def make_event(minutes: int, door: int = 1, card: str = "1001") -> ProcessedEvent:
+    return ProcessedEvent(
+        event_type=EventType.CARD_SCAN_SUCCESS,
+        door_id=door,
+        reader_id=door,
+        timestamp=START + datetime.timedelta(minutes=minutes),
+        card_id=card,
+        verify_mode="card",
+        zk_event_code=0,
+        zk_event_desc="Normal Punch Open"
+    )
+
+
+class TestEventArchive:
+    @pytest.fixture
+    def archive_path(self, tmp_path):
+        return str(tmp_path / "events.sqlite3")
+
+    @pytest.fixture
+    def archive(self, archive_path):
+        event_archive = EventArchive(archive_path, retention_days=1)
+        yield event_archive
+        event_archive.close()
+
+    def test_uses_wal_mode(self, archive, archive_path):
+        with sqlite3.connect(archive_path) as connection:
+            assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_batches_are_stored_and_filtered(self, archive, archive_path):
+        assert archive.add_events("SN1", [make_event(0), make_event(1, door=2, card="2002"), make_event(2)]) == 3
+        archive.add_events("SN2", [make_event(3)])
+
+        assert archive.count() == 4
+        assert [row[COLUMNS.index("door")] for row in iter_events(archive_path, door=2)] == [2]
+        assert len(list(iter_events(archive_path, card="1001"))) == 3
+        assert len(list(iter_events(archive_path, device="SN2"))) == 1
+        in_range = list(iter_events(archive_path, START + datetime.timedelta(minutes=1), START + datetime.timedelta(minutes=3)))
+        assert [row[COLUMNS.index("timestamp")] for row in in_range] == [
+            (START + datetime.timedelta(minutes=1)).isoformat(), (START + datetime.timedelta(minutes=2)).isoformat()
+        ]
+
+    def test_prune_deletes_events_past_retention(self, archive):
+        archive.add_events("SN1", [make_event(0), make_event(60 * 24 + 30)])
+
+        deleted = archive.prune(now=(START + datetime.timedelta(days=1, hours=1)).timestamp())
+
+        assert deleted == 1
+        assert archive.count() == 1
+
+    def test_exports_ndjson_and_csv(self, archive, archive_path):
+        archive.add_events("SN1", [make_event(0), make_event(1)])
+
+        ndjson = io.StringIO()
+        assert export_events(iter_events(archive_path), ndjson, "ndjson") == 2
+        first = json.loads(ndjson.getvalue().splitlines()[0])
+        assert first["device"] == "SN1"
+        assert first["card"] == "1001"
+        assert "pin" not in first
+
+        csv_output = io.StringIO()
+        export_events(iter_events(archive_path), csv_output, "csv")
+        rows = list(csv.reader(io.StringIO(csv_output.getvalue())))
+        assert rows[0] == list(COLUMNS)
+        assert len(rows) == 3
+
+    def test_export_streams_in_chunks(self, archive, archive_path):
+        archive.add_events("SN1", [make_event(minute) for minute in range(2500)])
+
+        rows = iter_events(archive_path)
+        first = next(rows)
+
+        assert first[COLUMNS.index("timestamp")] == START.isoformat()
+        assert sum(1 for _ in rows) == 2499
+
+    def test_job_scheduler_archives_processed_events(self, archive, archive_path, tmp_path):
+        state_manager = StateManager(str(tmp_path / "state.json"), flush_interval=60, background_flush=False)
+        job_scheduler = JobScheduler(MQTTPublisher(MagicMock(), "SN1"), state_manager, event_archive=archive)
+
+        job_scheduler._process_events(generate_events(20))
+
+        assert archive.count() == 20
+        assert "archive" in job_scheduler.stage_times
@@ -0,0 +1,179 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from c3.consts import EventType as C3EventType, VerificationMode, InOutDirection
+
+from core.event_processor import (
+    EVENT_CLASSIFICATIONS,
+    classify_event,
+    map_zk_event_to_ha_type,
+    determine_door_state,
+    determine_lock_relay_state,
+    determine_aux_input_state,
+    process_event,
+    process_events,
+)
+from core.models import EventType
+
+from tests.mocks.c3 import MockEventRecord
+
+
+# Reference copies of the original if/elif based classification, used to prove the
+# precompiled lookup table is equivalent.
+def legacy_map_zk_event_to_ha_type(event_type, verification) -> EventType:
+    if event_type == C3EventType.NA:
+        return EventType.OTHER
+    if event_type in [
+        C3EventType.NORMAL_PUNCH_OPEN, C3EventType.OPEN_NORMAL_OPEN_TZ, C3EventType.OPENING_TIMEOUT,
+        C3EventType.DOOR_OPENED_CORRECT, C3EventType.EXIT_BUTTON_OPEN, C3EventType.REMOTE_NORMAL_OPEN,
+        C3EventType.MULTI_CARD_AUTH, C3EventType.FAILED_CLOSE_NORMAL_OPEN_TZ
+    ]:
+        return EventType.DOOR_OPEN
+    elif event_type == C3EventType.DOOR_CLOSED_CORRECT:
+        return EventType.DOOR_CLOSE
+    elif event_type == C3EventType.EXIT_BUTTON_OPEN:
+        return EventType.DOOR_BUTTON
+    elif event_type == C3EventType.AUX_INPUT_DISCONNECT:
+        return EventType.AUX_INPUT_DISCONNECTED
+    elif event_type == C3EventType.AUX_INPUT_SHORT:
+        return EventType.AUX_INPUT_CONNECTED
+    elif event_type in [C3EventType.NORMAL_PUNCH_OPEN, C3EventType.PUNCH_NORMAL_OPEN_TZ] and verification == VerificationMode.CARD:
+        return EventType.CARD_SCAN_SUCCESS
+    elif event_type in [
+        C3EventType.TOO_SHORT_PUNCH_INTERVAL, C3EventType.DOOR_INACTIVE_TZ, C3EventType.ILLEGAL_TZ,
+        C3EventType.ACCESS_DENIED, C3EventType.ANTI_PASSBACK, C3EventType.INTERLOCK, C3EventType.CARD_EXPIRED
+    ]:
+        return EventType.CARD_SCAN_DENIED
+    elif event_type == C3EventType.UNREGISTERED_CARD:
+        return EventType.CARD_SCAN_INVALID
+    elif event_type in [C3EventType.PASSWORD_ERROR, C3EventType.DURESS_PASSWORD_OPEN]:
+        return EventType.PIN_DENIED
+    elif event_type in [C3EventType.FP_EXPIRED, C3EventType.DURESS_FP_OPEN]:
+        return EventType.FINGERPRINT_DENIED
+    elif event_type == C3EventType.UNREGISTERED_FP:
+        return EventType.FINGERPRINT_INVALID
+    elif verification == VerificationMode.CARD:
+        return EventType.CARD_SCAN_SUCCESS
+    elif verification == VerificationMode.PASSWORD:
+        return EventType.PIN_SUCCESS
+    elif verification == VerificationMode.FINGER:
+        return EventType.FINGERPRINT_SUCCESS
+    elif verification in [VerificationMode.CARD_OR_FINGER, VerificationMode.CARD_WITH_FINGER, VerificationMode.CARD_WITH_PASSWORD]:
+        return EventType.OTHER_SUCCESS
+    return EventType.OTHER
+
+def legacy_door_state(code):
+    if code in [e.value for e in [
+        C3EventType.NORMAL_PUNCH_OPEN, C3EventType.OPEN_NORMAL_OPEN_TZ, C3EventType.OPENING_TIMEOUT,
+        C3EventType.DOOR_OPENED_CORRECT, C3EventType.EXIT_BUTTON_OPEN, C3EventType.REMOTE_NORMAL_OPEN,
+        C3EventType.MULTI_CARD_AUTH, C3EventType.FAILED_CLOSE_NORMAL_OPEN_TZ
+    ]]:
+        return "ON"
+    elif code == C3EventType.DOOR_CLOSED_CORRECT.value:
+        return "OFF"
+    return None
+
+def legacy_lock_relay_state(code):
+    if code in [e.value for e in [
+        C3EventType.NORMAL_PUNCH_OPEN, C3EventType.PUNCH_NORMAL_OPEN_TZ, C3EventType.FIRST_CARD_NORMAL_OPEN,
+        C3EventType.MULTI_CARD_OPEN, C3EventType.EMERGENCY_PASS_OPEN, C3EventType.OPEN_NORMAL_OPEN_TZ,
+        C3EventType.REMOTE_OPENING, C3EventType.PRESS_FINGER_OPEN, C3EventType.MULTI_CARD_OPEN_FP,
+        C3EventType.FP_NORMAL_OPEN_TZ, C3EventType.CARD_FP_OPEN, C3EventType.FIRST_CARD_NORMAL_OPEN_FP,
+        C3EventType.FIRST_CARD_NORMAL_OPEN_CARD_FP, C3EventType.DURESS_PASSWORD_OPEN, C3EventType.DURESS_FP_OPEN,
+        C3EventType.DOOR_OPENED_CORRECT, C3EventType.EXIT_BUTTON_OPEN, C3EventType.MULTI_CARD_OPEN_CARD_FP,
+        C3EventType.REMOTE_NORMAL_OPEN
+    ]]:
+        return "ON"
+    elif code in [C3EventType.REMOTE_CLOSING.value, C3EventType.DOOR_CLOSED_CORRECT.value, C3EventType.NORMAL_OPEN_TZ_OVER.value]:
+        return "OFF"
+    return None
+
+def legacy_aux_input_state(code):
+    if code == C3EventType.AUX_INPUT_SHORT.value:
+        return "ON"
+    elif code == C3EventType.AUX_INPUT_DISCONNECT.value:
+        return "OFF"
+    return None
+
+ALL_COMBINATIONS = list(itertools.product(C3EventType, VerificationMode))
+
+
+class TestEventClassification:
+    def test_table_covers_all_combinations(self):
+        assert len(EVENT_CLASSIFICATIONS) == len(ALL_COMBINATIONS)
+
+    @pytest.mark.parametrize("event_type,verification", ALL_COMBINATIONS)
+    def test_equivalent_to_legacy_logic(self, event_type, verification):
+        event = MockEventRecord(event_type=event_type, verified=verification)
+        processed = SimpleNamespace(zk_event_code=event_type.value)
+
+        assert map_zk_event_to_ha_type(event) == legacy_map_zk_event_to_ha_type(event_type, verification)
+        assert determine_door_state(processed) == legacy_door_state(event_type.value)
+        assert determine_lock_relay_state(processed) == legacy_lock_relay_state(event_type.value)
+        assert determine_aux_input_state(processed) == legacy_aux_input_state(event_type.value)
+
+        classification = classify_event(event_type, verification)
+        assert classification.zk_event_desc == event_type.description
+        assert classification.verify_mode == str(verification)
+
+    def test_lookup_accepts_plain_ints(self):
+        assert classify_event(C3EventType.DOOR_CLOSED_CORRECT.value, VerificationMode.NONE.value).ha_event_type == EventType.DOOR_CLOSE
+
+    def test_unknown_codes_have_no_state_effects(self):
+        processed = SimpleNamespace(zk_event_code=9999)
+
+        assert determine_door_state(processed) is None
+        assert determine_lock_relay_state(processed) is None
+        assert determine_aux_input_state(processed) is None
+
+    def test_process_event_uses_classification(self):
+        event = MockEventRecord(
+            port_nr=2, card_no=123, event_type=C3EventType.ACCESS_DENIED,
+            verified=VerificationMode.CARD, in_out_state=InOutDirection.ENTRY
+        )
+
+        processed = process_event(event)
+
+        assert processed.event_type == EventType.CARD_SCAN_DENIED
+        assert processed.zk_event_desc == C3EventType.ACCESS_DENIED.description
+        assert processed.verify_mode == str(VerificationMode.CARD)
+        assert processed.card_id == "123"
+        assert processed.door_id == 2
+
+
+class TestProcessEvents:
+    def test_collapses_entity_states_last_writer_wins(self):
+        raw_events = [
+            MockEventRecord(port_nr=1, event_type=C3EventType.DOOR_OPENED_CORRECT, verified=VerificationMode.NONE),
+            MockEventRecord(port_nr=1, event_type=C3EventType.DOOR_CLOSED_CORRECT, verified=VerificationMode.NONE),
+            MockEventRecord(port_nr=1, event_type=C3EventType.DOOR_OPENED_CORRECT, verified=VerificationMode.NONE),
+            MockEventRecord(port_nr=2, event_type=C3EventType.AUX_INPUT_SHORT, verified=VerificationMode.NONE),
+        ]
+
+        batch = process_events(raw_events)
+
+        assert len(batch.processed_events) == 4
+        assert batch.entity_states["door_1"] == "ON"
+        assert batch.entity_states["relay_lock_1"] == "ON"
+        assert batch.entity_states["aux_input_2"] == "ON"
+
+    def test_reader_scans_are_kept_individually_in_order(self):
+        raw_events = [
+            MockEventRecord(port_nr=1, card_no=111, event_type=C3EventType.NORMAL_PUNCH_OPEN),
+            MockEventRecord(port_nr=2, card_no=222, event_type=C3EventType.ACCESS_DENIED),
+            MockEventRecord(port_nr=1, card_no=333, event_type=C3EventType.NORMAL_PUNCH_OPEN),
+        ]
+
+        batch = process_events(raw_events)
+
+        scans = [state for state in batch.event_states if state.entity_id.endswith("_scan")]
+        assert [state.entity_id for state in scans] == ["reader_1_scan", "reader_2_scan", "reader_1_scan"]
+        assert '"card_id": "111"' in scans[0].state
+        assert '"card_id": "333"' in scans[2].state
+        assert '"card_id": "333"' in batch.entity_states["reader_1_card"]
+
+    def test_skips_unprocessable_events(self):
+        batch = process_events([object(), MockEventRecord(port_nr=1)])
+
+        assert len(batch.processed_events) == 1
@@ -0,0 +1,85 @@
+import io
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+from core.logging_setup import JsonFormatter, NonBlockingQueueHandler, configure_logging, parse_module_levels, stop_logging
+
+
+def make_record(msg="Polled %s", args=("10.0.0.1",), exc_info=None, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("zkt.handler", logging.INFO, __file__, 1, msg, args, exc_info)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestLoggingSetup:
+    @pytest.fixture
+    def root_logger(self):
+        root = logging.getLogger()
+        handlers, level = list(root.handlers), root.level
+        yield root
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+
+    def test_parse_module_levels(self):
+        levels = parse_module_levels("mqtt=debug, zkt.handler=WARNING,bad,core=LOUD,")
+
+        assert levels == {"mqtt": logging.DEBUG, "zkt.handler": logging.WARNING}
+
+    def test_json_formatter_includes_extra_fields(self):
+        line = JsonFormatter().format(make_record(device="10.0.0.1:4370", events=3))
+
+        data = json.loads(line)
+        assert data["message"] == "Polled 10.0.0.1"
+        assert data["level"] == "INFO"
+        assert data["logger"] == "zkt.handler"
+        assert data["device"] == "10.0.0.1:4370"
+        assert data["events"] == 3
+
+    def test_json_formatter_includes_exception(self):
+        try:
+            raise ValueError("device gone")
+        except ValueError:
+            record = make_record(exc_info=sys.exc_info())
+
+        assert "ValueError: device gone" in json.loads(JsonFormatter().format(record))["exception"]
+
+    def test_message_is_merged_before_queueing(self):
+        log_queue = queue.Queue()
+        handler = NonBlockingQueueHandler(log_queue)
+        states = ["unlocked"]
+
+        handler.emit(make_record("States %s", (states,)))
+        states.append("locked")
+
+        record = log_queue.get_nowait()
+        assert record.getMessage() == "States ['unlocked']"
+        assert record.args is None
+
+    def test_full_queue_drops_records_without_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+
+        for _ in range(3):
+            handler.emit(make_record())
+
+        assert handler.dropped == 2
+
+    def test_pipeline_writes_json_with_module_levels(self, root_logger):
+        stream = io.StringIO()
+        listener = configure_logging("WARNING", "json", {"test.verbose": logging.DEBUG}, stream=stream)
+        try:
+            logging.getLogger("test.verbose").debug("Visible %d", 1)
+            logging.getLogger("test.quiet").info("Hidden")
+            logging.getLogger("test.quiet").error("Failed")
+        finally:
+            stop_logging(listener, root_logger.handlers[0])
+            logging.getLogger("test.verbose").setLevel(logging.NOTSET)
+
+        messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+        assert messages == ["Visible 1", "Failed"]
@@ -0,0 +1,122 @@
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from metrics import bridge as metrics
+from metrics.registry import Counter, Gauge, Histogram, Registry
+from metrics.server import MetricsServer
+from mqtt import handler as mqtt_handler
+from zkt.handler import ZKTConnection
+
+from tests.mocks.c3 import MockC3
+
+
+def sample(metric, suffix="", **labels) -> float:
+    """Reads one sample of a registered metric back from its rendered text."""
+    wanted = metric.name + suffix
+    if labels:
+        wanted += "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+    for line in metric.collect():
+        name, _, value = line.rpartition(" ")
+        if name == wanted:
+            return float(value)
+    return 0.0
+
+
+class TestRegistry:
+    def test_render_counters_and_gauges(self):
+        registry = Registry()
+        publishes = registry.register(Counter("test_publishes_total", "Publishes.", ["result"]))
+        depth = registry.register(Gauge("test_depth", "Depth."))
+        publishes.labels(result="ok").inc()
+        publishes.labels(result="ok").inc(2)
+        depth.set_function(lambda: 7)
+
+        text = registry.render()
+
+        assert "# HELP test_publishes_total Publishes.\n# TYPE test_publishes_total counter\n" in text
+        assert 'test_publishes_total{result="ok"} 3\n' in text
+        assert "# TYPE test_depth gauge\ntest_depth 7\n" in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        duration = registry.register(Histogram("test_seconds", "Duration.", buckets=(0.1, 1.0)))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            duration.observe(value)
+
+        lines = registry.render().splitlines()
+
+        assert 'test_seconds_bucket{le="0.1"} 2' in lines
+        assert 'test_seconds_bucket{le="1"} 3' in lines
+        assert 'test_seconds_bucket{le="+Inf"} 4' in lines
+        assert "test_seconds_sum 3.65" in lines
+        assert "test_seconds_count 4" in lines
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        errors = registry.register(Counter("test_errors_total", "Errors.", ["reason"]))
+        errors.labels(reason='bad "quote"\n').inc()
+
+        assert 'test_errors_total{reason="bad \\"quote\\"\\n"} 1' in registry.render()
+
+    def test_duplicate_names_are_rejected(self):
+        registry = Registry()
+        registry.register(Counter("test_total", "Test."))
+
+        with pytest.raises(ValueError):
+            registry.register(Counter("test_total", "Test."))
+
+
+class TestBridgeMetrics:
+    def test_publish_results_are_counted(self):
+        client = MagicMock()
+        client.is_connected.return_value = True
+        client.publish.return_value.rc = mqtt.MQTT_ERR_SUCCESS
+        ok_before = sample(metrics.MQTT_PUBLISHES, result="ok")
+        failed_before = sample(metrics.MQTT_PUBLISHES, result="failed")
+
+        mqtt_handler.publish_message(client, "topic", "payload")
+        client.publish.return_value.rc = mqtt.MQTT_ERR_NO_CONN
+        mqtt_handler.publish_message(client, "topic", "payload")
+
+        assert sample(metrics.MQTT_PUBLISHES, result="ok") == ok_before + 1
+        assert sample(metrics.MQTT_PUBLISHES, result="failed") == failed_before + 1
+
+    @patch('zkt.handler.C3', side_effect=MockC3)
+    def test_polls_are_timed_and_counted(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.91", 4370)
+        connection.ensure_connection()
+        connection.panel.add_events_to_queue([connection.panel.generate_event() for _ in range(3)])
+
+        connection.poll_zkteco_changes()
+
+        assert sample(metrics.POLL_DURATION, "_count", device="10.0.0.91:4370") == 1
+        assert sample(metrics.POLL_EVENTS, "_sum", device="10.0.0.91:4370") == 3
+
+
+class TestMetricsServer:
+    @pytest.fixture
+    def server(self):
+        registry = Registry()
+        registry.register(Counter("test_scrapes_total", "Scrapes.")).inc()
+        metrics_server = MetricsServer("127.0.0.1", 0, registry)
+        metrics_server.start()
+        yield metrics_server
+        metrics_server.stop()
+
+    def test_serves_metrics(self, server):
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+            content_type = response.headers["Content-Type"]
+
+        assert content_type.startswith("text/plain; version=0.0.4")
+        assert "test_scrapes_total 1" in body
+
+    def test_other_paths_are_not_found(self, server):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/", timeout=5)
+
+        assert error.value.code == 404
@@ -0,0 +1,160 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import paho.mqtt.client as mqtt
+
+from mqtt import handler as mqtt_handler
+from mqtt.spool import MessageSpool
+
+
+class FakeClient:
+    def __init__(self, connected=True):
+        self.connected = connected
+        self.published = []
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, qos, retain))
+        return SimpleNamespace(rc=mqtt.MQTT_ERR_SUCCESS)
+
+
+class TestMessageSpool:
+    @pytest.fixture
+    def spool_dir(self, tmp_path):
+        return str(tmp_path / "spool")
+
+    def replay(self, spool, client):
+        spool.start_replay(client)
+        spool._replay_thread.join(timeout=5)
+
+    def test_replays_in_order(self, spool_dir):
+        spool = MessageSpool(spool_dir, segment_bytes=200, replay_rate=0)
+        for i in range(20):
+            spool.append(f"topic/{i}", f"payload {i}", 1, False)
+        assert spool.depth == 20
+
+        client = FakeClient()
+        self.replay(spool, client)
+
+        assert [message[0] for message in client.published] == [f"topic/{i}" for i in range(20)]
+        assert spool.depth == 0
+        assert spool.replayed == 20
+        assert not [name for name in os.listdir(spool_dir) if name.startswith("segment-")]
+
+    def test_bounded_size_drops_oldest(self, spool_dir):
+        spool = MessageSpool(spool_dir, max_bytes=1000, segment_bytes=200)
+        for i in range(100):
+            spool.append("topic", f"payload {i:04d}", 1, False)
+
+        assert spool.dropped > 0
+        assert spool.depth + spool.dropped == 100
+        total_size = sum(os.path.getsize(os.path.join(spool_dir, name)) for name in os.listdir(spool_dir) if name.startswith("segment-"))
+        assert total_size <= 1000 + 200
+
+        client = FakeClient()
+        self.replay(spool, client)
+        assert client.published[-1][1] == "payload 0099"
+        assert len(client.published) == 100 - spool.dropped
+
+    def test_survives_restart(self, spool_dir):
+        spool = MessageSpool(spool_dir, replay_rate=0)
+        for i in range(150):
+            spool.append("topic", str(i), 0, True)
+
+        client = FakeClient()
+        with patch.object(client, 'publish', side_effect=lambda *args, **kwargs: (
+            client.published.append(args),
+            SimpleNamespace(rc=mqtt.MQTT_ERR_SUCCESS if len(client.published) <= 120 else mqtt.MQTT_ERR_NO_CONN)
+        )[1]):
+            self.replay(spool, client)
+        spool.close()
+
+        restarted = MessageSpool(spool_dir, replay_rate=0)
+        assert restarted.depth == 30
+
+        client = FakeClient()
+        self.replay(restarted, client)
+        assert [message[1] for message in client.published] == [str(i) for i in range(120, 150)]
+        assert client.published[0][3] is True
+
+    def test_partly_written_message_is_dropped_on_restart(self, spool_dir):
+        spool = MessageSpool(spool_dir, replay_rate=0)
+        spool.append("topic", "1", 0, False)
+        spool.append("topic", "2", 0, False)
+        spool.close()
+        # Killed in the middle of writing the third message
+        [segment] = [name for name in os.listdir(spool_dir) if name.endswith(".ndjson")]
+        with open(os.path.join(spool_dir, segment), "ab") as f:
+            f.write(b'{"t": "topic", "p": "3"')
+
+        restarted = MessageSpool(spool_dir, replay_rate=0)
+        assert restarted.depth == 2
+
+        client = FakeClient()
+        self.replay(restarted, client)
+        assert [message[1] for message in client.published] == ["1", "2"]
+        assert restarted.depth == 0
+        restarted.append("topic", "4", 0, False)
+        assert restarted.depth == 1
+
+
+class TestPublishMessageSpooling:
+    @pytest.fixture
+    def spool(self, tmp_path):
+        spool = MessageSpool(str(tmp_path / "spool"), replay_rate=0)
+        mqtt_handler.configure_spool(spool)
+        yield spool
+        mqtt_handler.configure_spool(None)
+        spool.close()
+
+    def test_spools_while_disconnected(self, spool):
+        client = FakeClient(connected=False)
+
+        assert mqtt_handler.publish_message(client, "a/state", "ON") is True
+        assert mqtt_handler.publish_message(client, "b/state", "OFF") is True
+        assert client.published == []
+        assert spool.depth == 2
+
+    def test_keeps_order_until_spool_is_drained(self, spool):
+        client = FakeClient(connected=False)
+        mqtt_handler.publish_message(client, "a/state", "1")
+        client.connected = True
+        mqtt_handler.publish_message(client, "a/state", "2")
+        assert client.published == []
+
+        mqtt_handler.on_connect(client, None, None, 0)
+        spool._replay_thread.join(timeout=5)
+        mqtt_handler.publish_message(client, "a/state", "3")
+
+        assert [message[1] for message in client.published if message[0] == "a/state"] == ["1", "2", "3"]
+
+    def test_replay_recovers_from_a_full_queue_without_a_reconnect(self, spool):
+        client = FakeClient(connected=False)
+        mqtt_handler.publish_message(client, "a/state", "1")
+        client.connected = True
+        rejected = []
+
+        def publish(topic, payload, qos=0, retain=False):
+            if topic == "a/state" and not rejected:
+                rejected.append(payload)
+                return SimpleNamespace(rc=mqtt.MQTT_ERR_QUEUE_SIZE)
+            return FakeClient.publish(client, topic, payload, qos, retain)
+
+        with patch.object(client, 'publish', side_effect=publish):
+            mqtt_handler.on_connect(client, None, None, 0)
+            spool._replay_thread.join(timeout=5)
+            assert spool.depth == 0
+
+            # A replay that ended while connected is started again by the next publish
+            spool.append("a/state", "2", 1, False)
+            for payload in ("3", "4"):
+                mqtt_handler.publish_message(client, "a/state", payload)
+            spool._replay_thread.join(timeout=5)
+
+        assert rejected == ["1"]
+        assert [message[1] for message in client.published if message[0] == "a/state"] == ["1", "2", "3", "4"]
+        assert spool.depth == 0
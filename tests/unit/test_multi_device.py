@@ -0,0 +1,87 @@
+import time
+import threading
+from unittest.mock import patch, MagicMock
+
+import settings
+from zkt.handler import ZKTConnection
+from scheduler.multi_device import MultiDeviceScheduler
+
+from tests.mocks.c3 import MockC3
+
+
+class TestMultiDevice:
+    def test_parse_device_list(self):
+        devices = settings.parse_device_list("10.0.0.1, 10.0.0.2:4371,10.0.0.3:4372:se:cret,")
+
+        assert [d["ip"] for d in devices] == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+        assert devices[0]["port"] == settings.ZKT_DEVICE_PORT
+        assert devices[1]["port"] == 4371
+        assert devices[2]["password"] == "se:cret"
+
+    @patch('zkt.handler.C3', side_effect=MockC3)
+    def test_connections_are_independent(self, mock_c3_class):
+        first = ZKTConnection("10.0.0.1", 4370)
+        second = ZKTConnection("10.0.0.2", 4370)
+
+        first.ensure_connection()
+        second.ensure_connection()
+
+        assert first.panel is not second.panel
+        assert first.panel.ip == "10.0.0.1"
+        assert second.panel.ip == "10.0.0.2"
+
+        first.panel.add_events_to_queue([first.panel.generate_event(port_nr=1)])
+        assert len(first.poll_zkteco_changes()) == 1
+        assert second.poll_zkteco_changes() == []
+
+    def test_polling_runs_concurrently(self):
+        active = 0
+        max_active = 0
+        lock = threading.Lock()
+
+        def slow_poll():
+            nonlocal active, max_active
+            with lock:
+                active += 1
+                max_active = max(max_active, active)
+            time.sleep(0.2)
+            with lock:
+                active -= 1
+
+        schedulers = [MagicMock(polling_job=slow_poll) for _ in range(4)]
+        multi_device_scheduler = MultiDeviceScheduler(schedulers, max_workers=4, stagger_seconds=0.01)
+
+        started = time.monotonic()
+        multi_device_scheduler.polling_job()
+        elapsed = time.monotonic() - started
+        multi_device_scheduler.shutdown()
+
+        assert max_active == 4
+        assert elapsed < 0.6
+
+    def test_failing_device_does_not_stop_others(self):
+        healthy = MagicMock()
+        failing = MagicMock()
+        failing.polling_job.side_effect = Exception("boom")
+
+        multi_device_scheduler = MultiDeviceScheduler([failing, healthy], max_workers=2)
+        multi_device_scheduler.polling_job()
+        multi_device_scheduler.shutdown()
+
+        healthy.polling_job.assert_called_once()
+
+    def test_devices_started_late_join_the_polling(self):
+        first = MagicMock()
+        first.polling_job.return_value = 1
+        schedulers = [first]
+        multi_device_scheduler = MultiDeviceScheduler(schedulers, max_workers=4, device_count=2)
+
+        late = MagicMock()
+        late.polling_job.return_value = 2
+        schedulers.append(late)
+        event_count = multi_device_scheduler.polling_job()
+        multi_device_scheduler.shutdown()
+
+        assert multi_device_scheduler.max_workers == 2
+        assert event_count == 3
+        late.polling_job.assert_called_once()
@@ -0,0 +1,114 @@
+import logging
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.state_manager import StateManager
+from mqtt import handler as mqtt_handler
+from mqtt.publisher import MQTTPublisher
+from scheduler import profiling
+from scheduler.jobs import JobScheduler
+from scheduler.profiling import CycleProfiler
+from zkt.handler import ZKTConnection
+
+from tests.mocks.c3 import MockC3
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(50)]
+
+
+class TestCycleProfiler:
+    @pytest.fixture
+    def profiler(self, tmp_path):
+        return CycleProfiler(str(tmp_path / "profiles"))
+
+    def test_idle_profiler_runs_cycles_untraced(self, profiler, tmp_path):
+        assert not profiler.pending
+        assert profiler.run_cycle("panel", lambda: 3) == 3
+        assert not (tmp_path / "profiles").exists()
+
+    def test_profiles_requested_cycles_and_writes_reports(self, profiler, tmp_path):
+        profiler.request(2)
+        assert profiler.pending
+
+        results = [profiler.run_cycle("panel", allocate) for _ in range(3)]
+
+        assert all(len(result) == 50 for result in results)
+        assert not profiler.pending
+        reports = sorted(path.name for path in (tmp_path / "profiles").iterdir())
+        assert len(reports) == 3
+        cpu_report = next((tmp_path / "profiles").glob("*-cpu.txt")).read_text()
+        assert "cycle 2 (panel)" in cpu_report
+        assert "cycle 3" not in cpu_report
+        assert "allocate" in cpu_report
+        memory_report = next((tmp_path / "profiles").glob("*-memory.txt")).read_text()
+        assert "test_profiling.py" in memory_report
+
+    def test_requests_are_capped(self, profiler):
+        profiler.request(10 ** 6)
+
+        assert profiler._requested == profiling.MAX_CYCLES
+
+    def test_failing_cycle_still_counts(self, profiler, tmp_path):
+        profiler.request(1)
+
+        with pytest.raises(RuntimeError):
+            profiler.run_cycle("panel", MagicMock(side_effect=RuntimeError("device gone")))
+
+        assert not profiler.pending
+        assert len(list((tmp_path / "profiles").glob("*.prof"))) == 1
+
+
+class TestPollingCycle:
+    @pytest.fixture
+    def job_scheduler(self, tmp_path):
+        with patch('zkt.handler.C3', side_effect=MockC3):
+            connection = ZKTConnection("10.0.0.77", 4370)
+            connection.ensure_connection()
+        publisher = MQTTPublisher(MagicMock(), "1234567890")
+        state_manager = StateManager(str(tmp_path / "state.json"), flush_interval=60, background_flush=False)
+        return JobScheduler(publisher, state_manager, connection)
+
+    def test_stage_times_are_recorded(self, job_scheduler):
+        job_scheduler.connection.panel.add_events_to_queue([job_scheduler.connection.panel.generate_event()])
+
+        assert job_scheduler.polling_job() == 1
+
+        assert set(job_scheduler.stage_times) == {"device_read", "processing", "state_save", "publish"}
+
+    def test_slow_cycles_are_logged_with_stages(self, job_scheduler, caplog):
+        job_scheduler.connection.panel.add_events_to_queue([job_scheduler.connection.panel.generate_event()])
+        job_scheduler.slow_cycle_seconds = 1e-9
+
+        with caplog.at_level(logging.WARNING, logger="scheduler.jobs"):
+            job_scheduler.polling_job()
+
+        assert "Slow polling cycle on 10.0.0.77:4370" in caplog.text
+        assert "device_read=" in caplog.text and "publish=" in caplog.text
+
+    def test_polling_job_goes_through_a_pending_profiler(self, job_scheduler, tmp_path):
+        cycle_profiler = CycleProfiler(str(tmp_path / "profiles"))
+        cycle_profiler.request(1)
+
+        with patch.object(profiling, "profiler", cycle_profiler):
+            job_scheduler.polling_job()
+
+        assert "(10.0.0.77:4370)" in next((tmp_path / "profiles").glob("*-cpu.txt")).read_text()
+
+
+class TestCommandSubscriptions:
+    def test_messages_are_dispatched_and_resubscribed_on_connect(self):
+        client = MagicMock()
+        client.is_connected.return_value = False
+        handler = MagicMock()
+
+        with patch.dict(mqtt_handler.subscriptions, clear=True):
+            mqtt_handler.add_subscription(client, "zkt_eco/bridge/profile", handler)
+            client.subscribe.assert_not_called()
+            mqtt_handler.on_connect(client, None, None, 0)
+            client.subscribe.assert_called_once_with("zkt_eco/bridge/profile", qos=1)
+
+        on_message = client.message_callback_add.call_args.args[1]
+        on_message(client, None, MagicMock(payload=b"5", topic="zkt_eco/bridge/profile"))
+        handler.assert_called_once_with("5")
@@ -0,0 +1,81 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+import settings
+from benchmarks.workloads import BURST_MIX, FakeMQTTClient, generate_events
+from core.event_processor import process_events
+from mqtt.publisher import MQTTPublisher
+from mqtt.raw_events import RawEventBatcher
+
+
+class TestRawEventBatcher:
+    @pytest.fixture
+    def sent(self):
+        return []
+
+    def test_ndjson_lines_carry_sequence_numbers(self, sent):
+        batcher = RawEventBatcher(sent.append)
+
+        batcher.add([{"door": 1}, {"door": 2}])
+        batcher.add([{"door": 3}])
+
+        assert len(sent) == 2
+        assert [json.loads(line) for line in sent[0].split("\n")] == [{"door": 1, "seq": 1}, {"door": 2, "seq": 2}]
+        assert json.loads(sent[1]) == {"door": 3, "seq": 3}
+
+    def test_json_array_format(self, sent):
+        batcher = RawEventBatcher(sent.append, batch_format="json")
+
+        batcher.add([{"door": 1}, {"door": 2}])
+
+        assert json.loads(sent[0]) == [{"door": 1, "seq": 1}, {"door": 2, "seq": 2}]
+
+    def test_large_polls_are_split_by_max_events(self, sent):
+        batcher = RawEventBatcher(sent.append, max_events=2)
+
+        batcher.add([{"door": n} for n in range(5)])
+
+        assert [len(payload.split("\n")) for payload in sent] == [2, 2, 1]
+
+    def test_window_collects_events_across_polls(self, sent):
+        now = [100.0]
+        batcher = RawEventBatcher(sent.append, max_events=10, window_seconds=5, clock=lambda: now[0])
+
+        batcher.add([{"door": 1}])
+        now[0] += 3
+        batcher.add([{"door": 2}])
+        batcher.flush_if_due()
+        assert sent == []
+
+        now[0] += 2
+        batcher.flush_if_due()
+        assert len(sent) == 1
+        assert len(sent[0].split("\n")) == 2
+
+    def test_full_window_is_sent_early(self, sent):
+        batcher = RawEventBatcher(sent.append, max_events=2, window_seconds=60)
+
+        batcher.add([{"door": 1}, {"door": 2}])
+
+        assert len(sent) == 1
+
+
+class TestBatchedPublisher:
+    @staticmethod
+    def publish_poll(mode: str) -> FakeMQTTClient:
+        client = FakeMQTTClient()
+        with patch.object(settings, 'RAW_EVENT_MODE', mode):
+            publisher = MQTTPublisher(client, "1234567890")
+        publisher.publish_batch([], process_events(generate_events(100, BURST_MIX)))
+        return client
+
+    def test_batch_mode_replaces_per_event_messages(self):
+        per_event = self.publish_poll("event")
+        batched = self.publish_poll("batch")
+        both = self.publish_poll("both")
+
+        # Reader scans are still published per event, the raw event stream collapses to one message
+        assert per_event.messages - batched.messages == 99
+        assert both.messages == per_event.messages + 1
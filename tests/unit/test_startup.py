@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.definition_cache import DefinitionCache
+from core.startup import DefinitionResolver, StartupTimer
+
+
+def make_connection(address, *answers):
+    connection = MagicMock()
+    connection.address = address
+    connection.get_device_definition.side_effect = list(answers)
+    return connection
+
+
+class TestStartupTimer:
+    def test_concurrent_stages_are_timed_against_a_common_start(self):
+        timer = StartupTimer()
+
+        def device_stage():
+            with timer.stage("device definition"):
+                time.sleep(0.1)
+
+        device = threading.Thread(target=device_stage)
+        device.start()
+        with timer.stage("MQTT connection"):
+            time.sleep(0.1)
+        device.join()
+
+        assert set(timer.stages) == {"device definition", "MQTT connection"}
+        assert all(duration >= 0.1 for duration in timer.stages.values())
+        # Both ran at once, so startup took about as long as the slowest stage
+        assert timer.elapsed() < 0.19
+
+    def test_stage_is_recorded_when_it_fails(self):
+        timer = StartupTimer()
+
+        try:
+            with timer.stage("device definition"):
+                raise ConnectionError("panel unreachable")
+        except ConnectionError:
+            pass
+
+        assert "device definition" in timer.stages
+
+
+class TestDefinitionResolver:
+    @pytest.fixture
+    def executor(self):
+        executor = ThreadPoolExecutor(max_workers=2)
+        yield executor
+        executor.shutdown(wait=True)
+
+    def test_unreachable_panel_is_retried_until_it_answers(self, executor, tmp_path, make_device_definition):
+        cache = DefinitionCache(str(tmp_path / "device_definitions.json"))
+        resolver = DefinitionResolver(executor, cache, retry_seconds=0.01)
+        connection = make_connection("10.0.0.1", OSError("rebooting"), OSError("rebooting"), make_device_definition())
+
+        [(_, future)] = resolver.resolve([connection])
+
+        assert future.result(timeout=1).serial_number == "1234567890"
+        assert connection.get_device_definition.call_count == 3
+        assert cache.get("10.0.0.1").serial_number == "1234567890"
+
+    def test_cached_definition_resolves_without_the_panel(self, executor, tmp_path, make_device_definition):
+        cache = DefinitionCache(str(tmp_path / "device_definitions.json"))
+        cache.put("10.0.0.1", make_device_definition())
+        resolver = DefinitionResolver(executor, cache)
+        connection = make_connection("10.0.0.1")
+
+        [(_, future)] = resolver.resolve([connection])
+
+        assert future.done()
+        assert resolver.cached_addresses == {"10.0.0.1"}
+        connection.get_device_definition.assert_not_called()
+
+    def test_stop_ends_the_retries(self, executor):
+        stop = threading.Event()
+        resolver = DefinitionResolver(executor, stop=stop, retry_seconds=60)
+        connection = make_connection("10.0.0.1", OSError("unreachable"))
+
+        [(_, future)] = resolver.resolve([connection])
+        stop.set()
+
+        with pytest.raises(RuntimeError):
+            future.result(timeout=1)
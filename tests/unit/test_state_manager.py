@@ -1,6 +1,7 @@
 import os
 import pytest
 import tempfile
+import time
 from unittest.mock import patch
 from core.state_manager import StateManager
 from core.models import DeviceDefinition
@@ -105,3 +106,59 @@ class TestStateManager:
             state_manager = StateManager("/fake/path")
             state_manager.update_state("test", "value")
             assert state_manager.get_state("test") == "value"
+
+    def test_update_state_reports_changes(self, temp_state_file):
+        state_manager = StateManager(temp_state_file)
+
+        assert state_manager.update_state("door_1", "ON") is True
+        assert state_manager.update_state("door_1", "ON") is False
+        assert state_manager.update_state("door_1", "OFF") is True
+
+    def test_write_behind_coalesces_changes(self, temp_state_file):
+        state_manager = StateManager(temp_state_file, flush_interval=60)
+        with patch.object(state_manager, '_write_atomic', wraps=state_manager._write_atomic) as mock_write:
+            state_manager.update_state("door_1", "ON")
+            state_manager.update_state("door_2", "ON")
+            state_manager.update_state("door_1", "OFF")
+            assert mock_write.call_count == 0
+
+            state_manager.close()
+            assert mock_write.call_count == 1
+
+        new_state_manager = StateManager(temp_state_file)
+        assert new_state_manager.get_state("door_1") == "OFF"
+        assert new_state_manager.get_state("door_2") == "ON"
+
+    def test_background_flusher_writes_dirty_state(self, temp_state_file):
+        state_manager = StateManager(temp_state_file, flush_interval=0.05)
+        state_manager.update_state("door_1", "ON")
+
+        for _ in range(40):
+            if StateManager(temp_state_file).get_state("door_1") == "ON":
+                break
+            time.sleep(0.05)
+        state_manager.close()
+
+        assert StateManager(temp_state_file).get_state("door_1") == "ON"
+
+    def test_external_flush_without_background_thread(self, temp_state_file):
+        state_manager = StateManager(temp_state_file, flush_interval=0.05, background_flush=False)
+        assert state_manager._flusher is None
+
+        state_manager.update_state("door_1", "ON")
+        time.sleep(0.1)
+        assert StateManager(temp_state_file).get_state("door_1") is None
+
+        state_manager.flush()
+        assert StateManager(temp_state_file).get_state("door_1") == "ON"
+
+    def test_failed_write_keeps_previous_state_file(self, temp_state_file):
+        state_manager = StateManager(temp_state_file)
+        state_manager.update_state("door_1", "ON")
+
+        with patch('json.dump', side_effect=RuntimeError("crash mid-write")):
+            state_manager.update_state("door_1", "OFF")
+
+        assert StateManager(temp_state_file).get_state("door_1") == "ON"
+        directory = os.path.dirname(temp_state_file)
+        assert not [name for name in os.listdir(directory) if name.startswith(".state-")]
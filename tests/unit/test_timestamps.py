@@ -0,0 +1,60 @@
+import datetime
+
+import pytest
+import pytz
+
+from core.timestamps import parse_timestamp, to_local_timestamp
+
+
+def legacy_to_local(value: str, zone_name: str) -> datetime.datetime:
+    timestamp_dt = datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.UTC)
+    return timestamp_dt.astimezone(pytz.timezone(zone_name))
+
+def seconds_around(center: datetime.datetime, span: int, step: int):
+    return [(center + datetime.timedelta(seconds=offset)).strftime("%Y-%m-%d %H:%M:%S") for offset in range(-span, span + 1, step)]
+
+
+class TestTimestamps:
+    def test_parse_fast_path_matches_strptime(self):
+        for value in ["2024-02-29 23:59:59", "1999-01-01 00:00:00", "2038-01-19 03:14:07"]:
+            assert parse_timestamp(value) == datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+    def test_parse_falls_back_to_strptime(self):
+        assert parse_timestamp("2024-1-5 1:02:03") == datetime.datetime(2024, 1, 5, 1, 2, 3)
+        assert parse_timestamp("2024-13-05 10:00:00") is None
+        assert parse_timestamp("garbage") is None
+
+    @pytest.mark.parametrize("zone_name,transitions", [
+        # UTC instants of DST transitions
+        ("Europe/Vilnius", [datetime.datetime(2024, 3, 31, 1, 0), datetime.datetime(2024, 10, 27, 1, 0)]),
+        ("America/New_York", [datetime.datetime(2024, 3, 10, 7, 0), datetime.datetime(2024, 11, 3, 6, 0)]),
+        ("Australia/Sydney", [datetime.datetime(2024, 4, 6, 16, 0), datetime.datetime(2024, 10, 5, 16, 0)]),
+        ("UTC", [datetime.datetime(2024, 6, 1, 0, 0)]),
+    ])
+    def test_matches_legacy_conversion_across_dst(self, zone_name, transitions):
+        for transition in transitions:
+            for value in seconds_around(transition, 7200, 599):
+                expected = legacy_to_local(value, zone_name)
+                actual = to_local_timestamp(value, zone_name)
+
+                # Interzone == is always False inside a DST fold (PEP 495), so compare instants instead
+                assert actual.timestamp() == expected.timestamp()
+                assert actual.isoformat() == expected.isoformat()
+                assert actual.utcoffset() == expected.utcoffset()
+
+    def test_accepts_datetime_values(self):
+        value = datetime.datetime(2024, 7, 1, 12, 30, 0)
+
+        assert to_local_timestamp(value, "Europe/Vilnius").isoformat() == "2024-07-01T15:30:00+03:00"
+
+    def test_unknown_zone_keeps_utc(self):
+        result = to_local_timestamp("2024-07-01 12:30:00", "Not/AZone")
+
+        assert result.isoformat() == "2024-07-01T12:30:00+00:00"
+
+    def test_unparseable_timestamp_falls_back_to_now(self):
+        before = datetime.datetime.now().replace(tzinfo=datetime.timezone.utc) - datetime.timedelta(seconds=1)
+
+        result = to_local_timestamp("not a timestamp", "UTC")
+
+        assert result >= before
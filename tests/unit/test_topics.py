@@ -0,0 +1,45 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from core.models import EntityState
+from ha_integration import discovery as ha_discovery
+from mqtt.publisher import MQTTPublisher
+from mqtt.topics import TopicRegistry, build_state_topic
+
+
+class TestTopicRegistry:
+    def test_topics_are_built_once_per_entity(self, make_device_definition):
+        topics = TopicRegistry.from_device_definition(make_device_definition())
+
+        door = topics.get("door_1")
+        assert door.state == build_state_topic("door_1", "1234567890")
+        assert door.attributes == door.state.replace("/state", "/attributes")
+        assert topics.get("door_1") is door
+        assert topics.state_topic("relay_lock_1") is topics.state_topic("relay_lock_1")
+
+    def test_unknown_entities_are_cached_on_first_use(self):
+        topics = TopicRegistry("1234567890")
+
+        assert topics.get("reader_9_card") is topics.get("reader_9_card")
+        assert topics.state_topic("reader_9_card") == build_state_topic("reader_9_card", "1234567890")
+
+    def test_discovery_uses_the_registry_topics(self, make_device_definition):
+        definition = make_device_definition()
+        topics = TopicRegistry.from_device_definition(definition)
+
+        messages = ha_discovery.build_discovery_messages(definition, "zkt_1234567890", mode="entity", topics=topics)
+
+        door_config = json.loads(next(payload for topic, payload in messages.items() if "/door_1/" in topic))
+        assert door_config["state_topic"] == topics.state_topic("door_1")
+        assert door_config["json_attributes_topic"] == topics.attributes_topic("door_1")
+
+    @patch('mqtt.publisher.mqtt_handler.publish_message')
+    def test_constant_states_are_published_as_bytes(self, mock_publish):
+        publisher = MQTTPublisher(MagicMock(), "1234567890")
+
+        publisher.publish_entity_states([
+            EntityState(entity_id="door_1", state="ON"),
+            EntityState(entity_id="reader_1_card", state='{"card_id": "42"}'),
+        ])
+
+        assert [call.args[2] for call in mock_publish.call_args_list] == [b"ON", '{"card_id": "42"}']
@@ -0,0 +1,109 @@
+from unittest.mock import patch
+
+from zkt.handler import ZKTConnection
+
+from tests.mocks.c3 import MockC3
+
+
+class FailingMidDrainC3(MockC3):
+    """Serves a number of realtime log reads, then every read fails, also after a reconnect."""
+    reads_left = 0
+
+    def get_rt_log(self):
+        if FailingMidDrainC3.reads_left <= 0:
+            raise ConnectionError("panel rebooted")
+        FailingMidDrainC3.reads_left -= 1
+        return super().get_rt_log()
+
+
+class TestZKTConnection:
+    @patch('zkt.handler.C3', side_effect=MockC3)
+    def test_drain_reads_backlog_in_one_poll(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.1", 4370)
+        connection.ensure_connection()
+        connection.panel.batch_size = 10
+        connection.panel.add_events_to_queue([connection.panel.generate_event(card_no=i) for i in range(2500)])
+
+        events = connection.poll_zkteco_changes()
+
+        assert len(events) == 2500
+        assert [event.card_no for event in events[:3]] == [0, 1, 2]
+        assert connection.last_poll_stats['iterations'] == 251
+        assert connection.last_poll_stats['batch_sizes'][-1] == 0
+
+    @patch('zkt.handler.settings.POLL_DRAIN_TIME_BUDGET_SECONDS', 0)
+    @patch('zkt.handler.C3', side_effect=MockC3)
+    def test_drain_disabled_reads_single_batch(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.1", 4370)
+        connection.ensure_connection()
+        connection.panel.batch_size = 10
+        connection.panel.add_events_to_queue([connection.panel.generate_event() for _ in range(25)])
+
+        assert len(connection.poll_zkteco_changes()) == 10
+        assert connection.last_poll_stats['iterations'] == 1
+
+    @patch('zkt.handler.settings.POLL_DRAIN_MAX_BATCHES', 3)
+    @patch('zkt.handler.C3', side_effect=MockC3)
+    def test_drain_yields_after_max_batches(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.1", 4370)
+        connection.ensure_connection()
+        connection.panel.batch_size = 10
+        connection.panel.add_events_to_queue([connection.panel.generate_event() for _ in range(100)])
+
+        assert len(connection.poll_zkteco_changes()) == 30
+        assert len(connection.poll_zkteco_changes()) == 30
+
+    @patch('zkt.handler.C3', side_effect=MockC3)
+    def test_polls_do_not_probe_active_session(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.1", 4370)
+        connection.ensure_connection()
+
+        with patch.object(connection.panel, 'get_device_param', wraps=connection.panel.get_device_param) as mock_probe:
+            for _ in range(5):
+                connection.poll_zkteco_changes()
+
+        assert mock_probe.call_count == 0
+        assert mock_c3_class.call_count == 1
+
+    @patch('zkt.handler.C3', side_effect=MockC3)
+    def test_idle_session_is_probed(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.1", 4370)
+        connection.ensure_connection()
+        connection.last_activity -= 10000
+
+        with patch.object(connection.panel, 'get_device_param', wraps=connection.panel.get_device_param) as mock_probe:
+            connection.poll_zkteco_changes()
+
+        assert mock_probe.call_count == 1
+
+    @patch('zkt.handler.C3', side_effect=MockC3)
+    def test_failed_call_reconnects_and_retries_once(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.1", 4370)
+        connection.ensure_connection()
+        broken_panel = connection.panel
+        broken_panel.get_rt_log = lambda: (_ for _ in ()).throw(ConnectionError("session lost"))
+
+        assert connection.poll_zkteco_changes() == []
+        assert connection.panel is not broken_panel
+        assert connection.reconnect_count == 1
+        assert mock_c3_class.call_count == 2
+
+    @patch('zkt.handler.C3', side_effect=FailingMidDrainC3)
+    def test_records_drained_before_a_failure_are_kept(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.1", 4370)
+        connection.ensure_connection()
+        connection.panel.batch_size = 5
+        connection.panel.add_events_to_queue([connection.panel.generate_event(card_no=i) for i in range(20)])
+        FailingMidDrainC3.reads_left = 2
+
+        events = connection.poll_zkteco_changes()
+
+        assert [event.card_no for event in events] == list(range(10))
+        assert connection.last_poll_stats['iterations'] == 2
+
+    @patch('zkt.handler.C3', side_effect=FailingMidDrainC3)
+    def test_failure_before_any_read_fails_the_poll(self, mock_c3_class):
+        connection = ZKTConnection("10.0.0.1", 4370)
+        FailingMidDrainC3.reads_left = 0
+
+        assert connection.poll_zkteco_changes() is None